@@ -3,4 +3,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'evento_qr.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+# Inicializar Django antes de importar consumidores y modelos
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+
+from invitados.routing import websocket_urlpatterns
+
+# HTTP como siempre; /ws/asistencia/ para los avisos en vivo (invitados/en_vivo.py)
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(
+        AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    ),
+})
+
+# Cargar el índice de tokens QR en cada worker al arrancar
+try:
+    from invitados import indice_tokens
+    indice_tokens.calentar()
+except Exception as e:
+    print(f"⚠️ No se pudo precargar el índice de tokens: {e}")
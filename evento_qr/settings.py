@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,7 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    # 'channels', 
+    'channels',
      'corsheaders', 
     'invitados',  # ← Añadir esta línea
 ]
@@ -58,6 +59,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'invitados.roles.RolMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +91,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'evento_qr.wsgi.application'
+ASGI_APPLICATION = 'evento_qr.asgi.application'
 
 
 # Database
@@ -159,6 +162,48 @@ MEDIA_ROOT = BASE_DIR / 'media'
 LANGUAGE_CODE = 'es-mx'
 TIME_ZONE = 'America/Mexico_City'
 
+# Caché compartida entre workers (índice de tokens QR, etc.)
+# Con REDIS_URL se usa Redis; si no, una caché en disco que comparten
+# todos los workers del mismo contenedor.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(tempfile.gettempdir(), 'evento_qr_cache'),
+        }
+    }
+
+# Capa de canales para los avisos en vivo (ver invitados/en_vivo.py)
+# Con REDIS_URL llegan a todos los workers; en memoria sólo dentro del mismo
+# proceso (desarrollo, pruebas o un nodo con WEB_WORKERS=1).
+if os.getenv('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('REDIS_URL')]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# Tokens QR firmados (ver invitados/tokens.py)
+EVENTO_ID = int(os.getenv('EVENTO_ID', '1'))
+QR_SECRET_KEY = os.getenv('QR_SECRET_KEY', SECRET_KEY)
+QR_EMITIDOS_DESDE = int(os.getenv('QR_EMITIDOS_DESDE', '0'))  # epoch; pases anteriores vencidos
+# Desactivar después de ejecutar "python manage.py reemitir_qr"
+QR_ACEPTAR_TOKENS_LEGADOS = os.getenv('QR_ACEPTAR_TOKENS_LEGADOS', 'True') == 'True'
+
 # URLs de autenticación
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -3,6 +3,7 @@ Configuración de Django para producción en Render
 """
 
 import os
+import tempfile
 import dj_database_url
 from pathlib import Path
 
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'corsheaders', 
     'invitados',
 ]
@@ -42,6 +44,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'invitados.roles.RolMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,12 +61,14 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'invitados.context_processors.user_role_context',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'evento_qr.wsgi.application'
+ASGI_APPLICATION = 'evento_qr.asgi.application'
 
 # Database para Render (PostgreSQL)
 DATABASES = {
@@ -158,10 +163,37 @@ LOGGING = {
 }
 
 # Configuración de cache para producción
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,
+# Compartida entre workers de gunicorn: Redis si hay REDIS_URL, si no disco
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'TIMEOUT': 300,
+        }
     }
-}
\ No newline at end of file
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(tempfile.gettempdir(), 'evento_qr_cache'),
+            'TIMEOUT': 300,
+        }
+    }
+
+# Capa de canales para los avisos en vivo (ver invitados/en_vivo.py)
+# Con REDIS_URL llegan a todos los workers; en memoria sólo dentro del mismo
+# proceso (desarrollo, pruebas o un nodo con WEB_WORKERS=1).
+if os.environ.get('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ.get('REDIS_URL')]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
\ No newline at end of file
@@ -3,6 +3,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
+from invitados.views import service_worker
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,10 +14,7 @@ urlpatterns = [
         template_name='pwa/manifest.json', 
         content_type='application/json'
     )),
-    path('sw.js', TemplateView.as_view(
-        template_name='pwa/sw.js', 
-        content_type='application/javascript'
-    )),
+    path('sw.js', service_worker, name='service_worker'),
     path('offline.html', TemplateView.as_view(template_name='pwa/offline.html')),
 ]
 
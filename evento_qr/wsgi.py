@@ -12,4 +12,11 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'evento_qr.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Cargar el índice de tokens QR en cada worker al arrancar
+try:
+    from invitados import indice_tokens
+    indice_tokens.calentar()
+except Exception as e:
+    print(f"⚠️ No se pudo precargar el índice de tokens: {e}")
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Invitado, UserProfile
+from . import busqueda, imagen_qr, indice_tokens, tokens
+from .models import Invitado, UserProfile, EventoEscaneo
 
 @admin.register(Invitado)
 class InvitadoAdmin(admin.ModelAdmin):
@@ -27,6 +28,14 @@ class InvitadoAdmin(admin.ModelAdmin):
         'token_qr'
     ]
     
+    def get_search_results(self, request, queryset, search_term):
+        """Nombre y puesto por el índice de búsqueda sin acentos; el token, exacto"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        resultados = busqueda.filtrar(queryset, search_term) | queryset.filter(token_qr=search_term)
+        return resultados, False
+    
     readonly_fields = [
         'id', 
         'token_qr', 
@@ -89,10 +98,10 @@ class InvitadoAdmin(admin.ModelAdmin):
     mostrar_foto_completa.short_description = "Fotografía actual"
     
     def mostrar_qr_completo(self, obj):
-        if obj.qr_imagen:
+        if obj.token_qr:
             return format_html(
                 '<img src="{}" width="150" height="150" />',
-                obj.qr_imagen.url
+                imagen_qr.url(obj.token_qr, 'svg')
             )
         return "QR no generado"
     mostrar_qr_completo.short_description = "Código QR"
@@ -112,35 +121,38 @@ class InvitadoAdmin(admin.ModelAdmin):
     def marcar_como_asistido(self, request, queryset):
         count = 0
         for invitado in queryset:
-            if invitado.marcar_asistencia("Admin"):
+            if invitado.marcar_asistencia("Admin", usuario=request.user):
                 count += 1
         self.message_user(request, f"{count} invitado(s) marcado(s) como asistido(s).")
     marcar_como_asistido.short_description = "Marcar como asistido"
     
     def marcar_como_no_asistido(self, request, queryset):
-        count = queryset.update(asistio=False, fecha_hora_entrada=None)
+        count = 0
+        for invitado in queryset.filter(asistio=True):
+            if invitado.desmarcar_asistencia("Admin", usuario=request.user):
+                count += 1
         self.message_user(request, f"{count} invitado(s) marcado(s) como no asistido(s).")
     marcar_como_no_asistido.short_description = "Marcar como no asistido"
     
     def regenerar_qr_codes(self, request, queryset):
-        count = 0
-        for invitado in queryset:
-            try:
-                invitado.generar_qr()
-                invitado.save()
-                count += 1
-            except Exception as e:
-                self.message_user(
-                    request, 
-                    f"Error al generar QR para {invitado.nombre_completo}: {e}",
-                    level='ERROR'
-                )
+        # La imagen se dibuja al pedirse (/qr/<token>.png): aquí sólo se firman los
+        # tokens que falten, sin escribir en media. Para exportar los PNG como
+        # archivos, "manage.py generar_qr"
+        sin_token = list(queryset.filter(token_qr='').only('id', 'token_qr'))
+        for invitado in sin_token:
+            invitado.token_qr = tokens.firmar(invitado.id)
+        
+        # Sólo cambia el token: sin save() ni reprocesar la foto
+        Invitado.objects.bulk_update(sin_token, ['token_qr'], batch_size=500)
+        if sin_token:
+            # bulk_update no dispara señales: avisar a los workers del cambio de tokens
+            indice_tokens.invalidar()
         
         self.message_user(
             request, 
-            f"Se generaron {count} código(s) QR correctamente."
+            f"Se emitieron {len(sin_token)} pase(s) QR; los demás ya tenían token."
         )
-    regenerar_qr_codes.short_description = "Regenerar códigos QR"
+    regenerar_qr_codes.short_description = "Emitir códigos QR pendientes"
 
 
     @admin.register(UserProfile)
@@ -152,4 +164,22 @@ class InvitadoAdmin(admin.ModelAdmin):
         def get_readonly_fields(self, request, obj=None):
             if obj:  # Editando
                 return ['user', 'fecha_creacion']
-            return ['fecha_creacion']
\ No newline at end of file
+            return ['fecha_creacion']
+
+
+@admin.register(EventoEscaneo)
+class EventoEscaneoAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'invitado', 'resultado', 'dispositivo', 'usuario']
+    list_filter = ['resultado', 'fecha']
+    search_fields = ['invitado__nombre_completo', 'dispositivo']
+    list_select_related = ['invitado', 'usuario']
+
+    # Bitácora de solo inserción: no se edita ni se borra desde el admin
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class InvitadosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invitados'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,290 @@
+"""
+Motor de registro de entradas.
+
+Cada escaneo se resuelve con un solo UPDATE condicional
+(``WHERE token_qr = %s AND asistio = false``), sin SELECT previo ni
+``select_for_update()``. Postgres vuelve a evaluar la condición cuando dos
+escaneos del mismo pase compiten por la fila, así que sólo uno de ellos
+puede marcar la entrada.
+
+Cada escaneo que llega a la base de datos deja además una fila en
+``EventoEscaneo`` (bitácora de solo inserción) y, si se acepta, suma uno a
+``ContadorAsistencia`` y a ``LlegadasPorMinuto``; todo en la misma sentencia.
+"""
+import uuid
+from datetime import datetime
+
+import pytz
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import contadores, en_vivo, estadisticas, series
+from .models import ContadorAsistencia, EventoEscaneo, Invitado, LlegadasPorMinuto
+
+# Resultados posibles de un escaneo
+ACEPTADO = 'aceptado'
+YA_ESCANEADO = 'ya_escaneado'
+NO_ENCONTRADO = 'no_encontrado'
+
+# En Postgres el UPDATE va dentro de un CTE: la fila original y la
+# actualizada salen en la misma sentencia, lo que permite distinguir
+# "aceptado", "ya escaneado" y "no encontrado" en un solo viaje. La misma
+# sentencia agrega el evento a la bitácora (sólo inserción).
+_SQL_POSTGRES = """
+    WITH actualizado AS (
+        UPDATE {tabla}
+           SET asistio = true, fecha_hora_entrada = %s, escaneado_por = %s
+         WHERE token_qr = %s AND asistio = false
+     RETURNING id, fecha_hora_entrada, escaneado_por
+    ),
+    resultado AS (
+        SELECT i.id, i.nombre_completo, i.puesto_cargo, i.fotografia,
+               COALESCE(a.fecha_hora_entrada, i.fecha_hora_entrada) AS fecha_hora_entrada,
+               a.id IS NOT NULL AS aceptado
+          FROM {tabla} i
+          LEFT JOIN actualizado a ON a.id = i.id
+         WHERE i.token_qr = %s
+    ),
+    registro AS (
+        INSERT INTO {eventos} (invitado_id, resultado, dispositivo, fecha)
+        SELECT id, CASE WHEN aceptado THEN 'aceptado' ELSE 'ya_escaneado' END, %s, %s
+          FROM resultado
+    ),
+    contador AS (
+        UPDATE {contadores}
+           SET asistentes = asistentes + 1
+         WHERE slot = %s AND EXISTS (SELECT 1 FROM actualizado)
+    ),
+    serie AS (
+        INSERT INTO {serie} (minuto, puerta, llegadas)
+        SELECT date_trunc('minute', fecha_hora_entrada), escaneado_por, 1
+          FROM actualizado
+        ON CONFLICT (minuto, puerta) DO UPDATE SET llegadas = {serie}.llegadas + EXCLUDED.llegadas
+    )
+    SELECT id, nombre_completo, puesto_cargo, fotografia, fecha_hora_entrada, aceptado
+      FROM resultado
+"""
+
+# Otros motores (SQLite en desarrollo) no admiten UPDATE dentro de un CTE
+_SQL_UPDATE = """
+    UPDATE {tabla}
+       SET asistio = 1, fecha_hora_entrada = %s, escaneado_por = %s
+     WHERE token_qr = %s AND asistio = 0
+ RETURNING id, nombre_completo, puesto_cargo, fotografia, fecha_hora_entrada
+"""
+
+_SQL_CONSULTA = """
+    SELECT id, nombre_completo, puesto_cargo, fotografia, fecha_hora_entrada
+      FROM {tabla}
+     WHERE token_qr = %s
+"""
+
+
+# Lote de escaneos en una sola sentencia: el primer escaneo (por hora del
+# dispositivo) de cada token dentro del lote es el único candidato a entrar.
+_SQL_LOTE_POSTGRES = """
+    WITH entrada (pos, token_qr, dispositivo, fecha) AS (
+        SELECT * FROM unnest(%s::int[], %s::text[], %s::text[], %s::timestamptz[])
+    ),
+    primero AS (
+        SELECT DISTINCT ON (token_qr) pos, token_qr, dispositivo, fecha
+          FROM entrada
+         ORDER BY token_qr, fecha, pos
+    ),
+    actualizado AS (
+        UPDATE {tabla} i
+           SET asistio = true, fecha_hora_entrada = p.fecha, escaneado_por = p.dispositivo
+          FROM primero p
+         WHERE i.token_qr = p.token_qr AND i.asistio = false
+     RETURNING i.token_qr, i.fecha_hora_entrada, i.escaneado_por
+    ),
+    resultado AS (
+        SELECT e.pos, e.dispositivo, e.fecha, i.id, i.nombre_completo, i.puesto_cargo, i.fotografia,
+               COALESCE(a.fecha_hora_entrada, i.fecha_hora_entrada) AS fecha_hora_entrada,
+               i.id IS NOT NULL AS existe,
+               a.token_qr IS NOT NULL AND p.pos = e.pos AS aceptado
+          FROM entrada e
+          LEFT JOIN {tabla} i ON i.token_qr = e.token_qr
+          LEFT JOIN primero p ON p.token_qr = e.token_qr
+          LEFT JOIN actualizado a ON a.token_qr = e.token_qr
+    ),
+    registro AS (
+        INSERT INTO {eventos} (invitado_id, resultado, dispositivo, fecha)
+        SELECT id, CASE WHEN aceptado THEN 'aceptado' ELSE 'ya_escaneado' END, dispositivo, fecha
+          FROM resultado
+         WHERE existe
+         ORDER BY fecha, pos
+    ),
+    contador AS (
+        UPDATE {contadores}
+           SET asistentes = asistentes + (SELECT count(*) FROM actualizado)
+         WHERE slot = %s AND EXISTS (SELECT 1 FROM actualizado)
+    ),
+    serie AS (
+        INSERT INTO {serie} (minuto, puerta, llegadas)
+        SELECT date_trunc('minute', fecha_hora_entrada), escaneado_por, count(*)
+          FROM actualizado
+         GROUP BY 1, 2
+        ON CONFLICT (minuto, puerta) DO UPDATE SET llegadas = {serie}.llegadas + EXCLUDED.llegadas
+    )
+    SELECT pos, id, nombre_completo, puesto_cargo, fotografia, fecha_hora_entrada, existe, aceptado
+      FROM resultado
+     ORDER BY pos
+"""
+
+
+def _sql(plantilla):
+    return plantilla.format(
+        tabla=connection.ops.quote_name(Invitado._meta.db_table),
+        eventos=connection.ops.quote_name(EventoEscaneo._meta.db_table),
+        contadores=connection.ops.quote_name(ContadorAsistencia._meta.db_table),
+        serie=connection.ops.quote_name(LlegadasPorMinuto._meta.db_table),
+    )
+
+
+def formatear_hora(fecha):
+    """Formatea una fecha de entrada en zona horaria de México"""
+    if not fecha:
+        return "No registrada"
+    if isinstance(fecha, str):
+        # SQLite devuelve texto en consultas crudas
+        fecha = datetime.fromisoformat(fecha)
+    if fecha.tzinfo is None:
+        fecha = pytz.UTC.localize(fecha)
+    mexico_tz = pytz.timezone('America/Mexico_City')
+    return fecha.astimezone(mexico_tz).strftime("%d/%m/%Y %H:%M:%S")
+
+
+def _datos_invitado(fila):
+    nombre, puesto, foto, fecha = fila
+    return {
+        'nombre': nombre,
+        'puesto': puesto,
+        'hora_entrada': formatear_hora(fecha),
+        'foto': default_storage.url(foto) if foto else None,
+    }
+
+
+def _avisar_entrada(invitado_id, invitado, resultado=ACEPTADO):
+    # SQLite devuelve el uuid sin guiones en consultas crudas
+    en_vivo.publicar('entrada', resultado=resultado, invitado={'id': str(uuid.UUID(str(invitado_id))), **invitado})
+
+
+def _releer_fechas(tokens_qr):
+    """``{token_qr: fecha_hora_entrada}`` leídas en una sentencia nueva"""
+    return dict(
+        Invitado.objects.filter(token_qr__in=tokens_qr).values_list('token_qr', 'fecha_hora_entrada')
+    )
+
+
+def registrar_entrada(token_qr, dispositivo="", fecha=None):
+    """
+    Registra la entrada del invitado dueño de ``token_qr``.
+
+    ``fecha`` es la hora de entrada a guardar (por defecto, la actual).
+    Devuelve una tupla ``(estado, invitado)`` donde ``estado`` es ACEPTADO,
+    YA_ESCANEADO o NO_ENCONTRADO e ``invitado`` es un diccionario con los
+    datos que muestra el escáner (``None`` si el token no existe).
+    """
+    ahora = fecha or timezone.now()
+    dispositivo = (dispositivo or "")[:100]
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _sql(_SQL_POSTGRES),
+                [ahora, dispositivo, token_qr, token_qr, dispositivo, ahora,
+                 contadores.slot_aleatorio()]
+            )
+            fila = cursor.fetchone()
+        if fila is None:
+            return NO_ENCONTRADO, None
+        estado = ACEPTADO if fila[5] else YA_ESCANEADO
+        if estado == YA_ESCANEADO and fila[4] is None:
+            # Perdió contra un escaneo concurrente: la fila de "resultado" es la
+            # de antes de que el otro confirmara. Una sentencia nueva ya lo ve
+            fila = (*fila[:4], _releer_fechas([token_qr]).get(token_qr), fila[5])
+        invitado = _datos_invitado(fila[1:5])
+        if estado == ACEPTADO:
+            # El contador ya se ajustó en el mismo SQL: sólo falta la instantánea
+            estadisticas.invalidar()
+            _avisar_entrada(fila[0], invitado)
+        return estado, invitado
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_sql(_SQL_UPDATE), [ahora, dispositivo, token_qr])
+        fila = cursor.fetchone()
+        estado = ACEPTADO
+        if fila is None:
+            cursor.execute(_sql(_SQL_CONSULTA), [token_qr])
+            fila = cursor.fetchone()
+            if fila is None:
+                return NO_ENCONTRADO, None
+            estado = YA_ESCANEADO
+
+        EventoEscaneo.objects.create(
+            invitado_id=fila[0], resultado=estado, dispositivo=dispositivo, fecha=ahora
+        )
+        invitado = _datos_invitado(fila[1:])
+        if estado == ACEPTADO:
+            contadores.ajustar(asistentes=1)
+            series.registrar(ahora, dispositivo)
+            _avisar_entrada(fila[0], invitado)
+    return estado, invitado
+
+
+def registrar_entradas_lote(escaneos):
+    """
+    Registra un lote de escaneos en una sola transacción.
+
+    ``escaneos`` es una lista de diccionarios con ``token_qr``,
+    ``dispositivo`` y ``fecha`` (hora en que se escaneó en el dispositivo).
+    Devuelve una lista de tuplas ``(estado, invitado)`` en el mismo orden.
+    """
+    if not escaneos:
+        return []
+
+    with transaction.atomic():
+        if connection.vendor != 'postgresql':
+            # Sin UPDATE ... FROM unnest(): uno por uno, en orden cronológico
+            orden = sorted(range(len(escaneos)), key=lambda i: escaneos[i]['fecha'])
+            resultados = [None] * len(escaneos)
+            for i in orden:
+                escaneo = escaneos[i]
+                resultados[i] = registrar_entrada(
+                    escaneo['token_qr'], escaneo['dispositivo'], escaneo['fecha']
+                )
+            return resultados
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _sql(_SQL_LOTE_POSTGRES),
+                [
+                    list(range(len(escaneos))),
+                    [e['token_qr'] for e in escaneos],
+                    [(e['dispositivo'] or "")[:100] for e in escaneos],
+                    [e['fecha'] for e in escaneos],
+                    contadores.slot_aleatorio(),
+                ]
+            )
+            filas = cursor.fetchall()
+        if any(fila[-1] for fila in filas):
+            estadisticas.invalidar()
+        # Perdedores contra escaneos concurrentes de otra transacción (ver registrar_entrada)
+        sin_fecha = [escaneos[fila[0]]['token_qr'] for fila in filas if fila[6] and not fila[7] and fila[5] is None]
+        fechas = _releer_fechas(sin_fecha) if sin_fecha else {}
+
+        resultados = []
+        for pos, invitado_id, nombre, puesto, foto, fecha, existe, aceptado in filas:
+            if not existe:
+                resultados.append((NO_ENCONTRADO, None))
+                continue
+            estado = ACEPTADO if aceptado else YA_ESCANEADO
+            if fecha is None:
+                fecha = fechas.get(escaneos[pos]['token_qr'])
+            invitado = _datos_invitado((nombre, puesto, foto, fecha))
+            if aceptado:
+                _avisar_entrada(invitado_id, invitado)
+            resultados.append((estado, invitado))
+    return resultados
@@ -0,0 +1,179 @@
+"""
+Búsqueda de invitados sin acentos y por fragmentos de nombre o puesto.
+
+Cada invitado guarda en ``busqueda_normalizada`` su nombre y puesto en
+minúsculas y sin acentos (``Invitado.save()``), así que "lopez gutierrez"
+encuentra a "María López Gutiérrez". Sobre esa columna:
+
+- Postgres: índice GIN ``gin_trgm_ops`` (``pg_trgm``). Sirve a los ``LIKE``
+  de cada palabra y a ``<%`` / ``word_similarity()``, que toleran errores de
+  tecleo y ordenan por parecido.
+- SQLite: tabla FTS5 con tokenizador ``trigram`` mantenida por triggers y
+  ordenada por ``bm25``. Su rowid sale de ``TABLA_IDS`` (INTEGER PRIMARY
+  KEY -> id del invitado), no del rowid implícito de la tabla de invitados,
+  que ``VACUUM`` puede renumerar. Se (re)crea después de cada ``migrate``
+  porque SQLite reconstruye la tabla de invitados (y pierde los triggers) al
+  alterar sus columnas.
+
+Si ``pg_trgm`` no está instalado se usan los mismos ``LIKE`` sin índice.
+"""
+import unicodedata
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models.expressions import RawSQL
+
+TABLA_FTS = 'invitados_invitado_fts'
+
+# El tokenizador trigram de FTS5 (y los índices de pg_trgm) no sirven para palabras más cortas
+MIN_TRIGRAMA = 3
+
+TABLA_IDS = 'invitados_invitado_fts_ids'
+
+_RESOLVER_ROWID = f"(SELECT rowid FROM {TABLA_IDS} WHERE id = {{fila}}.id)"
+
+_SQL_FTS = [
+    # Se rehace completa: también reemplaza la versión anterior ligada al rowid implícito
+    f"DROP TABLE IF EXISTS {TABLA_FTS}",
+    f"DROP TABLE IF EXISTS {TABLA_IDS}",
+    f"""CREATE TABLE {TABLA_IDS} (
+        rowid INTEGER PRIMARY KEY, id CHAR(32) NOT NULL UNIQUE
+    )""",
+    f"""CREATE VIRTUAL TABLE {TABLA_FTS} USING fts5(
+        busqueda_normalizada, tokenize='trigram'
+    )""",
+    f"DROP TRIGGER IF EXISTS {TABLA_FTS}_ai",
+    f"""CREATE TRIGGER {TABLA_FTS}_ai AFTER INSERT ON {{tabla}} BEGIN
+        INSERT INTO {TABLA_IDS}(id) VALUES (new.id);
+        INSERT INTO {TABLA_FTS}(rowid, busqueda_normalizada)
+        VALUES ({_RESOLVER_ROWID.format(fila='new')}, new.busqueda_normalizada);
+    END""",
+    f"DROP TRIGGER IF EXISTS {TABLA_FTS}_ad",
+    f"""CREATE TRIGGER {TABLA_FTS}_ad AFTER DELETE ON {{tabla}} BEGIN
+        DELETE FROM {TABLA_FTS} WHERE rowid = {_RESOLVER_ROWID.format(fila='old')};
+        DELETE FROM {TABLA_IDS} WHERE id = old.id;
+    END""",
+    f"DROP TRIGGER IF EXISTS {TABLA_FTS}_au",
+    f"""CREATE TRIGGER {TABLA_FTS}_au AFTER UPDATE OF busqueda_normalizada ON {{tabla}} BEGIN
+        UPDATE {TABLA_FTS} SET busqueda_normalizada = new.busqueda_normalizada
+         WHERE rowid = {_RESOLVER_ROWID.format(fila='new')};
+    END""",
+    f"INSERT INTO {TABLA_IDS}(id) SELECT id FROM {{tabla}}",
+    f"""INSERT INTO {TABLA_FTS}(rowid, busqueda_normalizada)
+        SELECT m.rowid, i.busqueda_normalizada FROM {TABLA_IDS} m JOIN {{tabla}} i ON i.id = m.id""",
+]
+
+_trigramas = None
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni espacios repetidos: 'Núñez  LÓPEZ' -> 'nunez lopez'"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.casefold().split())
+
+
+def texto_de(nombre, puesto):
+    """Valor de ``Invitado.busqueda_normalizada``"""
+    return normalizar(f'{nombre} {puesto}')
+
+
+def _tabla():
+    from .models import Invitado
+    return Invitado._meta.db_table
+
+
+def preparar_sqlite(using=DEFAULT_DB_ALIAS):
+    """(Re)crea la tabla FTS5, la de rowids y sus triggers, y las llena"""
+    conexion = connections[using]
+    if conexion.vendor != 'sqlite':
+        return
+    with transaction.atomic(using=using), conexion.cursor() as cursor:
+        for sql in _SQL_FTS:
+            cursor.execute(sql.format(tabla=_tabla()))
+
+
+def _hay_trigramas():
+    """¿Está pg_trgm instalado? (se consulta una vez por proceso)"""
+    global _trigramas
+    if _trigramas is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigramas = cursor.fetchone() is not None
+    return _trigramas
+
+
+def _like(palabra):
+    return '%' + palabra.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _consulta_fts(palabras):
+    # Cada palabra como frase entre comillas: todas deben aparecer (AND implícito)
+    return ' '.join('"{}"'.format(p.replace('"', '""')) for p in palabras)
+
+
+def filtrar(invitados, texto):
+    """
+    Filtra el queryset a los invitados cuyo nombre o puesto contiene todas las
+    palabras de ``texto`` (sin importar acentos ni mayúsculas). No cambia el orden.
+    """
+    palabras = normalizar(texto).split()
+    largas = [p for p in palabras if len(p) >= MIN_TRIGRAMA]
+
+    if connection.vendor == 'sqlite' and largas:
+        invitados = invitados.filter(pk__in=RawSQL(
+            f'SELECT id FROM {TABLA_IDS} WHERE rowid IN '
+            f'(SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s)',
+            [_consulta_fts(largas)],
+        ))
+        palabras = [p for p in palabras if len(p) < MIN_TRIGRAMA]
+
+    # En Postgres cada LIKE usa el índice de trigramas
+    for palabra in palabras:
+        invitados = invitados.filter(busqueda_normalizada__contains=palabra)
+    return invitados
+
+
+def ids_por_relevancia(texto, limite=20):
+    """
+    Ids de los invitados que mejor coinciden con ``texto``, del más parecido
+    al menos parecido. En Postgres (con pg_trgm) también encuentra nombres
+    con errores de tecleo; en SQLite, fragmentos de tres letras o más.
+    """
+    normalizado = normalizar(texto)
+    palabras = normalizado.split()
+    if not palabras:
+        return []
+    largas = [p for p in palabras if len(p) >= MIN_TRIGRAMA]
+    cortas = [p for p in palabras if len(p) < MIN_TRIGRAMA]
+    tabla = _tabla()
+
+    if connection.vendor == 'postgresql' and _hay_trigramas():
+        todas = ' AND '.join(['busqueda_normalizada LIKE %s'] * len(palabras))
+        sql = f"""
+            SELECT id FROM {tabla}
+             WHERE %s <%% busqueda_normalizada OR ({todas})
+             ORDER BY word_similarity(%s, busqueda_normalizada) DESC, nombre_completo, id
+             LIMIT %s
+        """
+        params = [normalizado, *map(_like, palabras), normalizado, limite]
+    elif connection.vendor == 'sqlite' and largas:
+        filtro_cortas = ''.join(f' AND i.busqueda_normalizada LIKE %s ESCAPE \'\\\'' for _ in cortas)
+        sql = f"""
+            SELECT i.id FROM {TABLA_FTS}
+              JOIN {TABLA_IDS} m ON m.rowid = {TABLA_FTS}.rowid
+              JOIN {tabla} i ON i.id = m.id
+             WHERE {TABLA_FTS} MATCH %s{filtro_cortas}
+             ORDER BY {TABLA_FTS}.rank, i.nombre_completo
+             LIMIT %s
+        """
+        params = [_consulta_fts(largas), *map(_like, cortas), limite]
+    else:
+        from .models import Invitado
+        return list(
+            filtrar(Invitado.objects.order_by('nombre_completo', 'id'), texto)
+            .values_list('id', flat=True)[:limite]
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [fila[0] for fila in cursor.fetchall()]
@@ -0,0 +1,20 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .en_vivo import GRUPO
+
+
+class AsistenciaConsumer(AsyncJsonWebsocketConsumer):
+    """WebSocket de avisos en vivo para el escáner y el panel de control"""
+
+    async def connect(self):
+        if not self.scope['user'].is_authenticated:
+            await self.close()
+            return
+        await self.channel_layer.group_add(GRUPO, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(GRUPO, self.channel_name)
+
+    async def asistencia_aviso(self, event):
+        await self.send_json(event['datos'])
@@ -0,0 +1,76 @@
+"""
+Contadores materializados de asistencia (tabla ``ContadorAsistencia``).
+
+Las altas, bajas, entradas y desmarcados ajustan una fila al azar dentro de
+la misma transacción que el cambio; las vistas leen la suma de ``SLOTS`` filas
+en lugar de hacer ``COUNT(*)`` sobre ``Invitado``. ``reconciliar()`` (o el
+comando ``reconciliar_contadores``) recalcula los totales si se desajustan.
+"""
+import random
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F, Sum
+
+from . import estadisticas
+from .models import ContadorAsistencia, Invitado
+
+SLOTS = 16
+
+
+def slot_aleatorio():
+    return random.randrange(SLOTS)
+
+
+def ajustar(invitados=0, asistentes=0):
+    """Suma (o resta) a los totales dentro de la transacción en curso"""
+    if not invitados and not asistentes:
+        return
+    estadisticas.invalidar()
+    actualizados = ContadorAsistencia.objects.filter(slot=slot_aleatorio()).update(
+        invitados=F('invitados') + invitados,
+        asistentes=F('asistentes') + asistentes,
+    )
+    if not actualizados:
+        # Tabla vacía (base nueva o vaciada): recalcular desde cero ya incluye este cambio
+        transaction.on_commit(reconciliar)
+
+
+def leer():
+    """Devuelve ``(total_invitados, total_asistentes)``"""
+    totales = ContadorAsistencia.objects.aggregate(
+        invitados=Sum('invitados'), asistentes=Sum('asistentes')
+    )
+    if totales['invitados'] is None:
+        return reconciliar()
+    return totales['invitados'], totales['asistentes']
+
+
+async def aleer():
+    """Versión async de leer()"""
+    totales = await ContadorAsistencia.objects.aaggregate(
+        invitados=Sum('invitados'), asistentes=Sum('asistentes')
+    )
+    if totales['invitados'] is None:
+        return await sync_to_async(reconciliar)()
+    return totales['invitados'], totales['asistentes']
+
+
+def reconciliar():
+    """Recalcula los totales desde ``Invitado`` y devuelve ``(invitados, asistentes)``"""
+    with transaction.atomic():
+        # Bloquear las filas existentes para que ningún ajuste se pierda a medias
+        list(ContadorAsistencia.objects.select_for_update().values_list('slot', flat=True))
+        total_invitados = Invitado.objects.count()
+        total_asistentes = Invitado.objects.filter(asistio=True).count()
+
+        ContadorAsistencia.objects.bulk_create(
+            [ContadorAsistencia(slot=slot) for slot in range(SLOTS)],
+            ignore_conflicts=True
+        )
+        ContadorAsistencia.objects.exclude(slot=0).update(invitados=0, asistentes=0)
+        ContadorAsistencia.objects.filter(slot=0).update(
+            invitados=total_invitados, asistentes=total_asistentes
+        )
+    estadisticas.invalidar()
+    return total_invitados, total_asistentes
@@ -0,0 +1,3 @@
+def user_role_context(request):
+    """Expone el rol del usuario (``request.user_role``, ver roles.py) a las plantillas"""
+    return {'user_role': getattr(request, 'user_role', None)}
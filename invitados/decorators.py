@@ -2,7 +2,7 @@ from functools import wraps
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .models import UserProfile
+from .roles import obtener_rol
 
 def role_required(*allowed_roles):
     """
@@ -13,17 +13,8 @@ def role_required(*allowed_roles):
         @wraps(view_func)
         @login_required
         def _wrapped_view(request, *args, **kwargs):
-            try:
-                # Intentar obtener el perfil del usuario
-                user_profile = UserProfile.objects.get(user=request.user)
-                user_role = user_profile.rol
-            except UserProfile.DoesNotExist:
-                # Si no tiene perfil, crear uno con rol por defecto
-                user_profile = UserProfile.objects.create(
-                    user=request.user,
-                    rol='registro'  # rol por defecto
-                )
-                user_role = 'registro'
+            # Resuelto una vez por usuario y guardado en caché (ver roles.py)
+            user_role = getattr(request, 'user_role', None) or obtener_rol(request.user)
             
             # Verificar si el usuario tiene un rol permitido
             if user_role in allowed_roles:
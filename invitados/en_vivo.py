@@ -0,0 +1,45 @@
+"""
+Avisos en vivo de asistencia por WebSocket (Django Channels).
+
+Los clientes de ``/ws/asistencia/`` (escáner y panel de control) se unen al
+grupo ``GRUPO`` y reciben un JSON por cada cambio:
+
+- ``{"tipo": "entrada", "resultado": ..., "invitado": {...}}`` al registrar
+  una entrada (escaneo o manual),
+- ``{"tipo": "desmarcado", "invitado": {"id": ...}}`` al quitar una asistencia,
+- ``{"tipo": "estadisticas", "version": ...}`` cuando cambian los totales; el
+  cliente vuelve a pedir ``/estadisticas/`` con su ETag.
+
+Con ``REDIS_URL`` la capa de canales es Redis y los avisos llegan a todos los
+workers; sin ella se usa la capa en memoria (un solo proceso: desarrollo,
+pruebas o un nodo con un worker).
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+GRUPO = 'asistencia'
+
+logger = logging.getLogger(__name__)
+
+
+def enviar(tipo, **datos):
+    """Envía un aviso inmediatamente a los clientes conectados"""
+    capa = get_channel_layer()
+    if capa is None:
+        return
+    try:
+        async_to_sync(capa.group_send)(GRUPO, {
+            'type': 'asistencia.aviso',
+            'datos': {'tipo': tipo, **datos},
+        })
+    except Exception:
+        # Un aviso perdido no debe tumbar un registro: los clientes también sondean
+        logger.warning("No se pudo enviar el aviso en vivo '%s'", tipo, exc_info=True)
+
+
+def publicar(tipo, **datos):
+    """Envía el aviso cuando se confirma la transacción en curso"""
+    transaction.on_commit(lambda: enviar(tipo, **datos))
@@ -0,0 +1,118 @@
+"""
+Instantánea compartida de ``/estadisticas/`` con número de versión.
+
+Los escáneres consultan las estadísticas cada pocos segundos. En lugar de
+reconstruir el JSON en cada consulta, se guarda en la caché compartida junto
+con la versión con la que se construyó. Cualquier cambio de asistencia llama a
+``invalidar()``, que al confirmar la transacción publica una versión nueva; la
+siguiente consulta reconstruye la instantánea y las demás la reutilizan.
+
+La versión también es el ETag: una consulta con ``If-None-Match`` vigente sólo
+cuesta una lectura de la caché y recibe un 304 vacío.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+CLAVE_VERSION = 'invitados:estadisticas:version'
+CLAVE_INSTANTANEA = 'invitados:estadisticas:instantanea'
+
+
+def _nueva_version():
+    # Microsegundos: creciente, distinta entre workers y exacta como número en JavaScript
+    return time.time_ns() // 1000
+
+
+def version():
+    """Versión vigente de las estadísticas"""
+    actual = cache.get(CLAVE_VERSION)
+    if actual is None:
+        cache.add(CLAVE_VERSION, _nueva_version(), None)
+        actual = cache.get(CLAVE_VERSION)
+    return actual
+
+
+async def aversion():
+    """Versión async de version()"""
+    actual = await cache.aget(CLAVE_VERSION)
+    if actual is None:
+        return await sync_to_async(version)()
+    return actual
+
+
+def etag(numero):
+    return f'"est-{numero}"'
+
+
+def invalidar():
+    """Publica una versión nueva cuando se confirma la transacción en curso"""
+    def _publicar():
+        from . import en_vivo
+
+        numero = _nueva_version()
+        cache.set(CLAVE_VERSION, numero, None)
+        en_vivo.enviar('estadisticas', version=numero)
+
+    transaction.on_commit(_publicar)
+
+
+def _construir():
+    from . import contadores, lecturas
+    from .asistencia import formatear_hora
+
+    total_invitados, total_asistentes = contadores.leer()
+    porcentaje_asistencia = (total_asistentes / total_invitados * 100) if total_invitados > 0 else 0
+
+    # Últimas 5 llegadas
+    ultimas_llegadas = lecturas.ultimas_llegadas(5)
+
+    llegadas_data = []
+    for invitado in ultimas_llegadas:
+        llegadas_data.append({
+            'nombre': invitado.nombre_completo,
+            'puesto': invitado.puesto_cargo,
+            'hora': formatear_hora(invitado.fecha_hora_entrada),
+            'foto': invitado.fotografia.url if invitado.fotografia else None
+        })
+
+    return {
+        'total_invitados': total_invitados,
+        'total_asistentes': total_asistentes,
+        'porcentaje_asistencia': round(porcentaje_asistencia, 1),
+        'ultimas_llegadas': llegadas_data
+    }
+
+
+def instantanea(numero=None):
+    """
+    Devuelve el JSON de estadísticas (con su ``version``).
+
+    Si la caché tiene la instantánea de la versión vigente se reutiliza; si no,
+    se reconstruye. La versión se lee antes de consultar la base de datos, de
+    modo que un cambio a mitad de la construcción deja la instantánea marcada
+    como vieja y la siguiente consulta la rehace.
+    """
+    if numero is None:
+        numero = version()
+
+    guardada = cache.get(CLAVE_INSTANTANEA)
+    if guardada is not None and guardada['version'] == numero:
+        return guardada
+
+    datos = _construir()
+    datos['version'] = numero
+    cache.set(CLAVE_INSTANTANEA, datos, None)
+    return datos
+
+
+async def ainstantanea(numero=None):
+    """Versión async de instantanea(): el acierto no sale del event loop"""
+    if numero is None:
+        numero = await aversion()
+
+    guardada = await cache.aget(CLAVE_INSTANTANEA)
+    if guardada is not None and guardada['version'] == numero:
+        return guardada
+    return await sync_to_async(instantanea)(numero)
@@ -0,0 +1,321 @@
+"""
+Dibujo de los códigos QR de los pases.
+
+El logo del centro se prepara una sola vez por proceso:
+``static/images/logo-qr.png`` es grande (5500x4250): abrirlo, reducirlo con
+LANCZOS y armar el fondo circular cuesta mucho más que el QR mismo. El
+mosaico ya compuesto (círculo blanco + logo, RGBA) se guarda en memoria por
+``(ruta, mtime, lado del QR)``; si el archivo del logo cambia, cambia su
+mtime y se vuelve a preparar. Generar un QR queda en un solo ``paste()``.
+
+El PNG de cada pase no se dibuja al guardar el invitado. Las páginas enlazan
+``url(token)``, es decir ``/qr/<token>.png?v=<version()>`` (o ``.svg``), que
+``views.qr_imagen`` dibuja a partir del token con ``imagen()``: los bytes
+quedan en un LRU acotado por proceso. Como la versión del estilo va en la
+URL, esa respuesta es inmutable para el navegador, el service worker y
+cualquier proxy; si cambia el logo, cambian las URLs. Sin ``v`` (o con una
+versión vieja) la respuesta se revalida con el ETag en cada uso.
+
+Nada de eso escribe en media. La única excepción es ``manage.py generar_qr``,
+una exportación explícita para quien necesite los PNG como archivos (el
+admin y ``reemitir_qr`` sólo firman tokens). El nombre del archivo sale del
+token y del estilo (tamaños y huella del logo), así que un mismo pase no se
+escribe dos veces; cambiar el logo produce nombres nuevos en lugar de pisar
+los anteriores, y los viejos quedan en media hasta exportar con
+``--borrar-anteriores``.
+
+El PNG se guarda con paleta: blanco, negro y los colores del logo reducidos
+a ``COLORES_LOGO`` (4 bits por pixel, o 1 bit si no hay logo), con el módulo
+más chico que cumple ``LADO_MINIMO_PNG``. El SVG y el PDF son vectoriales y
+conservan la geometría de referencia (``TAMANO_MODULO``).
+"""
+import base64
+import functools
+import hashlib
+import os
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageDraw
+
+# El logo ocupa el 20% del lado del QR, con 5 px de margen blanco alrededor
+PROPORCION_LOGO = 0.2
+MARGEN_LOGO = 10
+
+TAMANO_MODULO = 10
+BORDE = 4
+# Subir si cambia el dibujo de una forma que los valores de arriba no reflejan
+VERSION_ESTILO = 2
+
+# PNG: el lado más chico que se sigue leyendo bien en pantalla, sin bajar de
+# 4 px por módulo (con el token firmado sale a 6 px por módulo, 246 px)
+LADO_MINIMO_PNG = 240
+MODULO_MINIMO_PNG = 4
+# Más blanco y negro: paleta de 16 colores
+COLORES_LOGO = 14
+
+CARPETA = 'qr_codes'
+
+# Pases dibujados que se guardan en memoria por proceso (1-2 KB por PNG, 10 KB por SVG)
+CAPACIDAD_CACHE = 1024
+
+TIPOS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+def _rutas_posibles():
+    rutas = [os.path.join(settings.BASE_DIR, 'static', 'images', 'logo-qr.png')]
+    if settings.STATICFILES_DIRS:
+        rutas.append(os.path.join(settings.STATICFILES_DIRS[0], 'images', 'logo-qr.png'))
+    return rutas
+
+
+def ruta_logo():
+    """Ruta del logo, o None si no está en ninguna de las ubicaciones conocidas"""
+    for ruta in _rutas_posibles():
+        if os.path.exists(ruta):
+            return ruta
+    return None
+
+
+@functools.lru_cache(maxsize=8)
+def _preparar(ruta, mtime_ns, lado):
+    """Mosaico RGBA: fondo circular blanco con el logo encima (mtime_ns sólo forma parte de la llave)"""
+    logo_size = int(lado * PROPORCION_LOGO)
+    logo = Image.open(ruta).resize((logo_size, logo_size), Image.Resampling.LANCZOS)
+    if logo.mode != 'RGBA':
+        logo = logo.convert('RGBA')
+
+    background_size = logo_size + MARGEN_LOGO
+    mosaico = Image.new('RGBA', (background_size, background_size), (255, 255, 255, 255))
+    mascara = Image.new('L', (background_size, background_size), 0)
+    ImageDraw.Draw(mascara).ellipse((0, 0, background_size, background_size), fill=255)
+    mosaico.putalpha(mascara)
+
+    posicion = ((background_size - logo_size) // 2, (background_size - logo_size) // 2)
+    mosaico.alpha_composite(logo, posicion)
+    return mosaico
+
+
+def logo_superpuesto(lado, usar_cache=True):
+    """Mosaico del logo para un QR de ``lado`` px (None si no hay logo)"""
+    ruta = ruta_logo()
+    if ruta is None:
+        return None
+    preparar = _preparar if usar_cache else _preparar.__wrapped__
+    return preparar(ruta, os.stat(ruta).st_mtime_ns, lado)
+
+
+def agregar_logo(qr_img, usar_cache=True):
+    """Pega el logo en el centro de ``qr_img`` (RGB). Devuelve False si no hay logo."""
+    ancho, alto = qr_img.size
+    mosaico = logo_superpuesto(min(ancho, alto), usar_cache)
+    if mosaico is None:
+        return False
+    posicion = ((ancho - mosaico.width) // 2, (alto - mosaico.height) // 2)
+    qr_img.paste(mosaico, posicion, mosaico)
+    return True
+
+
+def _codigo(token):
+    # Máxima corrección de errores: el logo tapa parte de los módulos
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=TAMANO_MODULO,
+        border=BORDE,
+    )
+    qr.add_data(token)
+    qr.make(fit=True)
+    return qr
+
+
+def tamano_modulo_png(modulos):
+    """Pixeles por módulo del PNG para un QR de ``modulos`` de lado (borde incluido)"""
+    return max(MODULO_MINIMO_PNG, -(-LADO_MINIMO_PNG // modulos))
+
+
+def qr_base(token, tamano_modulo=None):
+    """QR en blanco y negro (RGB) del token, sin logo (por defecto, al tamaño del PNG)"""
+    qr = _codigo(token)
+    qr.box_size = tamano_modulo or tamano_modulo_png(qr.modules_count + 2 * BORDE)
+    return qr.make_image(fill_color="black", back_color="white").convert('RGB')
+
+
+@functools.lru_cache(maxsize=8)
+def _paleta(ruta, mtime_ns, lado):
+    mosaico = _preparar(ruta, mtime_ns, lado)
+    sobre_blanco = Image.new('RGB', mosaico.size, (255, 255, 255))
+    sobre_blanco.paste(mosaico, (0, 0), mosaico)
+    logo = sobre_blanco.quantize(COLORES_LOGO, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+
+    # Negro y blanco exactos primero. Los tonos del logo casi blancos o casi
+    # negros se descartan: Pillow podría mandar ahí los módulos del QR
+    colores = [(0, 0, 0), (255, 255, 255)]
+    valores = logo.getpalette()[:COLORES_LOGO * 3]
+    for color in zip(valores[0::3], valores[1::3], valores[2::3]):
+        if all(max(abs(a - b) for a, b in zip(color, otro)) > 24 for otro in colores):
+            colores.append(color)
+
+    paleta = Image.new('P', (1, 1))
+    paleta.putpalette([canal for color in colores for canal in color])
+    return paleta
+
+
+def paleta(lado):
+    """Imagen 'P' con la paleta de un QR de ``lado`` px con logo (None si no hay logo)"""
+    ruta = ruta_logo()
+    if ruta is None:
+        return None
+    return _paleta(ruta, os.stat(ruta).st_mtime_ns, lado)
+
+
+def codificar_png(qr_img, paleta_logo=None):
+    """PNG con paleta (4 bits) si hay logo, o de 1 bit si no; con ``optimize``"""
+    if paleta_logo is None:
+        compacta = qr_img.convert('1', dither=Image.Dither.NONE)
+    else:
+        compacta = qr_img.convert('RGB').quantize(palette=paleta_logo, dither=Image.Dither.NONE)
+    buffer = BytesIO()
+    compacta.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def renderizar_png(token):
+    """PNG del pase con logo; devuelve ``(bytes, logo_agregado)``"""
+    qr_img = qr_base(token)
+    try:
+        logo_agregado = agregar_logo(qr_img)
+    except Exception as e:
+        print(f"❌ Error al agregar logo al QR: {e}")
+        logo_agregado = False
+
+    return codificar_png(qr_img, paleta(qr_img.width) if logo_agregado else None), logo_agregado
+
+
+def tramos(token):
+    """
+    Módulos negros del QR como ``(modulos, [(x, y, ancho), ...])``: cada tramo
+    horizontal es un rectángulo de alto 1, en unidades de módulo desde la
+    esquina superior izquierda (el borde blanco incluido en ``modulos``).
+    """
+    matriz = _codigo(token).get_matrix()
+    modulos = len(matriz)
+    resultado = []
+    for y, fila in enumerate(matriz):
+        x = 0
+        while x < modulos:
+            if not fila[x]:
+                x += 1
+                continue
+            inicio = x
+            while x < modulos and fila[x]:
+                x += 1
+            resultado.append((inicio, y, x - inicio))
+    return modulos, resultado
+
+
+def caja_logo(modulos):
+    """
+    ``(posicion, lado)`` del mosaico del logo en unidades de módulo, como en
+    un PNG de ``TAMANO_MODULO`` px por módulo (el mosaico es
+    ``logo_superpuesto(modulos * TAMANO_MODULO)``); None si no hay logo
+    """
+    lado_px = modulos * TAMANO_MODULO
+    mosaico = logo_superpuesto(lado_px)
+    if mosaico is None:
+        return None
+    return (lado_px - mosaico.width) // 2 / TAMANO_MODULO, mosaico.width / TAMANO_MODULO
+
+
+@functools.lru_cache(maxsize=8)
+def _logo_data_uri(ruta, mtime_ns, lado):
+    buffer = BytesIO()
+    _preparar(ruta, mtime_ns, lado).save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def renderizar_svg(token):
+    """SVG del pase: un solo ``path`` con los módulos negros y el logo encima"""
+    modulos, rectangulos = tramos(token)
+    trazos = ''.join(f'M{x} {y}h{ancho}v1h-{ancho}z' for x, y, ancho in rectangulos)
+
+    logo = ''
+    caja = caja_logo(modulos)
+    if caja is not None:
+        # El mosaico se codifica una vez por proceso y se repite en cada SVG
+        posicion, lado = caja
+        ruta = ruta_logo()
+        logo = (
+            f'<image x="{posicion:g}" y="{posicion:g}" width="{lado:g}" height="{lado:g}" '
+            f'href="{_logo_data_uri(ruta, os.stat(ruta).st_mtime_ns, modulos * TAMANO_MODULO)}"/>'
+        )
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {modulos} {modulos}" '
+        f'width="{modulos * TAMANO_MODULO}" height="{modulos * TAMANO_MODULO}" shape-rendering="crispEdges">'
+        f'<rect width="{modulos}" height="{modulos}" fill="#fff"/>'
+        f'<path d="{trazos}" fill="#000"/>{logo}</svg>'
+    ).encode()
+
+
+@functools.lru_cache(maxsize=CAPACIDAD_CACHE)
+def _imagen(token, estilo_actual, formato):
+    # estilo_actual sólo forma parte de la llave: si cambia el logo no se sirve el dibujo anterior
+    if formato == 'svg':
+        return renderizar_svg(token)
+    return renderizar_png(token)[0]
+
+
+def imagen(token, formato='png'):
+    """Bytes del pase en ``formato`` ('png' o 'svg'), desde el LRU del proceso si ya se dibujó"""
+    return _imagen(token, estilo(), formato)
+
+
+def etag(token, formato='png'):
+    """ETag fuerte del pase: sólo depende del token, del estilo y del formato"""
+    return '"qr-{}"'.format(hashlib.sha256(f'{token}|{estilo()}|{formato}'.encode()).hexdigest()[:32])
+
+
+@functools.lru_cache(maxsize=4)
+def _huella_logo(ruta, mtime_ns):
+    with open(ruta, 'rb') as archivo:
+        return hashlib.sha256(archivo.read()).hexdigest()[:16]
+
+
+def estilo():
+    """Huella de todo lo que, además del token, cambia el dibujo"""
+    ruta = ruta_logo()
+    logo = _huella_logo(ruta, os.stat(ruta).st_mtime_ns) if ruta else 'sin-logo'
+    return f'v{VERSION_ESTILO}-{TAMANO_MODULO}-{LADO_MINIMO_PNG}-{BORDE}-{PROPORCION_LOGO}-{logo}'
+
+
+def version():
+    """Versión corta del estilo para las URLs de los pases"""
+    return hashlib.sha256(estilo().encode()).hexdigest()[:12]
+
+
+def url(token, formato='png'):
+    """URL del pase con la versión del estilo: se puede guardar en caché para siempre"""
+    return f"{reverse('qr_' + formato, args=[token])}?v={version()}"
+
+
+def nombre_archivo(token):
+    """Nombre del PNG del pase dentro del storage, derivado del token y del estilo"""
+    clave = hashlib.sha256(f'{token}|{estilo()}'.encode()).hexdigest()[:32]
+    return f'{CARPETA}/{clave}.png'
+
+
+def asegurar_png(token):
+    """Dibuja y guarda en media el PNG del pase si todavía no existe (sólo para exportar); devuelve su nombre"""
+    nombre = nombre_archivo(token)
+    if not default_storage.exists(nombre):
+        contenido, _ = renderizar_png(token)
+        guardado = default_storage.save(nombre, ContentFile(contenido))
+        if guardado != nombre:
+            # Otro proceso lo escribió mientras tanto: el contenido es el mismo
+            default_storage.delete(guardado)
+    return nombre
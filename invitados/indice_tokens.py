@@ -0,0 +1,141 @@
+"""
+Índice en memoria token_qr -> id de invitado.
+
+Cada worker de gunicorn carga el índice al arrancar (ver ``evento_qr/wsgi.py``)
+y lo usa para rechazar tokens desconocidos sin consultar la base de datos.
+Para mantenerlo al día entre workers se guarda una marca de versión (un
+contador) en la caché compartida. Un token nuevo o cambiado actualiza la
+entrada del worker que lo guardó y sube la marca; los demás recargan su
+índice sólo cuando un token les falla y la marca ya no es la suya. Las
+ediciones que no tocan el token no cambian nada, y un token borrado que
+siga en memoria lo rechaza después el UPDATE (ya no está en la tabla).
+"""
+import random
+import threading
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+CLAVE_VERSION = 'invitados:indice_tokens:contador'
+
+_lock = threading.Lock()
+_indice = {}
+_version = None
+
+
+def _version_compartida():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Primera vez (o caché vaciada): una marca inicial al azar, para que no
+        # coincida con la que un worker guardó antes de vaciarse la caché
+        cache.add(CLAVE_VERSION, random.randrange(1 << 40), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _subir_version():
+    """Sube la marca compartida y devuelve ``(anterior, nueva)``"""
+    try:
+        nueva = cache.incr(CLAVE_VERSION)
+    except ValueError:
+        # La clave no existía (caché vaciada)
+        _version_compartida()
+        nueva = cache.incr(CLAVE_VERSION)
+    return nueva - 1, nueva
+
+
+def calentar():
+    """Carga (o recarga) el índice completo desde la base de datos"""
+    global _indice, _version
+    from .models import Invitado
+
+    with _lock:
+        version = _version_compartida()
+        _indice = {
+            token: str(invitado_id)
+            for token, invitado_id in Invitado.objects.values_list('token_qr', 'id')
+        }
+        _version = version
+    return len(_indice)
+
+
+def buscar(token_qr):
+    """
+    Devuelve el id del invitado dueño de ``token_qr`` o ``None``.
+
+    Un acierto se responde desde memoria. Un fallo sólo cuesta una lectura de
+    la marca de versión: si otro worker modificó la lista de invitados, el
+    índice se recarga antes de dar el token por desconocido.
+    """
+    if _version is None:
+        calentar()
+
+    invitado_id = _indice.get(token_qr)
+    if invitado_id is not None:
+        return invitado_id
+
+    if _version_compartida() != _version:
+        calentar()
+        return _indice.get(token_qr)
+    return None
+
+
+async def abuscar(token_qr):
+    """Versión async de buscar(): los aciertos no salen del event loop"""
+    if _version is not None:
+        invitado_id = _indice.get(token_qr)
+        if invitado_id is not None:
+            return invitado_id
+    return await sync_to_async(buscar)(token_qr)
+
+
+def actualizar(token_qr, invitado_id):
+    """
+    Agrega (o corrige) una entrada al confirmar la transacción en curso.
+
+    Este worker no recarga: si su índice estaba al día con la marca anterior,
+    pasa a estarlo con la nueva. Si otro worker subió la marca entre tanto, el
+    índice se recarga completo en la siguiente búsqueda.
+    """
+    def _publicar():
+        global _version
+        with _lock:
+            anterior, nueva = _subir_version()
+            if _version is not None and _version == anterior:
+                _indice[token_qr] = str(invitado_id)
+                _version = nueva
+            else:
+                _version = None
+
+    transaction.on_commit(_publicar)
+
+
+def quitar(token_qr):
+    """Olvida una entrada de este worker (invitado borrado); no cambia la marca"""
+    def _publicar():
+        with _lock:
+            _indice.pop(token_qr, None)
+
+    transaction.on_commit(_publicar)
+
+
+def contiene(token_qr, invitado_id):
+    """Si el índice de este worker (cargado) ya tiene ``token_qr`` para ese invitado"""
+    return _version is not None and _indice.get(token_qr) == str(invitado_id)
+
+
+def invalidar():
+    """
+    Cambia la marca de versión cuando se confirma la transacción en curso.
+
+    Para cambios masivos (reemitir o importar pases): todos los workers
+    recargan el índice completo.
+    """
+    def _publicar():
+        global _version
+        _subir_version()
+        # Este worker recarga en la siguiente búsqueda, acierto o no
+        _version = None
+
+    transaction.on_commit(_publicar)
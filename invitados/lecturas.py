@@ -0,0 +1,45 @@
+"""
+Consultas de sólo lectura de las vistas.
+
+Cada función trae únicamente las columnas que muestra su plantilla o JSON y
+aplica el límite en SQL; los totales salen de ``contadores``, no de un
+``count()`` sobre estos querysets. Siguen siendo perezosos, así que una
+plantilla que no los recorre no consulta nada.
+"""
+from .models import EventoEscaneo, Invitado
+
+# Foto, nombre y puesto: lo que muestra cada tarjeta de invitado
+CAMPOS_TARJETA = ('id', 'nombre_completo', 'puesto_cargo', 'fotografia')
+
+CAMPOS_EXPORTAR = (
+    'nombre_completo', 'puesto_cargo', 'asistio', 'fecha_hora_entrada', 'escaneado_por', 'token_qr',
+)
+
+
+def ultimas_llegadas(limite):
+    """Los ``limite`` invitados que llegaron más recientemente"""
+    return Invitado.objects.filter(asistio=True).order_by('-fecha_hora_entrada').only(
+        *CAMPOS_TARJETA, 'fecha_hora_entrada'
+    )[:limite]
+
+
+def pendientes(limite):
+    """Los primeros ``limite`` invitados por llegar, por nombre"""
+    return Invitado.objects.filter(asistio=False).order_by('nombre_completo').only(*CAMPOS_TARJETA)[:limite]
+
+
+def registrados_recientes(limite):
+    """Los ``limite`` invitados registrados más recientemente"""
+    return Invitado.objects.order_by('-fecha_creacion').only(*CAMPOS_TARJETA, 'token_qr')[:limite]
+
+
+def eventos(resultados):
+    """Eventos de la bitácora con los datos del invitado que muestra el feed de llegadas"""
+    return EventoEscaneo.objects.filter(resultado__in=resultados).select_related('invitado').only(
+        'id', 'resultado', 'dispositivo', 'fecha', 'invitado', *(f'invitado__{campo}' for campo in CAMPOS_TARJETA)
+    )
+
+
+def para_exportar():
+    """Todos los invitados por nombre, en bloques, para la exportación CSV"""
+    return Invitado.objects.order_by('nombre_completo').only(*CAMPOS_EXPORTAR).iterator(chunk_size=2000)
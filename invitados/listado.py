@@ -0,0 +1,113 @@
+"""
+Lista de invitados paginada por llave (keyset) sobre ``(nombre_completo, id)``.
+
+Cada página se pide con el cursor de la anterior (``despues``), así que pedir
+la página 40 cuesta lo mismo que la primera: un recorrido del índice a partir
+del último nombre visto, sin ``OFFSET``. Los filtros (asistieron, pendientes y
+búsqueda sin acentos, ver ``busqueda.py``) se aplican en el servidor.
+"""
+import base64
+import json
+import uuid
+
+from django.db.models import Q
+
+from . import busqueda, imagen_qr
+from .models import Invitado
+
+TAM_PAGINA = 50
+MAX_TAM_PAGINA = 200
+
+FILTROS = {
+    'todos': Q(),
+    'asistieron': Q(asistio=True),
+    'no-asistieron': Q(asistio=False),
+}
+
+# Sólo las columnas que se muestran en la lista
+_CAMPOS = (
+    'id', 'nombre_completo', 'puesto_cargo', 'fotografia', 'token_qr',
+    'asistio', 'fecha_hora_entrada',
+)
+
+
+class CursorNoValido(ValueError):
+    pass
+
+
+def codificar_cursor(invitado):
+    datos = json.dumps([invitado.nombre_completo, str(invitado.id)]).encode()
+    return base64.urlsafe_b64encode(datos).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        nombre, invitado_id = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(nombre, str):
+            raise TypeError('nombre no es texto')
+        return nombre, uuid.UUID(invitado_id)
+    except (TypeError, AttributeError, ValueError) as e:
+        # AttributeError: uuid.UUID() con un número, null, etc.
+        raise CursorNoValido(str(e))
+
+
+def consulta(filtro='todos', texto=''):
+    """Queryset filtrado y ordenado por ``(nombre_completo, id)``, sin paginar"""
+    invitados = Invitado.objects.filter(FILTROS.get(filtro, Q())).only(*_CAMPOS)
+    if texto:
+        invitados = busqueda.filtrar(invitados, texto)
+    return invitados.order_by('nombre_completo', 'id')
+
+
+def despues_de(invitados, cursor):
+    """
+    Filtra ``invitados`` a los que van después de ``cursor`` en ``(nombre_completo, id)``.
+
+    El ``nombre_completo >= nombre`` de adelante es redundante pero le da al
+    motor el límite inferior del índice: sin él, el OR se evalúa como filtro
+    mientras recorre el índice desde el primer nombre.
+    """
+    nombre, invitado_id = decodificar_cursor(cursor)
+    return invitados.filter(
+        Q(nombre_completo__gte=nombre),
+        Q(nombre_completo__gt=nombre) | Q(nombre_completo=nombre, id__gt=invitado_id),
+    )
+
+
+def pagina(filtro='todos', texto='', despues=None, limite=TAM_PAGINA):
+    """
+    Devuelve ``(invitados, siguiente)``.
+
+    ``despues`` es el cursor devuelto por la página anterior (``None`` para la
+    primera); ``siguiente`` es ``None`` cuando ya no hay más.
+    """
+    limite = min(max(int(limite), 1), MAX_TAM_PAGINA)
+    invitados = consulta(filtro, texto)
+    if despues:
+        invitados = despues_de(invitados, despues)
+
+    resultados = list(invitados[:limite + 1])
+    siguiente = codificar_cursor(resultados[limite - 1]) if len(resultados) > limite else None
+    return resultados[:limite], siguiente
+
+
+def buscar(texto, limite=20):
+    """Invitados que mejor coinciden con ``texto``, ordenados por relevancia"""
+    ids = [uuid.UUID(str(invitado_id)) for invitado_id in busqueda.ids_por_relevancia(texto, limite)]
+    encontrados = Invitado.objects.only(*_CAMPOS).in_bulk(ids)
+    return [encontrados[invitado_id] for invitado_id in ids if invitado_id in encontrados]
+
+
+def serializar(invitado):
+    """Datos compactos de un invitado para la API de la lista"""
+    return {
+        'id': str(invitado.id),
+        'nombre': invitado.nombre_completo,
+        'puesto': invitado.puesto_cargo,
+        'foto': invitado.fotografia.url if invitado.fotografia else None,
+        'qr': imagen_qr.url(invitado.token_qr) if invitado.token_qr else None,
+        'token_qr': invitado.token_qr,
+        'asistio': invitado.asistio,
+        'hora_entrada': invitado.hora_entrada_formateada if invitado.asistio else None,
+    }
@@ -0,0 +1,141 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Q
+
+from invitados import busqueda, imagen_qr, indice_tokens, tokens
+from invitados.models import Invitado
+
+
+def _iniciar_proceso():
+    # Con "spawn" (macOS, Windows) el proceso hijo arranca sin Django configurado
+    django.setup()
+
+
+def _renderizar_lote(pases):
+    """En un proceso hijo: dibuja y escribe los PNG que falten; devuelve [(id, nombre del archivo)]"""
+    return [(invitado_id, imagen_qr.asegurar_png(token)) for invitado_id, token in pases]
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta a media los PNG de los pases, en varios procesos, y los asigna "
+        "con bulk_update por lotes. Sólo hace falta para tener los archivos "
+        "(imprenta, envío por correo): las páginas, el admin y el PDF dibujan el "
+        "QR al pedirse y no usan estos archivos. Cada archivo ocupa lugar en "
+        "media y un cambio de logo produce archivos nuevos (usar --todos "
+        "--borrar-anteriores). Por defecto sólo los invitados sin PNG exportado, "
+        "así que si se interrumpe basta con volver a ejecutarlo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos', action='store_true',
+            help='Regenerar también los que ya tienen QR (para continuar, usar --desde)'
+        )
+        parser.add_argument(
+            '--buscar', default='',
+            help='Sólo los invitados cuyo nombre o puesto coincide (sin acentos)'
+        )
+        parser.add_argument(
+            '--solo-pendientes', action='store_true',
+            help='Sólo los invitados que no han llegado'
+        )
+        parser.add_argument(
+            '--desde', default=None,
+            help='Continuar después de este id de invitado (lo imprime el comando al interrumpirse)'
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count() or 1,
+            help='Procesos que dibujan y escriben los PNG (por defecto, uno por CPU)'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=200,
+            help='Invitados por lote y por transacción (por defecto 200)'
+        )
+        parser.add_argument(
+            '--borrar-anteriores', action='store_true',
+            help='Eliminar las imágenes QR anteriores una vez reemplazadas'
+        )
+
+    def handle(self, *args, **options):
+        invitados = Invitado.objects.order_by('id')
+        if not options['todos']:
+            invitados = invitados.filter(Q(qr_generado=False) | Q(qr_imagen='') | Q(qr_imagen__isnull=True))
+        if options['buscar']:
+            invitados = busqueda.filtrar(invitados, options['buscar'])
+        if options['solo_pendientes']:
+            invitados = invitados.filter(asistio=False)
+        if options['desde']:
+            invitados = invitados.filter(id__gt=options['desde'])
+
+        filas = list(invitados.values_list('id', 'token_qr', 'qr_imagen'))
+        if not filas:
+            self.stdout.write(self.style.SUCCESS('✅ No hay QR por generar'))
+            return
+
+        # Invitados cargados sin token (p. ej. con bulk_create): firmarlo aquí
+        sin_token = {invitado_id: tokens.firmar(invitado_id) for invitado_id, token, _ in filas if not token}
+        anteriores = {invitado_id: anterior for invitado_id, _, anterior in filas if anterior}
+        pases = [(invitado_id, token or sin_token[invitado_id]) for invitado_id, token, _ in filas]
+        lotes = [pases[i:i + options['lote']] for i in range(0, len(pases), options['lote'])]
+
+        total = len(pases)
+        procesos = max(1, options['procesos'])
+        self.stdout.write(f'🔧 Generando {total} QR en {procesos} proceso(s), lotes de {options["lote"]}...')
+
+        procesados = 0
+        ultimo_id = None
+        inicio = time.perf_counter()
+        # Los hijos no usan la base de datos; que no hereden la conexión abierta
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) if procesos > 1 else None
+        try:
+            # map() entrega los lotes en orden: todo lo anterior a ultimo_id ya quedó guardado
+            resultados = executor.map(_renderizar_lote, lotes) if executor else map(_renderizar_lote, lotes)
+            for generados in resultados:
+                self._guardar(generados, sin_token, anteriores if options['borrar_anteriores'] else {})
+                procesados += len(generados)
+                ultimo_id = generados[-1][0]
+                transcurrido = time.perf_counter() - inicio
+                self.stdout.write(
+                    f'   {procesados}/{total} ({procesados / total:.0%}, {procesados / transcurrido:.0f} QR/s)'
+                )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ Interrumpido tras {procesados}/{total}. '
+                + (f'Para continuar: --desde {ultimo_id}' if ultimo_id else 'No se guardó ningún lote.')
+            ))
+            raise
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+            if sin_token:
+                # bulk_update no dispara señales: avisar a los workers del cambio de tokens
+                indice_tokens.invalidar()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {procesados} QR generados en {time.perf_counter() - inicio:.1f} s'
+        ))
+
+    def _guardar(self, generados, sin_token, anteriores):
+        lote = [Invitado(id=invitado_id, qr_imagen=nombre, qr_generado=True) for invitado_id, nombre in generados]
+        # Sólo se escriben los tokens recién firmados; los demás se dejan como estaban
+        nuevos = [invitado for invitado in lote if invitado.id in sin_token]
+        for invitado in nuevos:
+            invitado.token_qr = sin_token[invitado.id]
+
+        with transaction.atomic():
+            Invitado.objects.bulk_update(lote, ['qr_imagen', 'qr_generado'])
+            if nuevos:
+                Invitado.objects.bulk_update(nuevos, ['token_qr'])
+
+        storage = Invitado._meta.get_field('qr_imagen').storage
+        for invitado_id, nombre in generados:
+            anterior = anteriores.get(invitado_id)
+            if anterior and anterior != nombre:
+                storage.delete(anterior)
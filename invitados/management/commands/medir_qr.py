@@ -0,0 +1,58 @@
+import statistics
+import time
+import uuid
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invitados import imagen_qr, tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el costo por QR de pegar el logo sin caché (abrir, reducir y "
+        "enmascarar en cada QR) y con el mosaico preparado una vez por proceso. "
+        "No toca la base de datos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cantidad', type=int, default=50,
+            help='QR a generar en cada modo (por defecto 50)'
+        )
+
+    def handle(self, *args, **options):
+        if imagen_qr.ruta_logo() is None:
+            raise CommandError('No se encontró logo-qr.png: no hay nada que medir')
+
+        cantidad = options['cantidad']
+        tokens_prueba = [tokens.firmar(uuid.uuid4()) for _ in range(cantidad)]
+        self.stdout.write(f'🔧 Generando {cantidad} QR por modo...')
+
+        resultados = {}
+        for modo, usar_cache in (('sin caché', False), ('con caché', True)):
+            logo_ms = []
+            total_ms = []
+            for token in tokens_prueba:
+                inicio = time.perf_counter()
+                qr_img = imagen_qr.qr_base(token)
+                antes_logo = time.perf_counter()
+                imagen_qr.agregar_logo(qr_img, usar_cache=usar_cache)
+                despues_logo = time.perf_counter()
+                qr_img.save(BytesIO(), format='PNG')
+                fin = time.perf_counter()
+                logo_ms.append((despues_logo - antes_logo) * 1000)
+                total_ms.append((fin - inicio) * 1000)
+            resultados[modo] = (logo_ms, total_ms)
+
+            self.stdout.write(
+                f'   {modo}: logo p50 {statistics.median(logo_ms):.2f} ms, '
+                f'QR completo p50 {statistics.median(total_ms):.2f} ms '
+                f'(promedio {statistics.mean(total_ms):.2f} ms)'
+            )
+
+        antes = statistics.mean(resultados['sin caché'][1])
+        despues = statistics.mean(resultados['con caché'][1])
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {antes:.2f} ms -> {despues:.2f} ms por QR ({antes / despues:.1f}x)'
+        ))
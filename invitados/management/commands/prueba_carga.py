@@ -0,0 +1,249 @@
+import http.client
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from invitados import busqueda, contadores, indice_tokens, tokens
+from invitados.models import Invitado, LlegadasPorMinuto
+
+# Marcas para reconocer (y borrar) el padrón y las puertas sintéticas
+PUESTO_PRUEBA = '__prueba_carga__'
+PUERTA_PRUEBA = 'Escáner de carga'
+
+
+def _percentil(valores, q):
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, int(round(q * (len(valores) - 1))))
+    return valores[indice]
+
+
+class _ClienteHTTP:
+    """Cliente keep-alive contra un servidor real (un hilo = una conexión)"""
+
+    def __init__(self, url):
+        partes = urlparse(url)
+        clase = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        self.conexion = clase(partes.netloc, timeout=30)
+        self.base = partes.path.rstrip('/')
+
+    def post(self, ruta, datos):
+        cuerpo = json.dumps(datos)
+        self.conexion.request('POST', self.base + ruta, cuerpo, {'Content-Type': 'application/json'})
+        respuesta = self.conexion.getresponse()
+        return respuesta.status, respuesta.read()
+
+    def get(self, ruta, encabezados=None):
+        self.conexion.request('GET', self.base + ruta, headers=encabezados or {})
+        respuesta = self.conexion.getresponse()
+        return respuesta.status, respuesta.read(), respuesta.getheader('ETag')
+
+
+class _ClienteLocal:
+    """Cliente en proceso (django.test.Client), sin levantar servidor"""
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client()
+
+    def post(self, ruta, datos):
+        respuesta = self.client.post(ruta, data=json.dumps(datos), content_type='application/json')
+        return respuesta.status_code, respuesta.content
+
+    def get(self, ruta, encabezados=None):
+        respuesta = self.client.get(ruta, headers=encabezados)
+        return respuesta.status_code, respuesta.content, respuesta.get('ETag')
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de puertas: crea un padrón sintético y lanza escáneres "
+        "simulados contra /procesar-qr/ y /estadisticas/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invitados', type=int, default=2000,
+                            help='Tamaño del padrón sintético (por defecto 2000)')
+        parser.add_argument('--escaneres', type=int, default=20,
+                            help='Escáneres simulados concurrentes (por defecto 20)')
+        parser.add_argument('--duracion', type=float, default=30,
+                            help='Segundos de prueba (por defecto 30)')
+        parser.add_argument('--tasa-repetidos', type=float, default=0.10,
+                            help='Fracción de escaneos de pases ya usados (por defecto 0.10)')
+        parser.add_argument('--tasa-invalidos', type=float, default=0.03,
+                            help='Fracción de escaneos con token inválido (por defecto 0.03)')
+        parser.add_argument('--intervalo-estadisticas', type=float, default=3,
+                            help='Segundos entre consultas a /estadisticas/ por escáner (por defecto 3)')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Segundos entre escaneos de un mismo escáner (por defecto 0)')
+        parser.add_argument('--url', default='',
+                            help='Servidor a probar (p. ej. http://localhost:8000). Sin URL se prueba en proceso')
+        parser.add_argument('--salida', default='',
+                            help='Archivo JSON de resultados (por defecto prueba_carga_<fecha>.json)')
+        parser.add_argument('--conservar', action='store_true',
+                            help='No borrar el padrón sintético al terminar')
+
+    def handle(self, *args, **options):
+        if options['escaneres'] < 1 or options['invitados'] < 1:
+            raise CommandError('Se necesita al menos un escáner y un invitado')
+
+        self.stdout.write(f"🔧 Creando padrón sintético de {options['invitados']} invitados...")
+        pendientes = self._sembrar(options['invitados'])
+
+        try:
+            resultados = self._ejecutar(pendientes, options)
+        finally:
+            if not options['conservar']:
+                Invitado.objects.filter(puesto_cargo=PUESTO_PRUEBA).delete()
+                LlegadasPorMinuto.objects.filter(puerta__startswith=PUERTA_PRUEBA).delete()
+                indice_tokens.invalidar()
+                contadores.reconciliar()
+
+        salida = options['salida'] or f"prueba_carga_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+
+        for endpoint, datos in resultados['endpoints'].items():
+            self.stdout.write(
+                f"   {endpoint}: {datos['peticiones']} peticiones, {datos['rps']} req/s, "
+                f"p50 {datos['p50_ms']} ms, p95 {datos['p95_ms']} ms, p99 {datos['p99_ms']} ms, "
+                f"errores {datos['errores']}"
+            )
+        self.stdout.write(f"   resultados: {dict(resultados['resultados'])}")
+        self.stdout.write(self.style.SUCCESS(f'✅ Resultados guardados en {salida}'))
+
+    def _sembrar(self, cantidad):
+        Invitado.objects.filter(puesto_cargo=PUESTO_PRUEBA).delete()
+        invitados = []
+        for i in range(cantidad):
+            invitado_id = uuid.uuid4()
+            nombre = f'Invitado Carga {i:05d}'
+            invitados.append(Invitado(
+                id=invitado_id,
+                nombre_completo=nombre,
+                puesto_cargo=PUESTO_PRUEBA,
+                busqueda_normalizada=busqueda.texto_de(nombre, PUESTO_PRUEBA),
+                fotografia='',
+                token_qr=tokens.firmar(invitado_id),
+            ))
+        Invitado.objects.bulk_create(invitados, batch_size=1000)
+        # bulk_create no dispara señales: avisar a los workers y recalcular los contadores
+        indice_tokens.invalidar()
+        contadores.reconciliar()
+        return [invitado.token_qr for invitado in invitados]
+
+    def _ejecutar(self, pendientes, options):
+        random.shuffle(pendientes)
+        lock = threading.Lock()
+        usados = []
+        latencias = {'procesar_qr': [], 'estadisticas': []}
+        errores = Counter()
+        resultados = Counter()
+        fin = time.monotonic() + options['duracion']
+
+        def siguiente_token(rng):
+            with lock:
+                if usados and rng.random() < options['tasa_repetidos']:
+                    return rng.choice(usados)
+                if rng.random() < options['tasa_invalidos']:
+                    return rng.choice([str(uuid.uuid4()), tokens.PREFIJO + 'A' * (tokens.LONGITUD - 1)])
+                if pendientes:
+                    token = pendientes.pop()
+                    usados.append(token)
+                    return token
+                return rng.choice(usados) if usados else str(uuid.uuid4())
+
+        def escaner(numero):
+            rng = random.Random(numero)
+            cliente = _ClienteHTTP(options['url']) if options['url'] else _ClienteLocal()
+            proxima_consulta = time.monotonic()
+            etag = None
+            locales = {'procesar_qr': [], 'estadisticas': []}
+            try:
+                while time.monotonic() < fin:
+                    if time.monotonic() >= proxima_consulta:
+                        inicio = time.perf_counter()
+                        try:
+                            # Igual que escaner_qr.html: revalidar con el último ETag
+                            estado, _, etag = cliente.get(
+                                '/estadisticas/', {'If-None-Match': etag} if etag else None
+                            )
+                        except Exception:
+                            estado = 0
+                        locales['estadisticas'].append((time.perf_counter() - inicio) * 1000)
+                        if estado not in (200, 304):
+                            with lock:
+                                errores['estadisticas'] += 1
+                        proxima_consulta += options['intervalo_estadisticas']
+
+                    token = siguiente_token(rng)
+                    inicio = time.perf_counter()
+                    try:
+                        estado, cuerpo = cliente.post('/procesar-qr/', {
+                            'token_qr': token,
+                            'dispositivo': f'{PUERTA_PRUEBA} {numero}',
+                        })
+                        datos = json.loads(cuerpo)
+                        resultado = 'aceptado' if datos.get('success') else datos.get('error', 'desconocido')
+                    except Exception:
+                        estado, resultado = 0, 'error_conexion'
+                    locales['procesar_qr'].append((time.perf_counter() - inicio) * 1000)
+                    with lock:
+                        resultados[resultado] += 1
+                        if estado != 200:
+                            errores['procesar_qr'] += 1
+
+                    if options['pausa']:
+                        time.sleep(options['pausa'])
+            finally:
+                with lock:
+                    for endpoint, valores in locales.items():
+                        latencias[endpoint].extend(valores)
+                connection.close()
+
+        self.stdout.write(
+            f"🚀 {options['escaneres']} escáneres durante {options['duracion']} s "
+            f"contra {options['url'] or 'la aplicación en proceso'} ({connection.vendor})..."
+        )
+        inicio = time.monotonic()
+        hilos = [threading.Thread(target=escaner, args=(n,)) for n in range(options['escaneres'])]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.monotonic() - inicio
+
+        endpoints = {}
+        for endpoint, valores in latencias.items():
+            valores.sort()
+            endpoints[endpoint] = {
+                'peticiones': len(valores),
+                'errores': errores[endpoint],
+                'rps': round(len(valores) / duracion, 1),
+                'p50_ms': round(_percentil(valores, 0.50), 2),
+                'p95_ms': round(_percentil(valores, 0.95), 2),
+                'p99_ms': round(_percentil(valores, 0.99), 2),
+                'max_ms': round(valores[-1], 2) if valores else 0.0,
+            }
+
+        return {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'motor_bd': connection.vendor,
+            'objetivo': options['url'] or 'en_proceso',
+            'parametros': {
+                clave: options[clave]
+                for clave in ('invitados', 'escaneres', 'duracion', 'tasa_repetidos',
+                              'tasa_invalidos', 'intervalo_estadisticas', 'pausa')
+            },
+            'duracion_s': round(duracion, 2),
+            'endpoints': endpoints,
+            'resultados': dict(resultados),
+        }
@@ -0,0 +1,94 @@
+import os
+import statistics
+import time
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from invitados import imagen_qr
+
+
+class Command(BaseCommand):
+    help = (
+        "Vuelve a codificar los PNG de media/qr_codes con paleta (blanco, negro "
+        "y los colores del logo) y optimize, sin cambiar su tamaño, su nombre "
+        "ni los módulos del QR. Informa los bytes ahorrados y el tiempo de "
+        "codificación por imagen. Para redibujarlos al tamaño actual del PNG: "
+        "generar_qr --todos --borrar-anteriores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--simular', action='store_true',
+            help='Sólo medir: no reescribe ningún archivo'
+        )
+
+    def _reemplazar(self, nombre, contenido):
+        """
+        Sobrescribe ``nombre`` sin que exista un momento en que falte o esté a
+        medias: escribe un temporal junto al original (con los permisos del
+        storage) y lo renombra encima. Mismo nombre: las referencias en la base
+        de datos siguen valiendo.
+        """
+        temporal = default_storage.save(f'{nombre}.tmp', ContentFile(contenido))
+        try:
+            os.replace(default_storage.path(temporal), default_storage.path(nombre))
+        except BaseException:
+            default_storage.delete(temporal)
+            raise
+
+    def handle(self, *args, **options):
+        try:
+            _, archivos = default_storage.listdir(imagen_qr.CARPETA)
+        except FileNotFoundError:
+            archivos = []
+        nombres = sorted(f'{imagen_qr.CARPETA}/{archivo}' for archivo in archivos if archivo.endswith('.png'))
+        if not nombres:
+            self.stdout.write(self.style.SUCCESS('✅ No hay imágenes QR que recomprimir'))
+            return
+
+        self.stdout.write(f'🔧 Recomprimiendo {len(nombres)} imagen(es) QR...')
+        antes_total = despues_total = omitidas = 0
+        tiempos_ms = []
+        for nombre in nombres:
+            with default_storage.open(nombre, 'rb') as archivo:
+                original = archivo.read()
+            qr_img = Image.open(BytesIO(original))
+            if qr_img.mode in ('P', '1'):
+                # Ya tiene paleta (generado o recomprimido antes)
+                omitidas += 1
+                continue
+
+            inicio = time.perf_counter()
+            nuevo = imagen_qr.codificar_png(qr_img, imagen_qr.paleta(qr_img.width))
+            tiempos_ms.append((time.perf_counter() - inicio) * 1000)
+
+            if len(nuevo) >= len(original):
+                omitidas += 1
+                continue
+            antes_total += len(original)
+            despues_total += len(nuevo)
+            if options['verbosity'] >= 2:
+                self.stdout.write(
+                    f'   {nombre}: {len(original)} -> {len(nuevo)} bytes ({tiempos_ms[-1]:.1f} ms)'
+                )
+            if not options['simular']:
+                self._reemplazar(nombre, nuevo)
+
+        if not tiempos_ms:
+            self.stdout.write(self.style.SUCCESS(f'✅ Las {omitidas} imagen(es) ya estaban recomprimidas'))
+            return
+
+        ahorro = antes_total - despues_total
+        self.stdout.write(
+            f'   Codificación: {statistics.mean(tiempos_ms):.1f} ms por imagen '
+            f'(p50 {statistics.median(tiempos_ms):.1f} ms), {omitidas} omitida(s)'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {antes_total / 1024:.0f} KB -> {despues_total / 1024:.0f} KB: '
+            f'{ahorro / 1024:.0f} KB ahorrados ({ahorro / antes_total if antes_total else 0:.0%})'
+            + (' [simulación]' if options['simular'] else '')
+        ))
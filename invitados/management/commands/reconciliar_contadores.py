@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from invitados import contadores
+from invitados.models import Invitado
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los contadores materializados de asistencia con un COUNT(*) "
+        "sobre Invitado y los recalcula si no coinciden."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solo-revisar', action='store_true',
+            help='Informar la diferencia sin corregirla'
+        )
+
+    def handle(self, *args, **options):
+        contados = (Invitado.objects.count(), Invitado.objects.filter(asistio=True).count())
+        materializados = contadores.leer()
+
+        if materializados == contados:
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Contadores al día: {contados[0]} invitados, {contados[1]} asistentes'
+            ))
+            return
+
+        self.stdout.write(self.style.WARNING(
+            f'⚠️ Desajuste: contadores {materializados[0]}/{materializados[1]}, '
+            f'real {contados[0]}/{contados[1]} (invitados/asistentes)'
+        ))
+        if options['solo_revisar']:
+            return
+
+        invitados, asistentes = contadores.reconciliar()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Contadores recalculados: {invitados} invitados, {asistentes} asistentes'
+        ))
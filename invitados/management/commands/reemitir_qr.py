@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from invitados import indice_tokens, tokens
+from invitados.models import Invitado
+
+
+class Command(BaseCommand):
+    help = (
+        "Reemite los pases con token firmado. Por defecto sólo los que no tienen "
+        "un token firmado vigente. No escribe imágenes: /qr/<token>.png dibuja "
+        "el pase nuevo al pedirse, y el PNG exportado antes con generar_qr "
+        "(del token anterior) deja de estar asignado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos', action='store_true',
+            help='Reemitir todos los pases (por ejemplo, tras cambiar QR_SECRET_KEY)'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=200,
+            help='Invitados por transacción (por defecto 200)'
+        )
+        parser.add_argument(
+            '--borrar-anteriores', action='store_true',
+            help='Eliminar de media las imágenes QR exportadas con el token anterior'
+        )
+
+    def handle(self, *args, **options):
+        invitados = Invitado.objects.order_by('id')
+        if options['todos']:
+            ids = list(invitados.values_list('id', flat=True))
+        else:
+            ids = [
+                invitado_id
+                for invitado_id, token_qr in invitados.values_list('id', 'token_qr')
+                if tokens.verificar(token_qr) != tokens.FIRMADO
+            ]
+
+        total = len(ids)
+        if not total:
+            self.stdout.write(self.style.SUCCESS('✅ Todos los pases ya tienen token firmado vigente'))
+            return
+
+        self.stdout.write(f'🔧 Reemitiendo {total} pase(s)...')
+        procesados = 0
+        # Por lotes: un IN con todo el padrón pasa el límite de parámetros de SQLite
+        for inicio in range(0, total, options['lote']):
+            lote = list(invitados.filter(id__in=ids[inicio:inicio + options['lote']]))
+            procesados += self._reemitir(lote, options['borrar_anteriores'])
+            self.stdout.write(f'   {procesados}/{total}')
+
+        # bulk_update no dispara señales: avisar a los workers del cambio de tokens
+        indice_tokens.invalidar()
+        self.stdout.write(self.style.SUCCESS(f'✅ {procesados} pase(s) reemitidos'))
+
+    def _reemitir(self, lote, borrar_anteriores):
+        anteriores = []
+        for invitado in lote:
+            if invitado.qr_imagen:
+                anteriores.append(invitado.qr_imagen.name)
+            invitado.token_qr = tokens.firmar(invitado.id)
+            invitado.qr_imagen = ''
+            invitado.qr_generado = False
+
+        with transaction.atomic():
+            Invitado.objects.bulk_update(lote, ['token_qr', 'qr_imagen', 'qr_generado'])
+
+        if borrar_anteriores:
+            storage = Invitado._meta.get_field('qr_imagen').storage
+            for nombre in anteriores:
+                storage.delete(nombre)
+        return len(lote)
@@ -0,0 +1,130 @@
+"""
+Medición de latencia por etapa para las vistas de escaneo.
+
+Las vistas decoradas con ``@medir_etapas('nombre')`` reciben un
+``request.cronometro`` con el que marcan etapas (``with crono.etapa('json')``).
+Al terminar la petición:
+
+- la respuesta lleva un encabezado ``Server-Timing`` con cada etapa,
+- las duraciones se acumulan en histogramas en memoria de este proceso,
+  que se consultan desde ``/metricas/latencia/``.
+"""
+import bisect
+import inspect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Límites de los buckets en microsegundos: 10 µs a ~60 s, crecimiento de 20%
+_LIMITES = [10 * 1.2 ** i for i in range(int(math.log(6_000_000) / math.log(1.2)) + 1)]
+
+_lock = threading.Lock()
+_histogramas = {}
+
+
+class Histograma:
+    """Histograma logarítmico de duraciones (en microsegundos)"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(_LIMITES) + 1)
+        self.total = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def agregar(self, micros):
+        self.buckets[bisect.bisect_left(_LIMITES, micros)] += 1
+        self.total += 1
+        self.suma += micros
+        self.maximo = max(self.maximo, micros)
+
+    def percentil(self, q):
+        """Cota superior del bucket que contiene el percentil ``q`` (0-1)"""
+        if not self.total:
+            return 0.0
+        objetivo = q * self.total
+        acumulado = 0
+        for i, cuenta in enumerate(self.buckets):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return min(_LIMITES[i] if i < len(_LIMITES) else self.maximo, self.maximo)
+        return self.maximo
+
+    def resumen(self):
+        """Resumen en milisegundos"""
+        return {
+            'cuenta': self.total,
+            'promedio_ms': round(self.suma / self.total / 1000, 3) if self.total else 0.0,
+            'p50_ms': round(self.percentil(0.50) / 1000, 3),
+            'p95_ms': round(self.percentil(0.95) / 1000, 3),
+            'p99_ms': round(self.percentil(0.99) / 1000, 3),
+            'max_ms': round(self.maximo / 1000, 3),
+        }
+
+
+class Cronometro:
+    """Duraciones por etapa de una sola petición"""
+
+    def __init__(self, vista):
+        self.vista = vista
+        self.etapas = []
+        self._inicio = time.perf_counter_ns()
+
+    @contextmanager
+    def etapa(self, nombre):
+        inicio = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.etapas.append((nombre, (time.perf_counter_ns() - inicio) / 1000))
+
+    def terminar(self, response):
+        """Agrega Server-Timing a la respuesta y publica las duraciones"""
+        total = (time.perf_counter_ns() - self._inicio) / 1000
+        medidas = self.etapas + [('total', total)]
+
+        response['Server-Timing'] = ', '.join(
+            f'{nombre};dur={micros / 1000:.3f}' for nombre, micros in medidas
+        )
+
+        with _lock:
+            for nombre, micros in medidas:
+                clave = f'{self.vista}.{nombre}'
+                if clave not in _histogramas:
+                    _histogramas[clave] = Histograma()
+                _histogramas[clave].agregar(micros)
+        return response
+
+
+def medir_etapas(vista):
+    """Decorador que adjunta ``request.cronometro`` a vistas sync o async"""
+    def decorator(view_func):
+        if inspect.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                request.cronometro = Cronometro(vista)
+                response = await view_func(request, *args, **kwargs)
+                return request.cronometro.terminar(response)
+        else:
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                request.cronometro = Cronometro(vista)
+                response = view_func(request, *args, **kwargs)
+                return request.cronometro.terminar(response)
+        return _wrapped_view
+    return decorator
+
+
+def resumen():
+    """Percentiles por vista y etapa acumulados en este proceso"""
+    with _lock:
+        etapas = {clave: h.resumen() for clave, h in sorted(_histogramas.items())}
+    return {'pid': os.getpid(), 'etapas': etapas}
+
+
+def reiniciar():
+    """Vacía todos los histogramas de este proceso"""
+    with _lock:
+        _histogramas.clear()
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitados', '0002_userprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EscaneoProcesado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scan_id', models.CharField(max_length=64, unique=True, verbose_name='ID de escaneo')),
+                ('token_qr', models.CharField(max_length=100, verbose_name='Token QR')),
+                ('resultado', models.CharField(max_length=20, verbose_name='Resultado')),
+                ('invitado', models.JSONField(blank=True, null=True, verbose_name='Datos del invitado')),
+                ('fecha_procesado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Escaneo procesado',
+                'verbose_name_plural': 'Escaneos procesados',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitados', '0003_escaneoprocesado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoEscaneo',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('resultado', models.CharField(choices=[('aceptado', 'Entrada aceptada'), ('ya_escaneado', 'Ya había entrado'), ('manual', 'Entrada manual'), ('desmarcado', 'Asistencia desmarcada')], max_length=20)),
+                ('dispositivo', models.CharField(blank=True, max_length=100)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha y hora')),
+                ('invitado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='invitados.invitado')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Evento de escaneo',
+                'verbose_name_plural': 'Eventos de escaneo',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+def inicializar_contadores(apps, schema_editor):
+    Invitado = apps.get_model('invitados', 'Invitado')
+    ContadorAsistencia = apps.get_model('invitados', 'ContadorAsistencia')
+    ContadorAsistencia.objects.bulk_create([ContadorAsistencia(slot=slot) for slot in range(16)])
+    ContadorAsistencia.objects.filter(slot=0).update(
+        invitados=Invitado.objects.count(),
+        asistentes=Invitado.objects.filter(asistio=True).count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitados', '0004_eventoescaneo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorAsistencia',
+            fields=[
+                ('slot', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('invitados', models.BigIntegerField(default=0)),
+                ('asistentes', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador de asistencia',
+                'verbose_name_plural': 'Contadores de asistencia',
+            },
+        ),
+        migrations.RunPython(inicializar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:03
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def llenar_serie(apps, schema_editor):
+    EventoEscaneo = apps.get_model('invitados', 'EventoEscaneo')
+    LlegadasPorMinuto = apps.get_model('invitados', 'LlegadasPorMinuto')
+    cuentas = Counter()
+    entradas = EventoEscaneo.objects.filter(resultado__in=['aceptado', 'manual'])
+    for fecha, dispositivo in entradas.values_list('fecha', 'dispositivo').iterator():
+        cuentas[(fecha.replace(second=0, microsecond=0), dispositivo)] += 1
+    LlegadasPorMinuto.objects.bulk_create([
+        LlegadasPorMinuto(minuto=minuto, puerta=puerta, llegadas=llegadas)
+        for (minuto, puerta), llegadas in cuentas.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitados', '0005_contadorasistencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LlegadasPorMinuto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minuto', models.DateTimeField(verbose_name='Minuto')),
+                ('puerta', models.CharField(blank=True, max_length=100, verbose_name='Puerta')),
+                ('llegadas', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Llegadas por minuto',
+                'verbose_name_plural': 'Llegadas por minuto',
+                'constraints': [models.UniqueConstraint(fields=('minuto', 'puerta'), name='llegadas_minuto_puerta_unico')],
+            },
+        ),
+        migrations.RunPython(llenar_serie, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitados', '0006_llegadaspominuto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invitado',
+            index=models.Index(condition=models.Q(('asistio', True)), fields=['-fecha_hora_entrada'], name='invitado_llegadas_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invitado',
+            index=models.Index(condition=models.Q(('asistio', False)), fields=['nombre_completo'], name='invitado_pendientes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invitado',
+            index=models.Index(fields=['-fecha_creacion'], name='invitado_recientes_idx'),
+        ),
+    ]
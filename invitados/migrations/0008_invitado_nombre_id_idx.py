@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitados', '0007_invitado_invitado_llegadas_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invitado',
+            index=models.Index(fields=['nombre_completo', 'id'], name='invitado_nombre_id_idx'),
+        ),
+    ]
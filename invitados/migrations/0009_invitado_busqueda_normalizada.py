@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:12
+
+from django.db import migrations, models, transaction
+from django.db.utils import DatabaseError
+
+
+def llenar_busqueda(apps, schema_editor):
+    from invitados.busqueda import texto_de
+
+    Invitado = apps.get_model('invitados', 'Invitado')
+    invitados = []
+    for invitado in Invitado.objects.only('id', 'nombre_completo', 'puesto_cargo').iterator():
+        invitado.busqueda_normalizada = texto_de(invitado.nombre_completo, invitado.puesto_cargo)
+        invitados.append(invitado)
+    Invitado.objects.bulk_update(invitados, ['busqueda_normalizada'], batch_size=1000)
+
+
+def crear_indice_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError as e:
+        print(f"⚠️ pg_trgm no disponible, la búsqueda usará LIKE sin índice: {e}")
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS invitado_busqueda_trgm_idx '
+        'ON invitados_invitado USING gin (busqueda_normalizada gin_trgm_ops)'
+    )
+
+
+def borrar_indice_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS invitado_busqueda_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitados', '0008_invitado_nombre_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invitado',
+            name='busqueda_normalizada',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(llenar_busqueda, migrations.RunPython.noop),
+        # La tabla FTS5 de SQLite se crea en post_migrate (ver busqueda.preparar_sqlite)
+        migrations.RunPython(crear_indice_trigramas, borrar_indice_trigramas),
+    ]
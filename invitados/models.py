@@ -1,15 +1,12 @@
-import os
 import uuid
-import qrcode
-from io import BytesIO
 from django.db import models
 from django.utils import timezone
-from django.core.files.base import ContentFile
-from PIL import Image, ImageDraw
-from django.conf import settings
+from PIL import Image
 import pytz
 from django.contrib.auth.models import User
 
+from . import busqueda, imagen_qr, tokens
+
 class Invitado(models.Model):
     # Campos principales
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -44,6 +41,9 @@ class Invitado(models.Model):
         verbose_name="Escaneado por (dispositivo/usuario)"
     )
     
+    # Nombre y puesto sin acentos ni mayúsculas (ver busqueda.py)
+    busqueda_normalizada = models.TextField(blank=True, default='', editable=False)
+    
     # Campos de auditoría
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
@@ -52,6 +52,22 @@ class Invitado(models.Model):
         verbose_name = "Invitado"
         verbose_name_plural = "Invitados"
         ordering = ['nombre_completo']
+        indexes = [
+            # Últimas llegadas: filter(asistio=True).order_by('-fecha_hora_entrada')
+            models.Index(
+                fields=['-fecha_hora_entrada'], condition=models.Q(asistio=True),
+                name='invitado_llegadas_idx'
+            ),
+            # Pendientes: filter(asistio=False).order_by('nombre_completo')
+            models.Index(
+                fields=['nombre_completo'], condition=models.Q(asistio=False),
+                name='invitado_pendientes_idx'
+            ),
+            # Registrados recientemente: order_by('-fecha_creacion')
+            models.Index(fields=['-fecha_creacion'], name='invitado_recientes_idx'),
+            # Lista paginada por llave: order_by('nombre_completo', 'id')
+            models.Index(fields=['nombre_completo', 'id'], name='invitado_nombre_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre_completo} - {self.puesto_cargo}"
@@ -59,25 +75,28 @@ class Invitado(models.Model):
     def save(self, *args, **kwargs):
         # Generar token único si no existe
         if not self.token_qr:
-            self.token_qr = str(uuid.uuid4())
+            self.token_qr = tokens.firmar(self.id)
             print(f"🔧 Token generado: {self.token_qr}")
         
-        # Guardar primero para obtener el ID
-        super().save(*args, **kwargs)
+        # Texto de búsqueda sin acentos
+        self.busqueda_normalizada = busqueda.texto_de(self.nombre_completo, self.puesto_cargo)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'nombre_completo', 'puesto_cargo'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'busqueda_normalizada'}
         
-        # Generar QR automáticamente si no existe
-        if not self.qr_generado or not self.qr_imagen:
-            try:
-                print(f"🔧 Generando QR para {self.nombre_completo}")
-                self.generar_qr()
-                print("✅ QR generado exitosamente")
-                # Guardar nuevamente para actualizar el campo QR
-                super().save(*args, **kwargs)
-            except Exception as e:
-                print(f"❌ Error al generar QR: {e}")
+        # Sólo una foto recién subida necesita redimensionarse
+        update_fields = kwargs.get('update_fields')
+        foto_nueva = (
+            bool(self.fotografia) and not self.fotografia._committed
+            and (update_fields is None or 'fotografia' in update_fields)
+        )
+        
+        # Guardar (y ajustar los contadores en la misma transacción). El QR no
+        # se dibuja aquí: lo sirve /qr/<token>.png|svg (ver imagen_qr.py)
+        self._guardar_con_contadores(*args, **kwargs)
         
         # Redimensionar imagen si es muy grande
-        if self.fotografia:
+        if foto_nueva:
             try:
                 img = Image.open(self.fotografia.path)
                 if img.height > 300 or img.width > 300:
@@ -86,152 +105,113 @@ class Invitado(models.Model):
             except Exception as e:
                 print(f"❌ Error al redimensionar imagen: {e}")
 
-    def generar_qr(self):
-        """Método para generar código QR con logo personalizado"""
-        if not self.token_qr:
-            self.token_qr = str(uuid.uuid4())
-        
-        print("🔧 Iniciando generación de QR...")
-        
-        # Crear el código QR con configuración optimizada para logo
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,  # Máxima corrección de errores
-            box_size=10,
-            border=4,
-        )
-        
-        # Agregar el token como datos del QR
-        qr.add_data(self.token_qr)
-        qr.make(fit=True)
+    def _guardar_con_contadores(self, *args, **kwargs):
+        """save() que mantiene ContadorAsistencia al día con altas y cambios de asistencia"""
+        from django.db import transaction
+        from . import contadores
         
-        # Crear la imagen del QR base
-        qr_img = qr.make_image(fill_color="black", back_color="white").convert('RGB')
-        print(f"📐 Tamaño del QR: {qr_img.size}")
+        es_nuevo = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        revisar_asistencia = not es_nuevo and (update_fields is None or 'asistio' in update_fields)
         
-        # Intentar agregar logo al centro
-        logo_agregado = False
-        try:
-            # Buscar logo en diferentes ubicaciones
-            possible_paths = [
-                os.path.join(settings.BASE_DIR, 'static', 'images', 'logo-qr.png'),
-                os.path.join(settings.STATICFILES_DIRS[0], 'images', 'logo-qr.png') if settings.STATICFILES_DIRS else None,
-            ]
+        with transaction.atomic():
+            asistio_anterior = False
+            if revisar_asistencia:
+                # Bloquear la fila: un escaneo concurrente no puede cambiar asistio
+                # entre esta lectura y el save(), o se ajustaría dos veces
+                asistio_anterior = bool(
+                    Invitado.objects.select_for_update().filter(pk=self.pk)
+                    .values_list('asistio', flat=True).first()
+                )
+            super().save(*args, **kwargs)
             
-            logo_path = None
-            for path in possible_paths:
-                if path and os.path.exists(path):
-                    logo_path = path
-                    break
-            
-            if logo_path:
-                print(f"🎯 Logo encontrado en: {logo_path}")
-                
-                # Abrir y procesar el logo
-                logo = Image.open(logo_path)
-                print(f"📐 Tamaño original del logo: {logo.size}")
-                
-                # Calcular tamaño del logo (20% del QR)
-                qr_width, qr_height = qr_img.size
-                logo_size = int(min(qr_width, qr_height) * 0.2)  # 20% del tamaño del QR
-                
-                # Redimensionar logo manteniendo aspecto
-                logo = logo.resize((logo_size, logo_size), Image.Resampling.LANCZOS)
-                print(f"📐 Logo redimensionado a: {logo.size}")
-                
-                # Convertir a RGBA si no lo está
-                if logo.mode != 'RGBA':
-                    logo = logo.convert('RGBA')
-                
-                # Crear fondo blanco circular para el logo
-                background_size = logo_size + 10
-                background = Image.new('RGBA', (background_size, background_size), (255, 255, 255, 255))
-                
-                # Crear máscara circular para el fondo
-                bg_mask = Image.new('L', (background_size, background_size), 0)
-                bg_draw = ImageDraw.Draw(bg_mask)
-                bg_draw.ellipse((0, 0, background_size, background_size), fill=255)
-                background.putalpha(bg_mask)
-                
-                # Calcular posición central
-                bg_pos = ((qr_width - background_size) // 2, (qr_height - background_size) // 2)
-                logo_pos = ((background_size - logo_size) // 2, (background_size - logo_size) // 2)
-                
-                # Pegar fondo blanco primero
-                qr_img.paste(background, bg_pos, background)
-                
-                # Pegar logo sobre el fondo
-                final_logo_pos = (bg_pos[0] + logo_pos[0], bg_pos[1] + logo_pos[1])
-                qr_img.paste(logo, final_logo_pos, logo)
-                
-                logo_agregado = True
-                print("✅ Logo agregado exitosamente al QR")
-                
-            else:
-                print("⚠️ Logo no encontrado en ninguna ubicación:")
-                for path in possible_paths:
-                    if path:
-                        print(f"   - {path} (existe: {os.path.exists(path)})")
-                
-        except Exception as e:
-            print(f"❌ Error al agregar logo al QR: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        # Convertir a bytes
-        buffer = BytesIO()
-        qr_img.save(buffer, format='PNG', quality=95)
-        buffer.seek(0)
-        
-        # Nombre del archivo
-        filename = f"qr_{self.token_qr[:8]}_{'con_logo' if logo_agregado else 'sin_logo'}.png"
-        
-        # Guardar en el campo qr_imagen
-        self.qr_imagen.save(
-            filename,
-            ContentFile(buffer.getvalue()),
-            save=False
-        )
+            if es_nuevo:
+                contadores.ajustar(invitados=1, asistentes=int(self.asistio))
+            elif revisar_asistencia and asistio_anterior != self.asistio:
+                contadores.ajustar(asistentes=1 if self.asistio else -1)
+
+    def generar_qr(self):
+        """Exporta a media el PNG del pase (si falta) y lo asigna, sin guardar el modelo; las páginas no lo usan"""
+        if not self.token_qr:
+            self.token_qr = tokens.firmar(self.id)
         
-        # Marcar como QR generado
+        self.qr_imagen.name = imagen_qr.asegurar_png(self.token_qr)
         self.qr_generado = True
-        buffer.close()
-        
-        print(f"💾 QR guardado como: {filename}")
         return True
 
-    def marcar_asistencia(self, dispositivo=""):
-        """Marca la asistencia del invitado de forma thread-safe - VERSIÓN CORREGIDA"""
+    def marcar_asistencia(self, dispositivo="", usuario=None):
+        """Marca la asistencia del invitado con un UPDATE condicional (exactamente una vez)"""
         from django.db import transaction
+        from . import contadores, en_vivo, series
         
         try:
+            ahora = timezone.now()
             with transaction.atomic():
-                # Recargar el objeto para evitar condiciones de carrera
-                invitado_actual = Invitado.objects.select_for_update().get(id=self.id)
-                
-                if invitado_actual.asistio:
+                # Sólo la primera petición encuentra asistio=False; las demás no actualizan nada
+                actualizados = Invitado.objects.filter(id=self.id, asistio=False).update(
+                    asistio=True,
+                    fecha_hora_entrada=ahora,
+                    escaneado_por=dispositivo
+                )
+                if not actualizados:
                     return False  # Ya está marcado
                 
-                # Obtener hora actual en zona horaria de México
-                mexico_tz = pytz.timezone('America/Mexico_City')
-                hora_mexico = timezone.now().astimezone(mexico_tz)
-                
-                invitado_actual.asistio = True
-                invitado_actual.fecha_hora_entrada = hora_mexico
-                invitado_actual.escaneado_por = dispositivo
-                invitado_actual.save()
-                
-                # Actualizar el objeto actual
-                self.asistio = invitado_actual.asistio
-                self.fecha_hora_entrada = invitado_actual.fecha_hora_entrada
-                self.escaneado_por = invitado_actual.escaneado_por
-                
-                return True
+                contadores.ajustar(asistentes=1)
+                series.registrar(ahora, dispositivo)
+                EventoEscaneo.objects.create(
+                    invitado_id=self.id,
+                    resultado='manual',
+                    dispositivo=dispositivo[:100],
+                    usuario=usuario,
+                    fecha=ahora
+                )
+            
+            # Actualizar el objeto actual
+            self.asistio = True
+            self.fecha_hora_entrada = ahora
+            self.escaneado_por = dispositivo
+            
+            en_vivo.publicar('entrada', resultado='manual', invitado={
+                'id': str(self.id),
+                'nombre': self.nombre_completo,
+                'puesto': self.puesto_cargo,
+                'hora_entrada': self.hora_entrada_formateada,
+                'foto': self.fotografia.url if self.fotografia else None,
+            })
+            return True
                 
         except Exception as e:
             print(f"Error al marcar asistencia para {self.nombre_completo}: {e}")
             return False
     
+    def desmarcar_asistencia(self, dispositivo="", usuario=None):
+        """Quita la asistencia dejando constancia en la bitácora"""
+        from django.db import transaction
+        from . import contadores, en_vivo
+        
+        with transaction.atomic():
+            actualizados = Invitado.objects.filter(id=self.id, asistio=True).update(
+                asistio=False,
+                fecha_hora_entrada=None,
+                escaneado_por=''
+            )
+            if not actualizados:
+                return False  # No estaba marcado
+            
+            contadores.ajustar(asistentes=-1)
+            EventoEscaneo.objects.create(
+                invitado_id=self.id,
+                resultado='desmarcado',
+                dispositivo=dispositivo[:100],
+                usuario=usuario
+            )
+        
+        self.asistio = False
+        self.fecha_hora_entrada = None
+        self.escaneado_por = ''
+        en_vivo.publicar('desmarcado', invitado={'id': str(self.id)})
+        return True
+    
     @property
     def estado_asistencia(self):
         """Retorna el estado de asistencia del invitado"""
@@ -269,6 +249,79 @@ class Invitado(models.Model):
             print(f"Error inesperado al formatear hora para {self.nombre_completo}: {e}")
             return "Error desconocido"
         
+class EventoEscaneo(models.Model):
+    """Bitácora de solo inserción: cada escaneo o cambio de asistencia es una fila nueva"""
+    RESULTADOS = [
+        ('aceptado', 'Entrada aceptada'),
+        ('ya_escaneado', 'Ya había entrado'),
+        ('manual', 'Entrada manual'),
+        ('desmarcado', 'Asistencia desmarcada'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    invitado = models.ForeignKey(Invitado, on_delete=models.CASCADE, related_name='eventos')
+    resultado = models.CharField(max_length=20, choices=RESULTADOS)
+    dispositivo = models.CharField(max_length=100, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha = models.DateTimeField(default=timezone.now, verbose_name="Fecha y hora")
+
+    class Meta:
+        verbose_name = "Evento de escaneo"
+        verbose_name_plural = "Eventos de escaneo"
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"{self.invitado_id} - {self.resultado} - {self.fecha}"
+
+class ContadorAsistencia(models.Model):
+    """
+    Totales materializados de invitados y asistentes.
+
+    Se reparten en varias filas (``slot``) para que escaneos simultáneos no
+    compitan por el mismo bloqueo; el total es la suma de todas las filas.
+    """
+    slot = models.PositiveSmallIntegerField(primary_key=True)
+    invitados = models.BigIntegerField(default=0)
+    asistentes = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Contador de asistencia"
+        verbose_name_plural = "Contadores de asistencia"
+
+    def __str__(self):
+        return f"Slot {self.slot}: {self.asistentes}/{self.invitados}"
+
+class LlegadasPorMinuto(models.Model):
+    """Serie de tiempo de entradas: una fila por minuto y puerta (dispositivo)"""
+    minuto = models.DateTimeField(verbose_name="Minuto")
+    puerta = models.CharField(max_length=100, blank=True, verbose_name="Puerta")
+    llegadas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Llegadas por minuto"
+        verbose_name_plural = "Llegadas por minuto"
+        constraints = [
+            models.UniqueConstraint(fields=['minuto', 'puerta'], name='llegadas_minuto_puerta_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.minuto:%H:%M} {self.puerta}: {self.llegadas}"
+
+class EscaneoProcesado(models.Model):
+    """Registro de idempotencia para escaneos sincronizados desde el dispositivo"""
+    scan_id = models.CharField(max_length=64, unique=True, verbose_name="ID de escaneo")
+    token_qr = models.CharField(max_length=100, verbose_name="Token QR")
+    resultado = models.CharField(max_length=20, verbose_name="Resultado")
+    invitado = models.JSONField(null=True, blank=True, verbose_name="Datos del invitado")
+    fecha_procesado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Escaneo procesado"
+        verbose_name_plural = "Escaneos procesados"
+
+    def __str__(self):
+        return f"{self.scan_id} - {self.resultado}"
+
 class UserProfile(models.Model):
         ROLES = [
             ('admin', 'Administrador'),
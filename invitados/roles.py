@@ -0,0 +1,54 @@
+"""
+Rol del usuario (``UserProfile.rol``) resuelto una vez y compartido.
+
+El rol se guarda en la caché compartida por usuario al iniciar sesión (o en
+la primera petición que lo necesite) y las señales de ``UserProfile`` lo
+borran cuando cambia. ``RolMiddleware`` lo deja en ``request.user_role`` de
+forma perezosa: decoradores, vistas y plantillas lo leen sin consultar la
+base de datos, y las peticiones que no lo usan no pagan nada.
+"""
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import SimpleLazyObject
+
+ROL_POR_DEFECTO = 'registro'
+
+
+def _clave(user_id):
+    return f'invitados:rol:{user_id}'
+
+
+def obtener_rol(user):
+    """Rol del usuario (crea el perfil con el rol por defecto si no existe)"""
+    if not user.is_authenticated:
+        return None
+
+    rol = cache.get(_clave(user.pk))
+    if rol is None:
+        from .models import UserProfile
+
+        perfil, _ = UserProfile.objects.get_or_create(user=user, defaults={'rol': ROL_POR_DEFECTO})
+        rol = perfil.rol
+        cache.set(_clave(user.pk), rol, None)
+    return rol
+
+
+def invalidar(user_id):
+    """Olvida el rol guardado cuando se confirma la transacción en curso"""
+    transaction.on_commit(lambda: cache.delete(_clave(user_id)))
+
+
+@sync_and_async_middleware
+def RolMiddleware(get_response):
+    """Agrega ``request.user_role`` (perezoso); va después de AuthenticationMiddleware"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            request.user_role = SimpleLazyObject(lambda: obtener_rol(request.user))
+            return await get_response(request)
+    else:
+        def middleware(request):
+            request.user_role = SimpleLazyObject(lambda: obtener_rol(request.user))
+            return get_response(request)
+    return middleware
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import AsistenciaConsumer
+
+websocket_urlpatterns = [
+    path('ws/asistencia/', AsistenciaConsumer.as_asgi()),
+]
@@ -0,0 +1,96 @@
+"""
+Serie de tiempo de entradas por minuto y puerta (``LlegadasPorMinuto``).
+
+Cada entrada aceptada o manual suma uno a la fila de su minuto y dispositivo
+dentro de la misma transacción; en Postgres el escaneo lo hace en el mismo SQL
+del registro (ver ``asistencia.py``). El panel lee un rango de minutos por el
+índice único ``(minuto, puerta)`` y lo agrupa en intervalos de 1, 5 o 15
+minutos, sin recorrer ``Invitado``.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import LlegadasPorMinuto
+
+# Intervalo en minutos -> ventana que se muestra
+INTERVALOS = {
+    1: timedelta(hours=2),
+    5: timedelta(hours=8),
+    15: timedelta(hours=24),
+}
+
+_SQL_SUMAR = """
+    INSERT INTO {serie} (minuto, puerta, llegadas)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (minuto, puerta) DO UPDATE SET llegadas = {serie}.llegadas + EXCLUDED.llegadas
+"""
+
+
+def _minuto(fecha):
+    return fecha.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+
+
+def _inicio_intervalo(fecha, intervalo):
+    return fecha - timedelta(minutes=fecha.minute % intervalo)
+
+
+def registrar(fecha, puerta, cantidad=1):
+    """Suma ``cantidad`` entradas al minuto de ``fecha`` en ``puerta`` (upsert)"""
+    tabla = connection.ops.quote_name(LlegadasPorMinuto._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(_SQL_SUMAR.format(serie=tabla), [
+            connection.ops.adapt_datetimefield_value(_minuto(fecha)),
+            (puerta or "")[:100],
+            cantidad,
+        ])
+
+
+def _agrupar(filas, inicio, fin, intervalo):
+    cubetas = defaultdict(lambda: defaultdict(int))
+    puertas = set()
+    for minuto, puerta, llegadas in filas:
+        cubetas[_inicio_intervalo(_minuto(minuto), intervalo)][puerta] += llegadas
+        puertas.add(puerta)
+
+    puntos = []
+    paso = timedelta(minutes=intervalo)
+    actual = inicio
+    while actual <= fin:
+        por_puerta = cubetas.get(actual, {})
+        puntos.append({
+            'inicio': actual.isoformat(),
+            'hora': timezone.localtime(actual).strftime('%H:%M'),
+            'total': sum(por_puerta.values()),
+            'por_puerta': dict(por_puerta),
+        })
+        actual += paso
+    return {'intervalo': intervalo, 'puertas': sorted(puertas), 'puntos': puntos}
+
+
+def _rango(intervalo):
+    fin = _inicio_intervalo(_minuto(timezone.now()), intervalo)
+    inicio = _inicio_intervalo(_minuto(fin - INTERVALOS[intervalo]), intervalo) + timedelta(minutes=intervalo)
+    return inicio, fin
+
+
+def leer(intervalo=5):
+    """
+    Entradas por intervalo (1, 5 o 15 minutos) dentro de su ventana.
+
+    Devuelve ``{'intervalo', 'puertas', 'puntos'}``; cada punto trae
+    ``inicio`` (ISO, UTC), ``hora`` local, ``total`` y ``por_puerta``. Los
+    intervalos sin entradas aparecen con total 0.
+    """
+    inicio, fin = _rango(intervalo)
+    filas = LlegadasPorMinuto.objects.filter(minuto__gte=inicio).values_list('minuto', 'puerta', 'llegadas')
+    return _agrupar(filas, inicio, fin, intervalo)
+
+
+async def aleer(intervalo=5):
+    """Versión async de leer()"""
+    inicio, fin = _rango(intervalo)
+    filas = LlegadasPorMinuto.objects.filter(minuto__gte=inicio).values_list('minuto', 'puerta', 'llegadas')
+    return _agrupar([fila async for fila in filas], inicio, fin, intervalo)
@@ -0,0 +1,53 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import busqueda, contadores, estadisticas, indice_tokens, roles
+from .models import Invitado, UserProfile
+
+
+@receiver(post_save, sender=Invitado)
+def invitado_guardado(sender, instance, created, update_fields=None, **kwargs):
+    """Renueva las estadísticas y, si el token_qr es nuevo o cambió, su entrada del índice"""
+    # Nombre, puesto o foto pueden aparecer en las últimas llegadas
+    estadisticas.invalidar()
+    if update_fields is not None and 'token_qr' not in update_fields:
+        return
+    if not instance.token_qr or indice_tokens.contiene(instance.token_qr, instance.id):
+        return  # Edición que no toca el token
+    indice_tokens.actualizar(instance.token_qr, instance.id)
+
+
+@receiver(pre_delete, sender=Invitado)
+def invitado_por_eliminar(sender, instance, **kwargs):
+    """Relee asistio con la fila bloqueada: la instancia puede ser anterior a un escaneo"""
+    asistio = Invitado.objects.select_for_update().filter(pk=instance.pk).values_list('asistio', flat=True).first()
+    if asistio is not None:
+        instance.asistio = asistio
+
+
+@receiver(post_delete, sender=Invitado)
+def invitado_eliminado(sender, instance, **kwargs):
+    """Quita su token del índice y descuenta al invitado de los contadores"""
+    indice_tokens.quitar(instance.token_qr)
+    contadores.ajustar(invitados=-1, asistentes=-int(instance.asistio))
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def perfil_cambiado(sender, instance, **kwargs):
+    """Olvida el rol guardado del usuario cuando cambia su perfil"""
+    roles.invalidar(instance.user_id)
+
+
+@receiver(user_logged_in)
+def usuario_autenticado(sender, request, user, **kwargs):
+    """Resuelve el rol una vez al iniciar sesión"""
+    roles.obtener_rol(user)
+
+
+@receiver(post_migrate)
+def migraciones_aplicadas(sender, app_config=None, using='default', **kwargs):
+    """Deja lista la tabla FTS5 de búsqueda en SQLite"""
+    if app_config is not None and app_config.name == 'invitados':
+        busqueda.preparar_sqlite(using)
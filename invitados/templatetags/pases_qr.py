@@ -0,0 +1,11 @@
+from django import template
+
+from invitados import imagen_qr
+
+register = template.Library()
+
+
+@register.simple_tag
+def url_qr(token, formato='png'):
+    """URL versionada de la imagen del pase: {% url_qr invitado.token_qr 'svg' %}"""
+    return imagen_qr.url(token, formato)
@@ -1,3 +1,1281 @@
-from django.test import TestCase
+import asyncio
+import base64
+import bisect
+import contextlib
+import json
+import re
+import tempfile
+import threading
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.auth import AuthMiddlewareStack
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import asistencia, busqueda, contadores, en_vivo, estadisticas, imagen_qr, indice_tokens, listado, metricas, roles, series, tokens
+from .asistencia import _SQL_POSTGRES, _SQL_UPDATE, _sql
+from .models import EscaneoProcesado, EventoEscaneo, Invitado, UserProfile
+from .routing import websocket_urlpatterns
+
+
+# Caché en memoria del proceso: la de disco (FileBasedCache) es la misma que
+# usa el servidor de desarrollo y sobrevive entre corridas
+CACHES_PRUEBAS = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=CACHES_PRUEBAS)
+class PruebaTestCase(TestCase):
+    """TestCase con la caché de pruebas, vacía al empezar cada prueba"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+@override_settings(CACHES=CACHES_PRUEBAS)
+class PruebaTransactionTestCase(TransactionTestCase):
+    """TransactionTestCase con la caché de pruebas, vacía al empezar cada prueba"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+def _crear_invitado(nombre='Ana Pérez', **campos):
+    invitado = Invitado(nombre_completo=nombre, puesto_cargo='Prensa', fotografia='', **campos)
+    invitado.save()
+    return invitado
+
+
+class RegistroEntradaTests(PruebaTestCase):
+    """procesar_qr: cada pase entra exactamente una vez y cada escaneo deja una fila en la bitácora"""
+
+    def setUp(self):
+        super().setUp()
+        self.invitado = _crear_invitado()
+        indice_tokens.calentar()
+
+    def _escanear(self, datos):
+        cuerpo = datos if isinstance(datos, str) else json.dumps(datos)
+        return self.client.post('/procesar-qr/', cuerpo, content_type='application/json')
+
+    def test_entrada_una_sola_vez(self):
+        primera = self._escanear({'token_qr': self.invitado.token_qr, 'dispositivo': 'Puerta 1'}).json()
+        segunda = self._escanear({'token_qr': self.invitado.token_qr, 'dispositivo': 'Puerta 2'}).json()
+
+        self.assertTrue(primera['success'])
+        self.assertEqual(segunda['error'], 'YA_ESCANEADO')
+        self.invitado.refresh_from_db()
+        self.assertTrue(self.invitado.asistio)
+        self.assertEqual(self.invitado.escaneado_por, 'Puerta 1')
+        self.assertEqual(
+            list(EventoEscaneo.objects.order_by('id').values_list('resultado', 'dispositivo')),
+            [('aceptado', 'Puerta 1'), ('ya_escaneado', 'Puerta 2')],
+        )
+        self.assertEqual(contadores.leer(), (1, 1))
+
+    def test_token_desconocido(self):
+        # Firma válida pero de un invitado que no existe: no llega a la base de datos
+        respuesta = self._escanear({'token_qr': tokens.firmar(uuid.uuid4())}).json()
+        self.assertEqual(respuesta['error'], 'TOKEN_NO_ENCONTRADO')
+        self.assertFalse(EventoEscaneo.objects.exists())
+
+    def test_cuerpo_no_valido(self):
+        for cuerpo in ('[1]', {'token_qr': 5}, {'token_qr': ['x']}):
+            respuesta = self._escanear(cuerpo)
+            self.assertEqual(respuesta.status_code, 400)
+            self.assertEqual(respuesta.json()['error'], 'TOKEN_NO_VALIDO')
+            self.assertNotIn('attribute', respuesta.json()['message'])
+        self.assertFalse(EventoEscaneo.objects.exists())
+
+
+
+class IndiceTokensTests(PruebaTestCase):
+    """indice_tokens: sólo los tokens nuevos o cambiados mueven la marca compartida"""
+
+    def setUp(self):
+        super().setUp()
+        self.invitado = _crear_invitado()
+        indice_tokens.calentar()
+
+    @contextlib.contextmanager
+    def _otro_worker(self):
+        """Corre el bloque con el índice en memoria de otro proceso"""
+        propio = (indice_tokens._indice, indice_tokens._version)
+        indice_tokens._indice, indice_tokens._version = {}, None
+        try:
+            indice_tokens.calentar()
+            yield
+        finally:
+            indice_tokens._indice, indice_tokens._version = propio
+
+    def _marca(self):
+        return cache.get(indice_tokens.CLAVE_VERSION)
+
+    def test_edicion_sin_token_no_recarga(self):
+        marca = self._marca()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invitado.nombre_completo = 'Ana Pérez López'
+            self.invitado.save()
+            self.invitado.asistio = True
+            self.invitado.save(update_fields=['asistio'])
+        self.assertEqual(self._marca(), marca)
+        with self.assertNumQueries(0):
+            self.assertEqual(indice_tokens.buscar(self.invitado.token_qr), str(self.invitado.id))
+
+    def test_alta_agrega_la_entrada_sin_recargar(self):
+        marca = self._marca()
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = _crear_invitado('Luis Gómez')
+        self.assertEqual(self._marca(), marca + 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(indice_tokens.buscar(nuevo.token_qr), str(nuevo.id))
+            self.assertEqual(indice_tokens.buscar(self.invitado.token_qr), str(self.invitado.id))
+
+    def test_alta_en_otro_worker(self):
+        with self._otro_worker(), self.captureOnCommitCallbacks(execute=True):
+            nuevo = _crear_invitado('Luis Gómez')
+
+        # Los aciertos siguen saliendo de memoria; el token nuevo falla, la
+        # marca ya no es la de este worker y el índice se recarga una vez
+        with self.assertNumQueries(0):
+            self.assertEqual(indice_tokens.buscar(self.invitado.token_qr), str(self.invitado.id))
+        with self.assertNumQueries(1):
+            self.assertEqual(indice_tokens.buscar(nuevo.token_qr), str(nuevo.id))
+        with self.assertNumQueries(0):
+            self.assertIsNone(indice_tokens.buscar(tokens.firmar(uuid.uuid4())))
+
+    def test_marca_movida_por_otro_worker_entre_tanto(self):
+        # Otro worker subió la marca (su cambio no está en este índice): agregar
+        # sólo la entrada propia dejaría fuera la suya, así que se recarga todo
+        with self._otro_worker(), self.captureOnCommitCallbacks(execute=True):
+            ajeno = _crear_invitado('Luis Gómez')
+        with self.captureOnCommitCallbacks(execute=True):
+            propio = _crear_invitado('Eva Ruiz')
+        self.assertIsNone(indice_tokens._version)
+        with self.assertNumQueries(1):
+            self.assertEqual(indice_tokens.buscar(propio.token_qr), str(propio.id))
+        with self.assertNumQueries(0):
+            self.assertEqual(indice_tokens.buscar(ajeno.token_qr), str(ajeno.id))
+
+    def test_baja_y_token_reemitido(self):
+        marca = self._marca()
+        token = self.invitado.token_qr
+        with self.captureOnCommitCallbacks(execute=True):
+            Invitado.objects.filter(pk=self.invitado.pk).delete()
+        self.assertEqual(self._marca(), marca)
+        with self.assertNumQueries(0):
+            self.assertIsNone(indice_tokens.buscar(token))
+
+        otro = _crear_invitado('Luis Gómez')
+        indice_tokens.calentar()
+        with self.captureOnCommitCallbacks(execute=True):
+            otro.token_qr = tokens.firmar(otro.id, emitido=timezone.now().timestamp() - 60)
+            otro.save(update_fields=['token_qr'])
+        with self.assertNumQueries(0):
+            self.assertEqual(indice_tokens.buscar(otro.token_qr), str(otro.id))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'sólo Postgres registra la entrada en un CTE')
+class EntradaConcurrenteTests(PruebaTransactionTestCase):
+    """El escaneo que pierde contra otro en curso informa la hora del que ganó"""
+
+    def test_perdedor_ve_la_hora_del_ganador(self):
+        invitado = _crear_invitado()
+        ganador_hora = timezone.now() - timedelta(minutes=1)
+        bloqueada, terminado = threading.Event(), threading.Event()
+        resultados = {}
+
+        def ganador():
+            try:
+                with transaction.atomic():
+                    Invitado.objects.filter(pk=invitado.pk).update(
+                        asistio=True, fecha_hora_entrada=ganador_hora, escaneado_por='Puerta 1'
+                    )
+                    bloqueada.set()
+                    terminado.wait(5)
+            finally:
+                connection.close()
+
+        def perdedor():
+            try:
+                resultados['perdedor'] = asistencia.registrar_entrada(invitado.token_qr, 'Puerta 2')
+            finally:
+                connection.close()
+
+        hilo_ganador = threading.Thread(target=ganador)
+        hilo_ganador.start()
+        bloqueada.wait(5)
+        hilo_perdedor = threading.Thread(target=perdedor)
+        hilo_perdedor.start()
+        hilo_perdedor.join(0.5)  # esperando el bloqueo de la fila
+        terminado.set()
+        hilo_ganador.join()
+        hilo_perdedor.join()
+
+        estado, datos = resultados['perdedor']
+        self.assertEqual(estado, asistencia.YA_ESCANEADO)
+        self.assertEqual(datos['hora_entrada'], asistencia.formatear_hora(ganador_hora))
+
+
+def _ms(fecha):
+    return int(fecha.timestamp() * 1000)
+
+
+class LoteEscaneosTests(PruebaTestCase):
+    """procesar_qr_lote: orden, el escaneo más temprano gana y los reintentos no duplican"""
+
+    def setUp(self):
+        super().setUp()
+        self.ana = _crear_invitado('Ana Pérez')
+        self.luis = _crear_invitado('Luis Gómez')
+        indice_tokens.calentar()
+        self.ahora = timezone.now()
+
+    def _enviar(self, escaneos):
+        return self.client.post(
+            '/procesar-qr/lote/', json.dumps({'escaneos': escaneos}), content_type='application/json'
+        )
+
+    def test_orden_y_primero_gana(self):
+        respuesta = self._enviar([
+            {'token_qr': self.ana.token_qr, 'dispositivo': 'Puerta 2',
+             'scanned_at': _ms(self.ahora - timedelta(minutes=1))},
+            {'token_qr': self.ana.token_qr, 'dispositivo': 'Puerta 1',
+             'scanned_at': _ms(self.ahora - timedelta(minutes=3))},
+            {'token_qr': self.luis.token_qr, 'dispositivo': 'Puerta 1',
+             'scanned_at': _ms(self.ahora - timedelta(minutes=2))},
+            {'token_qr': 'no-existe' * 4},
+        ]).json()
+
+        self.assertEqual(
+            [r['resultado'] for r in respuesta['resultados']],
+            ['ya_escaneado', 'aceptado', 'aceptado', 'no_encontrado'],
+        )
+        self.assertEqual(respuesta['aceptados'], 2)
+        self.ana.refresh_from_db()
+        self.assertEqual(self.ana.escaneado_por, 'Puerta 1')
+        self.assertAlmostEqual(
+            self.ana.fecha_hora_entrada, self.ahora - timedelta(minutes=3), delta=timedelta(seconds=1)
+        )
+        self.assertEqual(EventoEscaneo.objects.count(), 3)
+
+    def test_reintento_idempotente(self):
+        escaneos = [
+            {'scan_id': 'a-1', 'token_qr': self.ana.token_qr, 'scanned_at': _ms(self.ahora)},
+            {'scan_id': 'a-1', 'token_qr': self.ana.token_qr, 'scanned_at': _ms(self.ahora)},
+            {'scan_id': 'l-1', 'token_qr': self.luis.token_qr, 'scanned_at': _ms(self.ahora)},
+        ]
+        primera = self._enviar(escaneos).json()
+        segunda = self._enviar(escaneos).json()
+
+        # El scan_id repetido dentro del lote no cuenta dos veces
+        self.assertEqual(primera['aceptados'], 2)
+        self.assertEqual(primera['resultados'], segunda['resultados'])
+        self.assertEqual(EventoEscaneo.objects.count(), 2)
+        self.assertEqual(contadores.leer(), (2, 2))
+
+    def test_datos_no_validos_no_bloquean_el_lote(self):
+        escaneos = [
+            {'scan_id': 5, 'token_qr': self.ana.token_qr, 'scanned_at': 1e20},
+            {'token_qr': 7, 'scanned_at': -1e20},
+            {'token_qr': self.luis.token_qr, 'scanned_at': _ms(self.ahora - timedelta(days=30))},
+        ]
+        respuesta = self._enviar(escaneos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            [r['resultado'] for r in respuesta.json()['resultados']], ['aceptado', 'no_encontrado', 'aceptado']
+        )
+        # Fechas imposibles o fuera de la ventana del evento: se usa la hora de llegada
+        for invitado in (self.ana, self.luis):
+            invitado.refresh_from_db()
+            self.assertGreaterEqual(invitado.fecha_hora_entrada, self.ahora)
+        self.assertFalse(EscaneoProcesado.objects.exists())
+
+
+    def test_escaneo_en_linea_reenviado_desde_la_cola(self):
+        # El service worker manda el mismo scan_id en línea y, si no hubo respuesta, desde su cola
+        en_linea = self.client.post(
+            '/procesar-qr/', json.dumps({'token_qr': self.ana.token_qr, 'scan_id': 'sw-1'}),
+            content_type='application/json',
+        ).json()
+        repetido = self.client.post(
+            '/procesar-qr/', json.dumps({'token_qr': self.ana.token_qr, 'scan_id': 'sw-1'}),
+            content_type='application/json',
+        ).json()
+        desde_cola = self._enviar([
+            {'scan_id': 'sw-1', 'token_qr': self.ana.token_qr, 'scanned_at': _ms(self.ahora)},
+        ]).json()
+
+        self.assertTrue(en_linea['success'])
+        self.assertEqual(repetido, en_linea)
+        self.assertEqual(desde_cola['resultados'][0]['resultado'], 'aceptado')
+        self.assertEqual(list(EventoEscaneo.objects.values_list('resultado', flat=True)), ['aceptado'])
+
+
+    def test_cancelado_antes_de_guardar_el_scan_id(self):
+        # La petición se corta (timeout del service worker) entre la entrada y su scan_id:
+        # la transacción se deshace entera y el reenvío desde la cola es el primer escaneo
+        cuerpo = json.dumps({'token_qr': self.ana.token_qr, 'scan_id': 'sw-2'})
+        with mock.patch.object(EscaneoProcesado.objects, 'create', side_effect=asyncio.CancelledError):
+            with self.assertRaises(asyncio.CancelledError):
+                self.client.post('/procesar-qr/', cuerpo, content_type='application/json')
+        self.assertFalse(EventoEscaneo.objects.exists())
+        self.assertFalse(Invitado.objects.get(pk=self.ana.pk).asistio)
+
+        reenviado = self._enviar([
+            {'scan_id': 'sw-2', 'token_qr': self.ana.token_qr, 'scanned_at': _ms(self.ahora)},
+        ]).json()
+        self.assertEqual(reenviado['resultados'][0]['resultado'], 'aceptado')
+        repetido = self.client.post('/procesar-qr/', cuerpo, content_type='application/json').json()
+        self.assertTrue(repetido['success'])
+        self.assertEqual(list(EventoEscaneo.objects.values_list('resultado', flat=True)), ['aceptado'])
+        self.assertEqual(contadores.leer(), (2, 1))
+
+
+class MetricasTests(PruebaTestCase):
+    """metricas: Server-Timing por etapa, sin anidar, e histogramas por vista"""
+
+    def setUp(self):
+        super().setUp()
+        metricas.reiniciar()
+        self.invitado = _crear_invitado()
+        indice_tokens.calentar()
+
+    def _etapas(self, respuesta):
+        return [medida.split(';')[0] for medida in respuesta['Server-Timing'].split(', ')]
+
+    def test_server_timing(self):
+        respuesta = self.client.post(
+            '/procesar-qr/', json.dumps({'token_qr': self.invitado.token_qr}), content_type='application/json'
+        )
+        self.assertEqual(self._etapas(respuesta), ['json', 'verificacion', 'indice', 'update', 'respuesta', 'total'])
+        self.assertRegex(respuesta['Server-Timing'], r'^(\w+;dur=\d+\.\d{3})(, \w+;dur=\d+\.\d{3})*$')
+
+        # Un error de formato responde después de cerrar 'json', no dentro de ella
+        respuesta = self.client.post('/procesar-qr/', '[1]', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self._etapas(respuesta), ['json', 'respuesta', 'total'])
+
+        etapas = metricas.resumen()['etapas']
+        self.assertEqual(etapas['procesar_qr.total']['cuenta'], 2)
+        self.assertEqual(etapas['procesar_qr.json']['cuenta'], 2)
+        self.assertEqual(etapas['procesar_qr.update']['cuenta'], 1)
+
+    def test_histograma(self):
+        histograma = metricas.Histograma()
+        for micros in [5] + [100] * 94 + [1_000] * 4 + [50_000]:
+            histograma.agregar(micros)
+        # Cada duración cae en el primer bucket cuyo límite la alcanza
+        self.assertEqual(histograma.buckets[0], 1)
+        self.assertEqual(histograma.buckets[bisect.bisect_left(metricas._LIMITES, 100)], 94)
+        self.assertEqual(sum(histograma.buckets), 100)
+        # El percentil es la cota superior de su bucket (20% de error como máximo)
+        self.assertEqual(histograma.percentil(0.5), histograma.percentil(0.95))
+        self.assertTrue(100 <= histograma.percentil(0.5) < 120)
+        self.assertTrue(1_000 <= histograma.percentil(0.99) < 1_200)
+        self.assertEqual(histograma.percentil(1.0), 50_000)
+        self.assertEqual(histograma.resumen()['max_ms'], 50.0)
+        self.assertEqual(metricas.Histograma().resumen()['p99_ms'], 0.0)
+
+
+class BitacoraEscaneosTests(PruebaTestCase):
+    """EventoEscaneo: cada acción agrega una fila y ninguna modifica las anteriores"""
+
+    def setUp(self):
+        super().setUp()
+        self.invitado = _crear_invitado()
+        self.usuario = User.objects.create_user('registro', password='x')
+
+    def _bitacora(self):
+        return list(EventoEscaneo.objects.order_by('id').values_list('id', 'resultado', 'dispositivo', 'fecha'))
+
+    def test_una_fila_por_accion(self):
+        self.assertTrue(self.invitado.marcar_asistencia('Mesa', usuario=self.usuario))
+        self.assertFalse(self.invitado.marcar_asistencia('Mesa', usuario=self.usuario))
+        despues_de_marcar = self._bitacora()
+
+        self.assertTrue(self.invitado.desmarcar_asistencia('Mesa', usuario=self.usuario))
+        self.assertFalse(self.invitado.desmarcar_asistencia('Mesa', usuario=self.usuario))
+        despues_de_desmarcar = self._bitacora()
+
+        self.assertEqual(asistencia.registrar_entrada(self.invitado.token_qr, 'Puerta 1')[0], asistencia.ACEPTADO)
+        self.assertEqual(asistencia.registrar_entrada(self.invitado.token_qr, 'Puerta 2')[0], asistencia.YA_ESCANEADO)
+        bitacora = self._bitacora()
+
+        # Las filas anteriores quedan tal cual; sólo se agregan nuevas al final
+        self.assertEqual(bitacora[:len(despues_de_desmarcar)], despues_de_desmarcar)
+        self.assertEqual(despues_de_desmarcar[:len(despues_de_marcar)], despues_de_marcar)
+        self.assertEqual(
+            [(resultado, dispositivo) for _, resultado, dispositivo, _ in bitacora],
+            [('manual', 'Mesa'), ('desmarcado', 'Mesa'), ('aceptado', 'Puerta 1'), ('ya_escaneado', 'Puerta 2')],
+        )
+        self.assertEqual(
+            list(EventoEscaneo.objects.filter(resultado__in=['manual', 'desmarcado'])
+                 .values_list('usuario_id', flat=True)),
+            [self.usuario.id, self.usuario.id],
+        )
+        self.assertEqual(set(EventoEscaneo.objects.values_list('invitado_id', flat=True)), {self.invitado.id})
+
+    def test_admin_solo_lectura(self):
+        self.invitado.marcar_asistencia('Mesa', usuario=self.usuario)
+        self.client.force_login(User.objects.create_superuser('raiz', password='x'))
+        evento = EventoEscaneo.objects.get()
+        self.assertContains(self.client.get('/admin/invitados/eventoescaneo/'), 'Mesa')
+        self.assertEqual(self.client.get('/admin/invitados/eventoescaneo/add/').status_code, 403)
+        self.assertEqual(
+            self.client.post(f'/admin/invitados/eventoescaneo/{evento.pk}/delete/', {'post': 'yes'}).status_code, 403
+        )
+        self.assertTrue(EventoEscaneo.objects.filter(pk=evento.pk).exists())
+
+
+class ContadoresTests(PruebaTestCase):
+    """contadores.leer() coincide con COUNT(*) después de entradas, desmarcados y bajas"""
+
+    def setUp(self):
+        super().setUp()
+        self.invitados = [_crear_invitado(f'Invitado {n}') for n in range(3)]
+
+    def _revisar(self):
+        self.assertEqual(
+            contadores.leer(),
+            (Invitado.objects.count(), Invitado.objects.filter(asistio=True).count()),
+        )
+
+    def test_entrada_desmarcado_y_baja(self):
+        primero, segundo, tercero = self.invitados
+        self._revisar()
+
+        asistencia.registrar_entrada(primero.token_qr, 'Puerta 1')
+        asistencia.registrar_entrada(segundo.token_qr, 'Puerta 1')
+        self._revisar()
+        self.assertEqual(contadores.leer(), (3, 2))
+
+        Invitado.objects.get(pk=segundo.pk).desmarcar_asistencia('Mesa')
+        self._revisar()
+
+        # Instancia cargada antes de la entrada: la baja descuenta lo que hay en la base
+        asistencia.registrar_entrada(tercero.token_qr, 'Puerta 2')
+        tercero.delete()
+        self._revisar()
+        Invitado.objects.filter(pk=primero.pk).delete()
+        self._revisar()
+        self.assertEqual(contadores.leer(), (1, 0))
+
+    def test_guardar_instancia_desactualizada(self):
+        invitado = self.invitados[0]
+        asistencia.registrar_entrada(invitado.token_qr, 'Puerta 1')
+
+        # Edición desde el admin con datos de antes del escaneo
+        invitado.asistio = True
+        invitado.save()
+        self._revisar()
+        invitado.asistio = False
+        invitado.save(update_fields=['asistio'])
+        self._revisar()
+        self.assertEqual(contadores.leer(), (3, 0))
+
+    def test_reconciliar(self):
+        asistencia.registrar_entrada(self.invitados[0].token_qr, 'Puerta 1')
+        Invitado.objects.filter(pk=self.invitados[1].pk).update(asistio=True)  # sin pasar por los contadores
+        self.assertEqual(contadores.leer(), (3, 1))
+        self.assertEqual(contadores.reconciliar(), (3, 2))
+        self._revisar()
+
+
+class TokensFirmadosTests(PruebaTestCase):
+    """tokens.verificar: firma, evento, vigencia y pases uuid antiguos, sin base de datos"""
+
+    def setUp(self):
+        super().setUp()
+        self.invitado_id = uuid.uuid4()
+
+    def test_firmado(self):
+        token = tokens.firmar(self.invitado_id)
+        self.assertEqual(len(token), tokens.LONGITUD)
+        with self.assertNumQueries(0):
+            self.assertEqual(tokens.verificar(token), tokens.FIRMADO)
+
+    def test_falsificado(self):
+        token = tokens.firmar(self.invitado_id)
+        otro = 'A' if token[10] != 'A' else 'B'
+        self.assertEqual(tokens.verificar(token[:10] + otro + token[11:]), tokens.FALSIFICADO)
+        self.assertEqual(tokens.verificar('1' + '!' * (tokens.LONGITUD - 1)), tokens.FALSIFICADO)
+        with override_settings(QR_SECRET_KEY='otra-clave'):
+            self.assertEqual(tokens.verificar(token), tokens.FALSIFICADO)
+        # Emitido en el futuro (más allá de la tolerancia del reloj)
+        futuro = tokens.firmar(self.invitado_id, emitido=timezone.now().timestamp() + 3600)
+        self.assertEqual(tokens.verificar(futuro), tokens.FALSIFICADO)
+
+    def test_otro_evento_o_vencido(self):
+        with override_settings(EVENTO_ID=2):
+            de_otro_evento = tokens.firmar(self.invitado_id)
+        self.assertEqual(tokens.verificar(de_otro_evento), tokens.VENCIDO)
+
+        viejo = tokens.firmar(self.invitado_id, emitido=1_000)
+        with override_settings(QR_EMITIDOS_DESDE=2_000):
+            self.assertEqual(tokens.verificar(viejo), tokens.VENCIDO)
+
+    def test_legados(self):
+        legado = str(uuid.uuid4())
+        with override_settings(QR_ACEPTAR_TOKENS_LEGADOS=True):
+            self.assertEqual(tokens.verificar(legado), tokens.LEGADO)
+        with override_settings(QR_ACEPTAR_TOKENS_LEGADOS=False):
+            self.assertEqual(tokens.verificar(legado), tokens.FALSIFICADO)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReemitirQrTests(PruebaTestCase):
+    """reemitir_qr: firma sólo los pases pendientes, por lotes"""
+
+    def test_reemite_pendientes_por_lotes(self):
+        firmados = [_crear_invitado(f'Firmado {n}') for n in range(2)]
+        legados = [_crear_invitado(f'Legado {n}') for n in range(5)]
+        for invitado in legados:
+            Invitado.objects.filter(pk=invitado.pk).update(token_qr=str(uuid.uuid4()))
+        antes = dict(Invitado.objects.values_list('id', 'token_qr'))
+
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('reemitir_qr', lote=2, stdout=StringIO())
+
+        despues = dict(Invitado.objects.values_list('id', 'token_qr'))
+        for invitado in firmados:
+            self.assertEqual(despues[invitado.id], antes[invitado.id])
+        for invitado in legados:
+            self.assertEqual(tokens.verificar(despues[invitado.id]), tokens.FIRMADO)
+        # Ningún IN con más ids que el lote
+        listas = [
+            re.search(r' IN \(([^)]*)\)', c['sql']).group(1)
+            for c in consultas if c['sql'].startswith('SELECT') and ' IN (' in c['sql']
+        ]
+        self.assertEqual([lista.count(',') + 1 for lista in listas], [2, 2, 1])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GenerarQrTests(PruebaTransactionTestCase):
+    """generar_qr: escribe en varios procesos los PNG que faltan y no rehace los que ya existen"""
+
+    def test_escribe_y_salta_existentes(self):
+        from django.core.files.base import ContentFile
+
+        invitados = [_crear_invitado(f'Invitado {n}') for n in range(5)]
+        storage = Invitado._meta.get_field('qr_imagen').storage
+        # El PNG del primero ya está en media: no se vuelve a escribir
+        existente = imagen_qr.nombre_archivo(invitados[0].token_qr)
+        storage.save(existente, ContentFile(b'ya estaba'))
+
+        call_command('generar_qr', procesos=2, lote=2, stdout=StringIO())
+
+        for invitado in invitados:
+            invitado.refresh_from_db()
+            self.assertTrue(invitado.qr_generado)
+            self.assertEqual(invitado.qr_imagen.name, imagen_qr.nombre_archivo(invitado.token_qr))
+        self.assertEqual(len(storage.listdir(imagen_qr.CARPETA)[1]), 5)
+        with storage.open(existente, 'rb') as archivo:
+            self.assertEqual(archivo.read(), b'ya estaba')
+        with storage.open(invitados[1].qr_imagen.name, 'rb') as archivo:
+            self.assertTrue(archivo.read().startswith(b'\x89PNG'))
+
+        salida = StringIO()
+        call_command('generar_qr', procesos=2, stdout=salida)
+        self.assertIn('No hay QR por generar', salida.getvalue())
+
+        # Con --todos se recorren de nuevo, pero ningún archivo se vuelve a dibujar
+        with mock.patch.object(imagen_qr, 'renderizar_png') as renderizar:
+            call_command('generar_qr', todos=True, procesos=1, stdout=StringIO())
+        renderizar.assert_not_called()
+        self.assertEqual(len(storage.listdir(imagen_qr.CARPETA)[1]), 5)
+
+
+class EstadisticasTests(PruebaTestCase):
+    """/estadisticas/: ETag por versión, 304 sin base de datos y versión nueva con cada entrada"""
+
+    def setUp(self):
+        super().setUp()
+        self.invitado = _crear_invitado()
+        indice_tokens.calentar()
+
+    def test_etag_y_304(self):
+        primera = self.client.get('/estadisticas/')
+        etag = primera['ETag']
+        self.assertEqual(primera.json()['total_asistentes'], 0)
+        self.assertEqual(primera['Cache-Control'], 'no-cache')
+
+        with self.assertNumQueries(0):
+            vigente = self.client.get('/estadisticas/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(vigente.status_code, 304)
+        self.assertEqual(vigente.content, b'')
+        self.assertEqual(vigente['ETag'], etag)
+        # Lista de ETags, como la manda un proxy
+        self.assertEqual(self.client.get('/estadisticas/', HTTP_IF_NONE_MATCH=f'"otro", {etag}').status_code, 304)
+
+    def test_etag_cambia_con_una_entrada(self):
+        etag = self.client.get('/estadisticas/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/procesar-qr/', json.dumps({'token_qr': self.invitado.token_qr}), content_type='application/json'
+            )
+
+        respuesta = self.client.get('/estadisticas/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        datos = respuesta.json()
+        self.assertEqual((datos['total_invitados'], datos['total_asistentes']), (1, 1))
+        self.assertEqual([llegada['nombre'] for llegada in datos['ultimas_llegadas']], ['Ana Pérez'])
+        self.assertEqual(estadisticas.etag(datos['version']), respuesta['ETag'])
+
+        # Sin cambios, la instantánea nueva se reutiliza
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/estadisticas/').json(), datos)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AvisosEnVivoTests(PruebaTransactionTestCase):
+    """
+    /ws/asistencia/: sólo con sesión, y cada entrada confirmada llega a los conectados.
+
+    Con transacciones reales: database_sync_to_async() de Channels cierra la
+    conexión si la encuentra dentro de un atomic(), como el de TestCase.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.invitado = _crear_invitado()
+        indice_tokens.calentar()
+        self.aplicacion = AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+
+    async def _conectar(self, usuario=None):
+        encabezados = []
+        if usuario is not None:
+            await sync_to_async(self.client.force_login)(usuario)
+            sesion = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+            encabezados.append((b'cookie', f'{settings.SESSION_COOKIE_NAME}={sesion}'.encode()))
+        cliente = WebsocketCommunicator(self.aplicacion, '/ws/asistencia/', headers=encabezados)
+        conectado, _ = await cliente.connect()
+        return cliente, conectado
+
+    async def test_sin_sesion_se_rechaza(self):
+        cliente, conectado = await self._conectar()
+        self.assertFalse(conectado)
+        await cliente.disconnect()
+
+    async def test_entrada_llega_al_panel(self):
+        usuario = await User.objects.acreate_user('panel', password='x')
+        panel, conectado = await self._conectar(usuario)
+        self.assertTrue(conectado)
+
+        escanear = sync_to_async(asistencia.registrar_entrada)
+        await escanear(self.invitado.token_qr, 'Puerta 1')
+        avisos = [await panel.receive_json_from(timeout=2) for _ in range(2)]
+        entrada = next(aviso for aviso in avisos if aviso['tipo'] == 'entrada')
+        self.assertEqual(entrada['resultado'], 'aceptado')
+        self.assertEqual(entrada['invitado']['id'], str(self.invitado.id))
+        self.assertEqual(entrada['invitado']['nombre'], 'Ana Pérez')
+        self.assertIn('estadisticas', [aviso['tipo'] for aviso in avisos])
+
+        # Un escaneo repetido no cambia nada: no hay aviso
+        await escanear(self.invitado.token_qr, 'Puerta 2')
+        self.assertTrue(await panel.receive_nothing(timeout=0.2))
+
+        # Al desconectarse deja el grupo
+        await panel.disconnect()
+        capa = get_channel_layer()
+        self.assertFalse(capa.groups.get(en_vivo.GRUPO))
+
+    def test_aviso_fallido_no_tumba_el_registro(self):
+        capa = mock.Mock(group_send=mock.AsyncMock(side_effect=ConnectionError('redis caído')))
+        with mock.patch.object(en_vivo, 'get_channel_layer', return_value=capa), \
+                self.assertLogs('invitados.en_vivo', 'WARNING') as registros:
+            en_vivo.enviar('entrada', invitado={'id': '1'})
+        self.assertIn("'entrada'", registros.output[0])
+
+
+class RolesTests(PruebaTestCase):
+    """roles: el rol se resuelve una vez, se lee de la caché y se olvida al cambiar el perfil"""
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('registro', password='x')
+
+    def _consultas_de_perfil(self, consultas):
+        tabla = UserProfile._meta.db_table
+        return [c['sql'] for c in consultas if tabla in c['sql']]
+
+    def test_resuelto_una_vez(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(roles.obtener_rol(AnonymousUser()))
+        # Sin perfil: se crea con el rol por defecto
+        self.assertEqual(roles.obtener_rol(self.usuario), roles.ROL_POR_DEFECTO)
+        self.assertEqual(UserProfile.objects.get(user=self.usuario).rol, roles.ROL_POR_DEFECTO)
+        with self.assertNumQueries(0):
+            self.assertEqual(roles.obtener_rol(self.usuario), roles.ROL_POR_DEFECTO)
+
+    def test_cambio_de_perfil(self):
+        roles.obtener_rol(self.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.filter(user=self.usuario).update(rol='admin')  # sin señales
+        self.assertEqual(roles.obtener_rol(self.usuario), roles.ROL_POR_DEFECTO)
+
+        perfil = UserProfile.objects.get(user=self.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            perfil.rol = 'escaneo'
+            perfil.save()
+        self.assertEqual(roles.obtener_rol(self.usuario), 'escaneo')
+        with self.captureOnCommitCallbacks(execute=True):
+            perfil.delete()
+        self.assertEqual(roles.obtener_rol(self.usuario), roles.ROL_POR_DEFECTO)
+
+    def test_middleware_sin_consultas_de_perfil(self):
+        # Iniciar sesión resuelve el rol; las peticiones siguientes lo leen de la caché
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertTrue(self.client.login(username='registro', password='x'))
+        self.assertTrue(self._consultas_de_perfil(consultas))
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.client.get('/invitados/api/').status_code, 200)
+            self.assertEqual(self.client.get('/').context['user_role'], 'registro')
+        self.assertEqual(self._consultas_de_perfil(consultas), [])
+
+        # Rol no permitido: de vuelta al dashboard; cambiarlo vale desde la siguiente petición
+        self.assertRedirects(self.client.get('/metricas/latencia/'), '/', fetch_redirect_response=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.update_or_create(user=self.usuario, defaults={'rol': 'admin'})
+        self.assertEqual(self.client.get('/metricas/latencia/').status_code, 200)
+
+
+class LlegadasTests(PruebaTestCase):
+    """/llegadas/: páginas por cursor sin saltar ni repetir eventos"""
+
+    def setUp(self):
+        super().setUp()
+        self.invitados = [_crear_invitado(f'Invitado {n}') for n in range(5)]
+        self.client.force_login(User.objects.create_user('monitor', password='x'))
+
+    def _llegadas(self, **parametros):
+        return self.client.get('/llegadas/', parametros).json()
+
+    def test_paginas_por_cursor(self):
+        for invitado in self.invitados[:3]:
+            asistencia.registrar_entrada(invitado.token_qr, 'Puerta 1')
+        inicio = self._llegadas(limite=2)
+        # Primera carga: las más recientes, en orden cronológico
+        self.assertEqual([l['invitado']['nombre'] for l in inicio['llegadas']], ['Invitado 1', 'Invitado 2'])
+        self.assertFalse(inicio['hay_mas'])
+        self.assertEqual(inicio['cursor'], inicio['llegadas'][-1]['cursor'])
+
+        asistencia.registrar_entrada(self.invitados[0].token_qr, 'Puerta 2')  # ya_escaneado: no cuenta
+        for invitado in self.invitados[3:]:
+            asistencia.registrar_entrada(invitado.token_qr, 'Puerta 1')
+        self.invitados[0].desmarcar_asistencia('Mesa')
+
+        vistos, cursor, paginas = [], inicio['cursor'], 0
+        while True:
+            pagina = self._llegadas(desde=cursor, limite=2)
+            paginas += 1
+            vistos += [(l['resultado'], l['invitado']['nombre']) for l in pagina['llegadas']]
+            self.assertTrue(all(l['cursor'] > cursor for l in pagina['llegadas']))
+            cursor = pagina['cursor']
+            if not pagina['hay_mas']:
+                break
+        self.assertEqual(paginas, 2)
+        self.assertEqual(vistos, [
+            ('aceptado', 'Invitado 3'), ('aceptado', 'Invitado 4'), ('desmarcado', 'Invitado 0'),
+        ])
+
+        # Al día: lista vacía y el mismo cursor
+        self.assertEqual(self._llegadas(desde=cursor), {
+            'success': True, 'cursor': cursor, 'hay_mas': False, 'llegadas': [],
+        })
+
+    def test_parametros_no_validos(self):
+        for parametros in ({'desde': 'x'}, {'limite': '1.5'}):
+            respuesta = self.client.get('/llegadas/', parametros)
+            self.assertEqual(respuesta.status_code, 400)
+            self.assertEqual(respuesta.json()['error'], 'PARAMETROS_NO_VALIDOS')
+
+
+class SerieLlegadasTests(PruebaTestCase):
+    """series: entradas por minuto y puerta agrupadas en intervalos de 1, 5 y 15 minutos"""
+
+    AHORA = datetime(2026, 3, 1, 12, 7, 30, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.invitados = [_crear_invitado(f'Invitado {n}') for n in range(3)]
+        reloj = mock.patch('django.utils.timezone.now', return_value=self.AHORA)
+        reloj.start()
+        self.addCleanup(reloj.stop)
+
+    def _puntos(self, intervalo):
+        return {punto['inicio']: (punto['total'], punto['por_puerta']) for punto in series.leer(intervalo)['puntos']}
+
+    def test_cubetas(self):
+        # Entradas reales (escaneo y manual) y sumas directas a la serie
+        asistencia.registrar_entrada(self.invitados[0].token_qr, 'Puerta 2', fecha=self.AHORA - timedelta(minutes=1))
+        asistencia.registrar_entrada(self.invitados[0].token_qr, 'Puerta 1')  # ya escaneado: no suma
+        self.invitados[1].marcar_asistencia('Puerta 1')
+        series.registrar(datetime(2026, 3, 1, 12, 4, 59, tzinfo=dt_timezone.utc), 'Puerta 1', cantidad=2)
+        series.registrar(datetime(2026, 3, 1, 11, 0, tzinfo=dt_timezone.utc), 'Puerta 1')
+        series.registrar(datetime(2026, 3, 1, 3, 0, tzinfo=dt_timezone.utc), 'Puerta 1')
+
+        por_minuto = series.leer(1)
+        self.assertEqual(por_minuto['puertas'], ['Puerta 1', 'Puerta 2'])
+        self.assertEqual(len(por_minuto['puntos']), 120)
+        self.assertEqual(
+            [(p['inicio'], p['total']) for p in por_minuto['puntos'][-4:]],
+            [('2026-03-01T12:04:00+00:00', 2), ('2026-03-01T12:05:00+00:00', 0),
+             ('2026-03-01T12:06:00+00:00', 1), ('2026-03-01T12:07:00+00:00', 1)],
+        )
+
+        cada_5 = self._puntos(5)
+        self.assertEqual(len(cada_5), 96)
+        self.assertEqual(cada_5['2026-03-01T12:05:00+00:00'], (2, {'Puerta 1': 1, 'Puerta 2': 1}))
+        self.assertEqual(cada_5['2026-03-01T12:00:00+00:00'], (2, {'Puerta 1': 2}))
+        self.assertEqual(cada_5['2026-03-01T11:00:00+00:00'], (1, {'Puerta 1': 1}))
+        # La de las 3:00 queda fuera de la ventana de 8 horas
+        self.assertEqual(sum(total for total, _ in cada_5.values()), 5)
+
+        cada_15 = self._puntos(15)
+        self.assertEqual(len(cada_15), 96)
+        self.assertEqual(max(cada_15), '2026-03-01T12:00:00+00:00')
+        self.assertEqual(cada_15['2026-03-01T12:00:00+00:00'], (4, {'Puerta 1': 3, 'Puerta 2': 1}))
+        self.assertEqual(cada_15['2026-03-01T03:00:00+00:00'], (1, {'Puerta 1': 1}))
+        self.assertEqual(sum(total for total, _ in cada_15.values()), 6)
+
+    def test_intervalo_no_valido(self):
+        self.client.force_login(User.objects.create_user('monitor', password='x'))
+        self.assertEqual(self.client.get('/estadisticas/serie/', {'intervalo': 5}).json()['intervalo'], 5)
+        respuesta = self.client.get('/estadisticas/serie/', {'intervalo': 7})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['error'], 'INTERVALO_NO_VALIDO')
+
+
+class ListaPaginadaTests(PruebaTestCase):
+    """/invitados/api/: el cursor recorre todos los invitados una vez, con nombres repetidos"""
+
+    def setUp(self):
+        super().setUp()
+        # Nombres repetidos: el desempate es el id
+        self.invitados = [_crear_invitado(f'Invitado {n % 4}') for n in range(11)]
+        usuario = User.objects.create_user('registro', password='x')
+        UserProfile.objects.update_or_create(user=usuario, defaults={'rol': 'registro'})
+        self.client.force_login(usuario)
+
+    def _pagina(self, **parametros):
+        return self.client.get('/invitados/api/', parametros)
+
+    def test_recorre_todo(self):
+        vistos, despues = [], None
+        while True:
+            datos = self._pagina(limite=3, **({'despues': despues} if despues else {})).json()
+            vistos += [invitado['id'] for invitado in datos['invitados']]
+            despues = datos['siguiente']
+            if not despues:
+                break
+        esperados = sorted(self.invitados, key=lambda invitado: (invitado.nombre_completo, invitado.id))
+        self.assertEqual(vistos, [str(invitado.id) for invitado in esperados])
+
+    def test_cursor_no_valido(self):
+        def cursor(valor):
+            return base64.urlsafe_b64encode(json.dumps(valor).encode()).decode().rstrip('=')
+
+        for despues in ('%%%', 'ñ', cursor(5), cursor(['Ana', 5]), cursor(['Ana', None]),
+                        cursor([['Ana'], str(uuid.uuid4())]), cursor(['Ana', 'x'])):
+            respuesta = self._pagina(despues=despues)
+            self.assertEqual(respuesta.status_code, 400, despues)
+            self.assertEqual(respuesta.json()['error'], 'PARAMETROS_NO_VALIDOS')
+
+
+class BusquedaTests(PruebaTestCase):
+    """busqueda: sin acentos, por fragmentos, y al día con altas, cambios y bajas"""
+
+    def setUp(self):
+        super().setUp()
+        self.maria = _crear_invitado('María López Gutiérrez')
+        self.jose = _crear_invitado('José Núñez')
+        self.luis = _crear_invitado('Luis Gómez')
+
+    def _buscar(self, texto):
+        return {str(invitado_id).replace('-', '') for invitado_id in busqueda.ids_por_relevancia(texto)}
+
+    def _filtrar(self, texto):
+        return {invitado.nombre_completo for invitado in busqueda.filtrar(Invitado.objects.all(), texto)}
+
+    def _id(self, invitado):
+        return invitado.id.hex
+
+    def test_altas_cambios_y_bajas(self):
+        self.assertEqual(self._buscar('lopez gutierrez'), {self._id(self.maria)})
+        self.assertEqual(self._filtrar('NUÑEZ'), {'José Núñez'})
+
+        self.jose.nombre_completo = 'José Ramírez'
+        self.jose.save()
+        self.assertEqual(self._filtrar('nunez'), set())
+        self.assertEqual(self._buscar('ramirez'), {self._id(self.jose)})
+
+        self.luis.delete()
+        self.assertEqual(self._buscar('gomez'), set())
+        self.assertEqual(self._filtrar('prensa'), {'María López Gutiérrez', 'José Ramírez'})
+
+    @skipUnless(connection.vendor == 'sqlite', 'tabla FTS5 de SQLite')
+    def test_rowids_renumerados(self):
+        # VACUUM puede renumerar el rowid implícito de la tabla de invitados (su llave es un uuid)
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {Invitado._meta.db_table} SET rowid = rowid + 1000')
+        self.assertEqual(self._buscar('lopez'), {self._id(self.maria)})
+        self.assertEqual(self._filtrar('gomez'), {'Luis Gómez'})
+
+        # Y las tablas se reconstruyen igual después de migrate
+        busqueda.preparar_sqlite()
+        self.assertEqual(self._buscar('nunez'), {self._id(self.jose)})
+
+
+class PlanesDeConsultaTests(PruebaTestCase):
+    """Las consultas de las vistas deben resolverse con índices, sin recorrer ni ordenar la tabla"""
+
+    TOTAL = 50_000
+
+    @classmethod
+    def setUpTestData(cls):
+        ahora = timezone.now()
+        invitados = []
+        for i in range(cls.TOTAL):
+            asistio = i % 3 == 0
+            nombre = f'Invitado {uuid.uuid4().hex[:12]}'
+            invitados.append(Invitado(
+                nombre_completo=nombre,
+                puesto_cargo='Plan',
+                busqueda_normalizada=busqueda.texto_de(nombre, 'Plan'),
+                fotografia='',
+                token_qr=uuid.uuid4().hex,
+                asistio=asistio,
+                fecha_hora_entrada=ahora - timedelta(seconds=i) if asistio else None,
+                escaneado_por='Puerta 1' if asistio else '',
+            ))
+        Invitado.objects.bulk_create(invitados, batch_size=5000)
+        cls.token = invitados[-1].token_qr
+        cls.ultimo = invitados[-1]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _revisar(self, plan, tabla=Invitado._meta.db_table, ordenar=True, buscar=False):
+        """
+        Sin recorridos completos ni ordenamientos. Con ``buscar`` la consulta debe
+        entrar al índice por una condición (búsqueda puntual o rango), no
+        recorrerlo entero desde el principio.
+        """
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {tabla}', plan, plan)
+            if ordenar:
+                self.assertIsNone(re.search(r'^\s*(->\s*)?(Incremental )?Sort\b', plan, re.M), plan)
+            if buscar:
+                self.assertIn('Index Cond', plan, plan)
+        else:
+            # SQLite: "SCAN tabla" sin "USING ... INDEX" es un recorrido completo
+            self.assertIsNone(re.search(rf'SCAN {tabla}\b(?!.*INDEX)', plan), plan)
+            if ordenar:
+                self.assertNotIn('TEMP B-TREE', plan, plan)
+            if buscar:
+                # "SCAN tabla USING INDEX" recorre el índice completo; "SEARCH" entra por la condición
+                self.assertIsNone(re.search(rf'\bSCAN {tabla}\b', plan), plan)
+                self.assertRegex(plan, rf'\bSEARCH {tabla}\b')
+
+    def _explicar_sql(self, sql, params):
+        prefijo = 'EXPLAIN' if connection.vendor == 'postgresql' else 'EXPLAIN QUERY PLAN'
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefijo} {sql}', params)
+            return '\n'.join(' '.join(str(columna) for columna in fila) for fila in cursor.fetchall())
+
+    def test_ultimas_llegadas(self):
+        # panel_control (10) y /estadisticas/ (5)
+        for limite in (10, 5):
+            consulta = Invitado.objects.filter(asistio=True).order_by('-fecha_hora_entrada')[:limite]
+            self._revisar(consulta.explain())
+
+    def test_pendientes(self):
+        # panel_control: primeros 15 pendientes por nombre
+        consulta = Invitado.objects.filter(asistio=False).order_by('nombre_completo')[:15]
+        self._revisar(consulta.explain())
+
+    def test_registrados_recientes(self):
+        # dashboard y crear_invitado
+        consulta = Invitado.objects.order_by('-fecha_creacion')[:3]
+        self._revisar(consulta.explain())
+
+    def test_busqueda_por_token(self):
+        # mostrar_qr: get_object_or_404() quita el orden por defecto
+        self._revisar(Invitado.objects.filter(token_qr=self.token).order_by().explain(), buscar=True)
+
+    def test_lista_paginada(self):
+        # lista_invitados: primera página y una página intermedia por cursor
+        _, siguiente = listado.pagina()
+        consulta = listado.despues_de(listado.consulta(), siguiente)[:listado.TAM_PAGINA + 1]
+        self._revisar(listado.consulta()[:listado.TAM_PAGINA + 1].explain())
+        self._revisar(consulta.explain(), buscar=True)
+
+    def test_busqueda(self):
+        # buscar_invitados y el filtro de la lista: índice de trigramas (Postgres) o FTS5 (SQLite)
+        if connection.vendor == 'postgresql' and not busqueda._hay_trigramas():
+            self.skipTest('pg_trgm no está instalado')
+        fragmento = self.ultimo.nombre_completo[-8:].upper()
+        self._revisar(busqueda.filtrar(Invitado.objects.order_by(), fragmento).explain())
+        with CaptureQueriesContext(connection) as consultas:
+            ids = busqueda.ids_por_relevancia(fragmento)
+        self.assertEqual(uuid.UUID(str(ids[0])), self.ultimo.id)
+        self._revisar(self._explicar_sql(consultas[-1]['sql'], None), ordenar=False)
+
+    def test_registro_de_entrada(self):
+        # procesar_qr: el UPDATE condicional sólo toca la fila del token
+        ahora = timezone.now()
+        if connection.vendor == 'postgresql':
+            plan = self._explicar_sql(
+                _sql(_SQL_POSTGRES), [ahora, 'Puerta', self.token, self.token, 'Puerta', ahora, 0]
+            )
+        else:
+            plan = self._explicar_sql(_sql(_SQL_UPDATE), [ahora, 'Puerta', self.token])
+        self._revisar(plan, ordenar=False, buscar=True)
+
+
+class PanelControlTests(PruebaTestCase):
+    """panel_control y demás vistas de lectura: columnas justas y límites en SQL"""
+
+    PENDIENTES = 5000
+    # Con el queryset completo (todas las columnas de todos los pendientes) el pico pasaba de 6 MiB
+    MAX_MEMORIA = 2 * 1024 * 1024
+
+    @classmethod
+    def setUpTestData(cls):
+        ahora = timezone.now()
+        Invitado.objects.bulk_create([
+            Invitado(
+                nombre_completo=f'Invitado {i:05d}',
+                puesto_cargo='Panel',
+                fotografia='',
+                token_qr=uuid.uuid4().hex,
+                asistio=i < 20,
+                fecha_hora_entrada=ahora - timedelta(seconds=i) if i < 20 else None,
+            )
+            for i in range(cls.PENDIENTES + 20)
+        ], batch_size=2000)
+        contadores.reconciliar()
+        cls.usuario = User.objects.create_user('panel', password='panel12345')
+
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.update_or_create(user=self.usuario, defaults={'rol': 'admin'})
+        self.client.force_login(self.usuario)
+        self.client.get('/panel/')
+
+    def _consultas_de_invitados(self, consultas):
+        tabla = f'"{Invitado._meta.db_table}"'
+        return [c['sql'] for c in consultas if f'FROM {tabla}' in c['sql']]
+
+    def test_consultas_panel(self):
+        # Sesión, usuario, contadores, cursor del feed, últimas llegadas y pendientes
+        with self.assertNumQueries(6) as consultas:
+            respuesta = self.client.get('/panel/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.context['no_asistentes']), 15)
+        self.assertEqual(respuesta.context['no_asistentes_restantes'], self.PENDIENTES - 15)
+
+        invitados = self._consultas_de_invitados(consultas)
+        self.assertEqual(len(invitados), 2)
+        for sql in invitados:
+            self.assertIn('LIMIT', sql)
+            self.assertNotIn('qr_imagen', sql)
+            self.assertNotIn('token_qr', sql)
+
+    def test_memoria_panel(self):
+        tracemalloc.start()
+        try:
+            self.client.get('/panel/')
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(pico, self.MAX_MEMORIA)
+
+    def test_consultas_estadisticas_y_llegadas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            estadisticas._construir()
+        invitados = self._consultas_de_invitados(consultas)
+        self.assertEqual(len(invitados), 1)
+        self.assertIn('LIMIT', invitados[0])
+        self.assertNotIn('token_qr', invitados[0])
+
+        # El feed trae el invitado en la misma consulta (select_related) y sólo sus columnas visibles
+        invitado = Invitado.objects.filter(asistio=False).first()
+        invitado.marcar_asistencia('Puerta 1')
+        with self.assertNumQueries(3) as consultas:
+            self.assertEqual(len(self.client.get('/llegadas/').json()['llegadas']), 1)
+        self.assertNotIn('token_qr', consultas[-1]['sql'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class QrPerezosoTests(PruebaTestCase):
+    """El QR se dibuja al pedirse, una sola vez por token y estilo, y no al guardar"""
+
+    def test_guardar_no_dibuja(self):
+        with mock.patch.object(imagen_qr, 'renderizar_png', wraps=imagen_qr.renderizar_png) as renderizar:
+            invitado = Invitado(nombre_completo='Ana Pérez', puesto_cargo='Prensa', fotografia='')
+            invitado.save()
+            invitado.asistio = True
+            invitado.save(update_fields=['asistio'])
+        renderizar.assert_not_called()
+        self.assertFalse(invitado.qr_generado)
+
+    def test_una_vez_por_token(self):
+        imagen_qr._imagen.cache_clear()
+        with mock.patch.object(imagen_qr, 'renderizar_png', wraps=imagen_qr.renderizar_png) as renderizar:
+            invitados = [_crear_invitado(f'Invitado {n}') for n in range(3)]
+            for invitado in invitados:
+                invitado.asistio = True
+                invitado.save()
+            indice_tokens.calentar()
+            for _ in range(2):
+                for invitado in invitados:
+                    self.assertEqual(self.client.get(f'/qr/{invitado.token_qr}.png').status_code, 200)
+        # Guardar no dibuja; la vista dibuja cada pase una sola vez
+        self.assertEqual(sorted(c.args[0] for c in renderizar.call_args_list), sorted(i.token_qr for i in invitados))
+
+    def test_imagen_por_url(self):
+        invitado = Invitado(nombre_completo='Ana Pérez', puesto_cargo='Prensa', fotografia='')
+        invitado.save()
+        indice_tokens.calentar()
+        imagen_qr._imagen.cache_clear()
+        url = imagen_qr.url(invitado.token_qr)
+        self.assertEqual(url, f'/qr/{invitado.token_qr}.png?v={imagen_qr.version()}')
+
+        with mock.patch.object(imagen_qr, 'renderizar_png', wraps=imagen_qr.renderizar_png) as renderizar:
+            respuesta = self.client.get(url)
+            self.assertEqual(self.client.get(url).content, respuesta.content)
+        self.assertEqual(renderizar.call_count, 1)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/png')
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304
+        )
+        self.assertTrue(self.client.get(f'/qr/{invitado.token_qr}.svg').content.startswith(b'<svg'))
+
+        falso = invitado.token_qr[:-2] + ('AA' if invitado.token_qr[-2:] != 'AA' else 'BB')
+        self.assertEqual(self.client.get(f'/qr/{falso}.png').status_code, 404)
+        # Servirla no escribe nada en media
+        self.assertFalse(Invitado.objects.get(pk=invitado.pk).qr_generado)
+
+    def test_version_del_estilo_en_la_url(self):
+        invitado = _crear_invitado()
+        indice_tokens.calentar()
+        url = imagen_qr.url(invitado.token_qr)
+
+        # Sin versión, o con la de un logo anterior, se revalida con el ETag
+        for vieja in (f'/qr/{invitado.token_qr}.png', f'/qr/{invitado.token_qr}.png?v=0123456789ab'):
+            respuesta = self.client.get(vieja)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertNotIn('immutable', respuesta['Cache-Control'])
+            self.assertIn('no-cache', respuesta['Cache-Control'])
+
+        # Otro logo: otra URL y otro ETag
+        etag = imagen_qr.etag(invitado.token_qr)
+        with mock.patch.object(imagen_qr, 'estilo', return_value='v99-otro-logo'):
+            self.assertNotEqual(imagen_qr.url(invitado.token_qr), url)
+            self.assertNotEqual(imagen_qr.etag(invitado.token_qr), etag)
+
+        # Las páginas y la API enlazan la URL versionada
+        self.assertEqual(listado.serializar(invitado)['qr'], url)
+        self.client.force_login(User.objects.create_superuser('raiz', password='x'))
+        self.assertContains(
+            self.client.get(f'/qr-id/{invitado.id}/'), imagen_qr.url(invitado.token_qr, 'svg')
+        )
+        self.assertContains(self.client.get('/invitados/'), url)
+
+    def test_admin_emite_sin_escribir_en_media(self):
+        con_token = _crear_invitado('Con Token')
+        Invitado.objects.bulk_create([Invitado(nombre_completo='Sin Token', puesto_cargo='Prensa', fotografia='')])
+        sin_token = Invitado.objects.get(nombre_completo='Sin Token')
+        self.assertEqual(sin_token.token_qr, '')
+        self.client.force_login(User.objects.create_superuser('raiz', password='x'))
+
+        with mock.patch.object(imagen_qr, 'renderizar_png') as renderizar, \
+                mock.patch.object(imagen_qr, 'asegurar_png') as asegurar:
+            self.client.post('/admin/invitados/invitado/', {
+                'action': 'regenerar_qr_codes',
+                '_selected_action': [str(con_token.pk), str(sin_token.pk)],
+            })
+        renderizar.assert_not_called()
+        asegurar.assert_not_called()
+
+        sin_token.refresh_from_db()
+        self.assertEqual(tokens.verificar(sin_token.token_qr), tokens.FIRMADO)
+        self.assertFalse(sin_token.qr_generado)
+        self.assertEqual(Invitado.objects.get(pk=con_token.pk).token_qr, con_token.token_qr)
+        self.assertEqual(self.client.get(imagen_qr.url(sin_token.token_qr)).status_code, 200)
+
+    def test_pdf_vectorial(self):
+        from .utils import generar_pdf_qr_invitados
+
+        for nombre in ('Ana Pérez', 'Luis Gómez', 'Eva Ruiz'):
+            Invitado(nombre_completo=nombre, puesto_cargo='Prensa', fotografia='').save()
+        with mock.patch.object(imagen_qr, 'renderizar_png') as renderizar:
+            pdf = generar_pdf_qr_invitados()
+        renderizar.assert_not_called()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # El logo se guarda una vez y cada QR lo reutiliza
+        self.assertLessEqual(pdf.count(b'/Subtype /Form'), 1)
+        self.assertFalse(Invitado.objects.filter(qr_generado=True).exists())
+
+    def test_png_con_paleta(self):
+        from io import BytesIO
+        from PIL import Image, ImageChops
+
+        token = str(uuid.uuid4())
+        png, _ = imagen_qr.renderizar_png(token)
+        qr_img = Image.open(BytesIO(png))
+        self.assertIn(qr_img.mode, ('P', '1'))
+        # Fuera del logo, los módulos quedan exactamente en blanco y negro
+        diferencia = ImageChops.difference(qr_img.convert('RGB'), imagen_qr.qr_base(token))
+        mosaico = imagen_qr.logo_superpuesto(qr_img.width)
+        if mosaico is not None:
+            inicio = (qr_img.width - mosaico.width) // 2
+            diferencia.paste((0, 0, 0), (inicio, inicio, inicio + mosaico.width, inicio + mosaico.width))
+        self.assertIsNone(diferencia.getbbox())
+
+    def test_recomprimir_reemplaza_en_su_lugar(self):
+        from io import BytesIO, StringIO
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from django.core.management import call_command
+        from PIL import Image
+
+        nombre = f'{imagen_qr.CARPETA}/antiguo.png'
+        rgb = BytesIO()
+        imagen_qr.qr_base(str(uuid.uuid4())).convert('RGB').save(rgb, format='PNG')
+        default_storage.save(nombre, ContentFile(rgb.getvalue()))
+
+        # Si el renombrado falla, el original queda intacto y no sobra el temporal
+        with mock.patch('os.replace', side_effect=OSError('disco lleno')):
+            with self.assertRaises(OSError):
+                call_command('recomprimir_qr', stdout=StringIO())
+        self.assertEqual(default_storage.listdir(imagen_qr.CARPETA)[1], ['antiguo.png'])
+        with default_storage.open(nombre, 'rb') as archivo:
+            self.assertEqual(archivo.read(), rgb.getvalue())
+
+        call_command('recomprimir_qr', stdout=StringIO())
+        self.assertEqual(default_storage.listdir(imagen_qr.CARPETA)[1], ['antiguo.png'])
+        with default_storage.open(nombre, 'rb') as archivo:
+            recomprimido = archivo.read()
+        self.assertLess(len(recomprimido), len(rgb.getvalue()))
+        self.assertIn(Image.open(BytesIO(recomprimido)).mode, ('P', '1'))
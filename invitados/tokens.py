@@ -0,0 +1,104 @@
+"""
+Tokens QR firmados con HMAC.
+
+Formato: ``"1"`` + base32 (sin relleno) de 30 bytes::
+
+    id del invitado (16) | id del evento (2) | emitido en, epoch (4) | HMAC-SHA256 truncado (8)
+
+Son 49 caracteres del alfabeto alfanumérico de QR (A-Z, 2-7), que con
+corrección de errores H caben en un QR versión 4, frente a la versión 5 que
+necesita un ``uuid4`` en minúsculas. La firma, el evento y la fecha de emisión
+se comprueban sin consultar la base de datos.
+
+Configuración (opcional) en settings:
+
+- ``EVENTO_ID``: id del evento que se firma en cada pase (por defecto 1).
+- ``QR_SECRET_KEY``: clave del HMAC (por defecto ``SECRET_KEY``).
+- ``QR_EMITIDOS_DESDE``: epoch; los pases emitidos antes se consideran vencidos.
+- ``QR_ACEPTAR_TOKENS_LEGADOS``: aceptar todavía los ``uuid4`` sin firma.
+"""
+import base64
+import hashlib
+import hmac
+import struct
+import time
+import uuid
+
+from django.conf import settings
+
+PREFIJO = '1'
+LONGITUD = 49
+_LONGITUD_FIRMA = 8
+_FORMATO = '>16sHI'
+
+# Resultados de verificar()
+FIRMADO = 'firmado'
+LEGADO = 'legado'
+FALSIFICADO = 'falsificado'
+VENCIDO = 'vencido'
+
+# Margen para relojes de servidores desincronizados
+_TOLERANCIA_RELOJ = 300
+
+
+def _clave():
+    clave = getattr(settings, 'QR_SECRET_KEY', None) or settings.SECRET_KEY
+    return clave.encode()
+
+
+def _evento_id():
+    return int(getattr(settings, 'EVENTO_ID', 1))
+
+
+def _firma(datos):
+    return hmac.new(_clave(), datos, hashlib.sha256).digest()[:_LONGITUD_FIRMA]
+
+
+def firmar(invitado_id, emitido=None):
+    """Genera el token firmado para el invitado ``invitado_id``"""
+    if not isinstance(invitado_id, uuid.UUID):
+        invitado_id = uuid.UUID(str(invitado_id))
+    emitido = int(time.time() if emitido is None else emitido)
+    datos = struct.pack(_FORMATO, invitado_id.bytes, _evento_id(), emitido)
+    codificado = base64.b32encode(datos + _firma(datos)).decode('ascii')
+    return PREFIJO + codificado
+
+
+def es_firmado(token_qr):
+    """Indica si el token tiene el formato firmado (sin verificarlo)"""
+    return len(token_qr) == LONGITUD and token_qr.startswith(PREFIJO)
+
+
+def verificar(token_qr):
+    """
+    Verifica un token sin tocar la base de datos.
+
+    Devuelve FIRMADO, LEGADO (``uuid4`` antiguo, sólo si se aceptan),
+    FALSIFICADO o VENCIDO.
+    """
+    if not es_firmado(token_qr):
+        if getattr(settings, 'QR_ACEPTAR_TOKENS_LEGADOS', True):
+            try:
+                uuid.UUID(token_qr)
+                return LEGADO
+            except ValueError:
+                pass
+        return FALSIFICADO
+
+    try:
+        crudo = base64.b32decode(token_qr[1:])
+    except ValueError:
+        return FALSIFICADO
+
+    datos, firma = crudo[:-_LONGITUD_FIRMA], crudo[-_LONGITUD_FIRMA:]
+    if not hmac.compare_digest(firma, _firma(datos)):
+        return FALSIFICADO
+
+    _, evento_id, emitido = struct.unpack(_FORMATO, datos)
+    if evento_id != _evento_id():
+        return VENCIDO
+    if emitido < int(getattr(settings, 'QR_EMITIDOS_DESDE', 0)):
+        return VENCIDO
+    if emitido > time.time() + _TOLERANCIA_RELOJ:
+        return FALSIFICADO
+    return FIRMADO
@@ -6,14 +6,22 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('invitados/', views.lista_invitados, name='lista_invitados'),
+    path('invitados/api/', views.lista_invitados_api, name='lista_invitados_api'),
+    path('invitados/buscar/', views.buscar_invitados, name='buscar_invitados'),
     path('crear/', views.crear_invitado, name='crear_invitado'),
     path('qr/<str:token>/', views.mostrar_qr, name='mostrar_qr'),
+    path('qr/<str:token>.png', views.qr_imagen, {'formato': 'png'}, name='qr_png'),
+    path('qr/<str:token>.svg', views.qr_imagen, {'formato': 'svg'}, name='qr_svg'),
     path('qr-id/<uuid:invitado_id>/', views.ver_invitado_qr, name='ver_invitado_qr'),
     path('escaner/', views.escaner_qr, name='escaner_qr'),
     path('procesar-qr/', views.procesar_qr, name='procesar_qr'),
+    path('procesar-qr/lote/', views.procesar_qr_lote, name='procesar_qr_lote'),
     path('estadisticas/', views.estadisticas_tiempo_real, name='estadisticas'),
+    path('estadisticas/serie/', views.serie_llegadas, name='serie_llegadas'),
+    path('llegadas/', views.llegadas_desde, name='llegadas_desde'),
     path('panel/', views.panel_control, name='panel_control'),
     path('exportar-csv/', views.exportar_asistencia_csv, name='exportar_csv'),
+    path('metricas/latencia/', views.metricas_latencia, name='metricas_latencia'),
     path('offline/', views.offline_page, name='offline'),
     path('marcar-asistencia-manual/', views.marcar_asistencia_manual, name='marcar_asistencia_manual'),
     path('generar-pdf-qr/', views.generar_pdf_qr_todos, name='generar_pdf_qr_todos'),
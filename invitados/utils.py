@@ -3,14 +3,67 @@ from io import BytesIO
 from django.http import HttpResponse
 from django.conf import settings
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, mm
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.utils import ImageReader
 from PIL import Image as PILImage
+from . import imagen_qr
 from .models import Invitado
 
+
+def _definir_logo(canv, modulos):
+    """Form XObject con el mosaico del logo, una vez por documento; devuelve su nombre"""
+    nombre = f'logo_qr_{modulos}'
+    if not canv.hasForm(nombre):
+        # En coordenadas unitarias: cada QR lo escala a su tamaño con doForm
+        canv.beginForm(nombre, 0, 0, 1, 1)
+        mosaico = imagen_qr.logo_superpuesto(modulos * imagen_qr.TAMANO_MODULO)
+        canv.drawImage(ImageReader(mosaico), 0, 0, 1, 1, mask='auto')
+        canv.endForm()
+    return nombre
+
+
+class QrVectorial(Flowable):
+    """
+    QR del pase dibujado con rectángulos a partir del token: nítido a
+    cualquier tamaño de impresión y sin leer ni escribir PNG. El logo se
+    guarda una sola vez en el PDF y cada QR lo reutiliza.
+    """
+
+    def __init__(self, token, lado):
+        super().__init__()
+        self.token = token
+        self.width = self.height = lado
+
+    def draw(self):
+        canv = self.canv
+        modulos, rectangulos = imagen_qr.tramos(self.token)
+        caja = imagen_qr.caja_logo(modulos)
+        logo = _definir_logo(canv, modulos) if caja else None
+
+        canv.saveState()
+        canv.scale(self.width / modulos, self.height / modulos)
+        canv.setFillColor(colors.white)
+        canv.rect(0, 0, modulos, modulos, stroke=0, fill=1)
+
+        # En el PDF la y crece hacia arriba: la fila 0 del QR va arriba
+        trazo = canv.beginPath()
+        for x, y, ancho in rectangulos:
+            trazo.rect(x, modulos - y - 1, ancho, 1)
+        canv.setFillColor(colors.black)
+        canv.drawPath(trazo, stroke=0, fill=1)
+
+        if logo:
+            posicion, lado = caja
+            canv.translate(posicion, modulos - posicion - lado)
+            canv.scale(lado, lado)
+            canv.doForm(logo)
+        canv.restoreState()
+
+
 def generar_pdf_qr_invitados():
     """
     Genera un PDF con todos los códigos QR de los invitados
@@ -68,7 +121,7 @@ def generar_pdf_qr_invitados():
     elements.append(Spacer(1, 5*mm))
     
     # Obtener todos los invitados ordenados por nombre
-    invitados = Invitado.objects.all().order_by('nombre_completo')
+    invitados = Invitado.objects.order_by('nombre_completo').only('nombre_completo', 'token_qr')
     
     if not invitados:
         # Si no hay invitados
@@ -135,15 +188,10 @@ def crear_celda_invitado(invitado):
     from reportlab.lib.enums import TA_CENTER
     from reportlab.lib import colors
     
-    # Verificar si el QR existe
-    if invitado.qr_imagen and os.path.exists(invitado.qr_imagen.path):
+    if invitado.token_qr:
         try:
-            # Crear imagen QR
-            qr_img = Image(
-                invitado.qr_imagen.path,
-                width=32*mm,
-                height=32*mm
-            )
+            # QR vectorial dibujado desde el token (sin archivos en media)
+            qr_img = QrVectorial(invitado.token_qr, 32*mm)
             
             # Estilo para el nombre
             name_style = ParagraphStyle(
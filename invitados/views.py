@@ -1,6 +1,8 @@
+import os
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse
-from .models import Invitado, UserProfile
+from django.http import Http404, HttpResponse, HttpResponseNotModified, FileResponse
+from .models import Invitado, UserProfile, EscaneoProcesado, EventoEscaneo
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
@@ -10,16 +12,24 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Count
 from django.http import HttpResponse
 import csv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.shortcuts import render, redirect
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from .forms import CustomLoginForm
 from .forms import InvitadoForm
 import pytz
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from asgiref.sync import sync_to_async
 from .decorators import role_required, admin_required, registro_or_admin_required, escaneo_or_admin_required
+from .asistencia import (
+    registrar_entrada, registrar_entradas_lote, formatear_hora, ACEPTADO, NO_ENCONTRADO, YA_ESCANEADO
+)
+from . import contadores, estadisticas, imagen_qr, indice_tokens, lecturas, listado, metricas, series, tokens
+from .metricas import medir_etapas
 
 
 def login_view(request):
@@ -59,12 +69,11 @@ def logout_view(request):
 def dashboard(request):
     """Panel principal después del login"""
     # Estadísticas generales
-    total_invitados = Invitado.objects.count()
-    total_asistentes = Invitado.objects.filter(asistio=True).count()
+    total_invitados, total_asistentes = contadores.leer()
     porcentaje_asistencia = (total_asistentes / total_invitados * 100) if total_invitados > 0 else 0
     
     # Invitados recientes
-    invitados_recientes = Invitado.objects.order_by('-fecha_creacion')[:3]
+    invitados_recientes = lecturas.registrados_recientes(3)
  
     
     context = {
@@ -82,25 +91,12 @@ def dashboard(request):
 @login_required
 def dashboard(request):
     """Panel principal después del login"""
-    # Obtener o crear perfil del usuario
-    try:
-        user_profile = UserProfile.objects.get(user=request.user)
-        user_role = user_profile.rol
-    except UserProfile.DoesNotExist:
-        # Si no tiene perfil, crear uno con rol por defecto
-        user_profile = UserProfile.objects.create(
-            user=request.user,
-            rol='registro'  # rol por defecto
-        )
-        user_role = 'registro'
-    
     # Estadísticas generales
-    total_invitados = Invitado.objects.count()
-    total_asistentes = Invitado.objects.filter(asistio=True).count()
+    total_invitados, total_asistentes = contadores.leer()
     porcentaje_asistencia = (total_asistentes / total_invitados * 100) if total_invitados > 0 else 0
     
     # Invitados recientes
-    invitados_recientes = Invitado.objects.order_by('-fecha_creacion')[:3]
+    invitados_recientes = lecturas.registrados_recientes(3)
     
     context = {
         'titulo': 'Dashboard - Sistema QR',
@@ -109,8 +105,6 @@ def dashboard(request):
         'porcentaje_asistencia': round(porcentaje_asistencia, 1),
         'invitados_recientes': invitados_recientes,
         'usuario': request.user,
-        'user_role': user_role,
-        'user_profile': user_profile,
     }
     
     return render(request, 'invitados/dashboard.html', context)
@@ -129,11 +123,15 @@ def mostrar_qr(request, token):
 
 @role_required('admin', 'registro', 'escaneo')
 def lista_invitados(request):
-    """Vista para listar todos los invitados"""
-    invitados = Invitado.objects.all().order_by('nombre_completo')
+    """Vista para listar invitados: primera página renderizada, el resto por la API al hacer scroll"""
+    invitados, siguiente = listado.pagina()
+    total_invitados, total_asistentes = contadores.leer()
     
     context = {
         'invitados': invitados,
+        'siguiente': siguiente,
+        'total_invitados': total_invitados,
+        'total_asistentes': total_asistentes,
         'titulo': 'Lista de Invitados'
     }
     
@@ -147,154 +145,395 @@ def escaner_qr(request):
     }
     return render(request, 'invitados/escaner_qr.html', context)
 
-@csrf_exempt
-@require_POST
+def _respuesta_medida(request, datos, **kwargs):
+    """JsonResponse midiendo el tiempo de serialización"""
+    with request.cronometro.etapa('respuesta'):
+        return JsonResponse(datos, **kwargs)
+
+
+def _respuesta_escaneo(request, estado, invitado):
+    """Respuesta de procesar_qr para un escaneo que llegó a la base de datos (o su repetición)"""
+    if estado == NO_ENCONTRADO:
+        return _respuesta_medida(request, {
+            'success': False,
+            'error': 'TOKEN_NO_ENCONTRADO',
+            'message': 'Código QR no válido o no encontrado'
+        })
+    
+    # Verificar si ya asistió
+    if estado == YA_ESCANEADO:
+        return _respuesta_medida(request, {
+            'success': False,
+            'error': 'YA_ESCANEADO',
+            'message': f'{invitado["nombre"]} ya registró su entrada',
+            'invitado': invitado
+        })
+    
+    return _respuesta_medida(request, {
+        'success': True,
+        'message': f'¡Bienvenido {invitado["nombre"]}!',
+        'invitado': invitado
+    })
+
+
+def _registrar_con_scan_id(token_qr, dispositivo, scan_id):
+    """
+    registrar_entrada() y su EscaneoProcesado en la misma transacción.
+
+    Si el dispositivo no alcanzó a recibir la respuesta y reenvía el escaneo
+    desde su cola, recibe este mismo resultado; si la petición se corta antes
+    de confirmar, no queda ni la entrada ni el scan_id y el reenvío cuenta
+    como el primer escaneo. Con el mismo scan_id en curso dos veces, el
+    segundo choca con el índice único y devuelve lo que guardó el primero.
+    """
+    try:
+        with transaction.atomic():
+            estado, invitado = registrar_entrada(token_qr, dispositivo)
+            EscaneoProcesado.objects.create(
+                scan_id=scan_id, token_qr=token_qr[:100], resultado=estado, invitado=invitado
+            )
+    except IntegrityError:
+        previo = EscaneoProcesado.objects.get(scan_id=scan_id)
+        return previo.resultado, previo.invitado
+    return estado, invitado
+
 
 @csrf_exempt
 @require_POST
-def procesar_qr(request):
-    """Vista para procesar el QR escaneado vía AJAX"""
+@medir_etapas('procesar_qr')
+async def procesar_qr(request):
+    """Vista async para procesar el QR escaneado vía AJAX"""
     try:
 
         if not request.body:
-         return JsonResponse({
+         return _respuesta_medida(request, {
             'success': False,
             'error': 'BODY_VACIO',
             'message': 'El cuerpo de la petición está vacío'
         }, status=400)
 
-
-        data = json.loads(request.body)
-        token_qr = data.get('token_qr', '').strip()
-        dispositivo = data.get('dispositivo', 'Dispositivo desconocido')
+        crono = request.cronometro
+        with crono.etapa('json'):
+            data = json.loads(request.body)
+            valido = isinstance(data, dict) and isinstance(data.get('token_qr', ''), str)
+            if valido:
+                token_qr = data.get('token_qr', '').strip()
+                dispositivo = data.get('dispositivo')
+                if not isinstance(dispositivo, str) or not dispositivo:
+                    dispositivo = 'Dispositivo desconocido'
+                # Lo agrega el service worker; es el mismo con que encola el escaneo si no hay respuesta
+                scan_id = data['scan_id'][:64] if isinstance(data.get('scan_id'), str) else ''
+        # La respuesta se arma fuera de la etapa 'json' para no medirla dos veces
+        if not valido:
+            return _respuesta_medida(request, {
+                'success': False,
+                'error': 'TOKEN_NO_VALIDO',
+                'message': 'Código QR no válido'
+            }, status=400)
+        
+        if scan_id:
+            previo = await EscaneoProcesado.objects.filter(scan_id=scan_id).afirst()
+            if previo is not None:
+                return _respuesta_escaneo(request, previo.resultado, previo.invitado)
             
         if not token_qr:
-            return JsonResponse({
+            return _respuesta_medida(request, {
                 'success': False,
                 'error': 'Token QR vacío',
                 'message': 'No se pudo leer el código QR'
             })
         
         if len(token_qr) < 30 or len(token_qr) > 50:
-            return JsonResponse({
+            return _respuesta_medida(request, {
                 'success': False,
                 'error': 'TOKEN_FORMATO_INVALIDO',
                 'message': 'Formato de código QR inválido'
             })
 
-
-
-
-
-
-        data = json.loads(request.body)
-        token_qr = data.get('token_qr', '').strip()
-        dispositivo = data.get('dispositivo', 'Dispositivo desconocido')
-        
-        if not token_qr:
-            return JsonResponse({
+        # Firma, evento y vigencia se comprueban sin consultar la base de datos
+        with crono.etapa('verificacion'):
+            verificacion = tokens.verificar(token_qr)
+        if verificacion == tokens.FALSIFICADO:
+            return _respuesta_medida(request, {
                 'success': False,
-                'error': 'Token QR vacío',
-                'message': 'No se pudo leer el código QR'
+                'error': 'TOKEN_NO_VALIDO',
+                'message': 'Código QR no válido'
             })
-        
-        # Buscar el invitado por token
-        try:
-            invitado = Invitado.objects.get(token_qr=token_qr)
-        except Invitado.DoesNotExist:
-            return JsonResponse({
+        if verificacion == tokens.VENCIDO:
+            return _respuesta_medida(request, {
                 'success': False,
-                'error': 'TOKEN_NO_ENCONTRADO',
-                'message': 'Código QR no válido o no encontrado'
+                'error': 'TOKEN_VENCIDO',
+                'message': 'Código QR vencido, solicita un nuevo pase'
             })
-        
-        # Verificar si ya asistió
-        if invitado.asistio:
-            return JsonResponse({
+
+        # Tokens desconocidos se rechazan desde el índice en memoria
+        with crono.etapa('indice'):
+            invitado_id = await indice_tokens.abuscar(token_qr)
+        if invitado_id is None:
+            return _respuesta_medida(request, {
                 'success': False,
-                'error': 'YA_ESCANEADO',
-                'message': f'{invitado.nombre_completo} ya registró su entrada',
-                'invitado': {
-                    'nombre': invitado.nombre_completo,
-                    'puesto': invitado.puesto_cargo,
-                    'hora_entrada': invitado.hora_entrada_formateada,
-                    'foto': invitado.fotografia.url if invitado.fotografia else None
-                }
+                'error': 'TOKEN_NO_ENCONTRADO',
+                'message': 'Código QR no válido o no encontrado'
             })
+
+        # Un solo UPDATE condicional decide el resultado del escaneo
+        # (incluye la espera por el bloqueo de fila si otro escaneo del mismo pase va primero)
+        with crono.etapa('update'):
+            if scan_id:
+                estado, invitado = await sync_to_async(_registrar_con_scan_id)(token_qr, dispositivo, scan_id)
+            else:
+                estado, invitado = await sync_to_async(registrar_entrada)(token_qr, dispositivo)
         
-        # Marcar asistencia
-        if invitado.marcar_asistencia(dispositivo):
-            return JsonResponse({
-                'success': True,
-                'message': f'¡Bienvenido {invitado.nombre_completo}!',
-                'invitado': {
-                    'nombre': invitado.nombre_completo,
-                    'puesto': invitado.puesto_cargo,
-                    'hora_entrada': invitado.hora_entrada_formateada,
-                    'foto': invitado.fotografia.url if invitado.fotografia else None
-                }
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'error': 'ERROR_ASISTENCIA',
-                'message': 'Error al registrar la asistencia'
-            })
+        return _respuesta_escaneo(request, estado, invitado)
             
     except json.JSONDecodeError:
-        return JsonResponse({
+        return _respuesta_medida(request, {
             'success': False,
             'error': 'JSON_ERROR',
             'message': 'Datos inválidos recibidos'
         })
     except Exception as e:
+        print(f"Error al procesar escaneo: {e}")
+        return _respuesta_medida(request, {
+            'success': False,
+            'error': 'ERROR_SERVIDOR',
+            'message': 'Error al procesar el escaneo'
+        }, status=500)
+
+MAX_ESCANEOS_LOTE = 500
+# Una cola sin conexión no dura más que el evento: horas más viejas se ignoran
+MAX_ANTIGUEDAD_ESCANEO = timedelta(hours=12)
+
+
+def _fecha_escaneo(valor, ahora):
+    """
+    Convierte el scanned_at del dispositivo; si falta, es inválido, está en el
+    futuro o es anterior a la ventana del evento usa la hora actual
+    """
+    fecha = None
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        # Milisegundos desde epoch (Date.now() en el navegador)
+        try:
+            fecha = datetime.fromtimestamp(valor / 1000, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            fecha = None
+    elif isinstance(valor, str):
+        try:
+            fecha = parse_datetime(valor)
+        except ValueError:
+            fecha = None
+        if fecha is not None and timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+
+    # Un reloj adelantado no puede registrar entradas en el futuro, ni un
+    # cliente cualquiera fecharlas antes del evento (el endpoint no pide sesión)
+    minima = ahora - MAX_ANTIGUEDAD_ESCANEO
+    emitidos_desde = getattr(settings, 'QR_EMITIDOS_DESDE', 0)
+    if emitidos_desde:
+        minima = max(minima, datetime.fromtimestamp(emitidos_desde, tz=dt_timezone.utc))
+    if fecha is None or fecha > ahora or fecha < minima:
+        return ahora
+    return fecha
+
+
+@csrf_exempt
+@require_POST
+def procesar_qr_lote(request):
+    """Vista para procesar un lote de escaneos acumulados en el dispositivo"""
+    try:
+        data = json.loads(request.body or b'null')
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'JSON_ERROR',
+            'message': 'Datos inválidos recibidos'
+        }, status=400)
+
+    escaneos = data.get('escaneos') if isinstance(data, dict) else data
+    if not isinstance(escaneos, list) or not escaneos:
+        return JsonResponse({
+            'success': False,
+            'error': 'LOTE_VACIO',
+            'message': 'No se recibieron escaneos'
+        }, status=400)
+
+    if len(escaneos) > MAX_ESCANEOS_LOTE:
+        return JsonResponse({
+            'success': False,
+            'error': 'LOTE_DEMASIADO_GRANDE',
+            'message': f'Máximo {MAX_ESCANEOS_LOTE} escaneos por lote'
+        }, status=400)
+
+    ahora = timezone.now()
+    escaneos = [e if isinstance(e, dict) else {} for e in escaneos]
+    # Un scan_id que no es texto no sirve para deduplicar: se trata como ausente
+    scan_ids = [e['scan_id'][:64] if isinstance(e.get('scan_id'), str) else '' for e in escaneos]
+
+    try:
+        with transaction.atomic():
+            # Escaneos ya sincronizados antes (reintentos): se devuelve el resultado guardado
+            previos = {
+                previo.scan_id: previo
+                for previo in EscaneoProcesado.objects.filter(scan_id__in=[sid for sid in scan_ids if sid])
+            }
+
+            resultados = [None] * len(escaneos)
+            repetidos = {}
+            validos = []
+            posiciones = []
+            for i, escaneo in enumerate(escaneos):
+                scan_id = scan_ids[i]
+                token_qr = escaneo.get('token_qr')
+                token_qr = token_qr.strip() if isinstance(token_qr, str) else ''
+
+                if scan_id in previos:
+                    previo = previos[scan_id]
+                    resultados[i] = {'token_qr': previo.token_qr, 'resultado': previo.resultado}
+                    if previo.invitado:
+                        resultados[i]['invitado'] = previo.invitado
+                    continue
+                if scan_id:
+                    if scan_id in repetidos:
+                        continue
+                    repetidos[scan_id] = i
+
+                # Tokens vacíos, falsificados, vencidos o desconocidos no llegan a la base de datos
+                if (not (30 <= len(token_qr) <= 50)
+                        or tokens.verificar(token_qr) in (tokens.FALSIFICADO, tokens.VENCIDO)
+                        or indice_tokens.buscar(token_qr) is None):
+                    resultados[i] = {'token_qr': token_qr, 'resultado': NO_ENCONTRADO}
+                    continue
+
+                dispositivo = escaneo.get('dispositivo')
+                if not isinstance(dispositivo, str) or not dispositivo:
+                    dispositivo = 'Dispositivo desconocido'
+                validos.append({
+                    'token_qr': token_qr,
+                    'dispositivo': dispositivo,
+                    'fecha': _fecha_escaneo(escaneo.get('scanned_at'), ahora),
+                })
+                posiciones.append(i)
+
+            registrados = registrar_entradas_lote(validos)
+            for i, escaneo, (estado, invitado) in zip(posiciones, validos, registrados):
+                resultado = {'token_qr': escaneo['token_qr'], 'resultado': estado}
+                if invitado:
+                    resultado['invitado'] = invitado
+                resultados[i] = resultado
+
+            # El mismo scan_id repetido dentro del lote recibe el resultado del primero
+            for i, scan_id in enumerate(scan_ids):
+                if resultados[i] is None:
+                    resultados[i] = resultados[repetidos[scan_id]]
+
+            EscaneoProcesado.objects.bulk_create([
+                EscaneoProcesado(
+                    scan_id=scan_id,
+                    token_qr=resultados[i]['token_qr'][:100],
+                    resultado=resultados[i]['resultado'],
+                    invitado=resultados[i].get('invitado'),
+                )
+                for scan_id, i in repetidos.items()
+            ], ignore_conflicts=True)
+
+    except Exception as e:
+        print(f"Error al procesar lote de escaneos: {e}")
         return JsonResponse({
             'success': False,
             'error': 'ERROR_SERVIDOR',
-            'message': f'Error del servidor: {str(e)}'
-        })
+            'message': 'Error al registrar el lote'
+        }, status=500)
 
-def estadisticas_tiempo_real(request):
-    """Vista para obtener estadísticas en tiempo real"""
-    total_invitados = Invitado.objects.count()
-    total_asistentes = Invitado.objects.filter(asistio=True).count()
-    porcentaje_asistencia = (total_asistentes / total_invitados * 100) if total_invitados > 0 else 0
-    
-    # Últimas 5 llegadas
-    ultimas_llegadas = Invitado.objects.filter(
-        asistio=True
-    ).order_by('-fecha_hora_entrada')[:5]
+    return JsonResponse({
+        'success': True,
+        # Pases distintos: un escaneo repetido dentro del lote copia el resultado del primero
+        'aceptados': len({r['token_qr'] for r in resultados if r['resultado'] == ACEPTADO}),
+        'resultados': resultados
+    })
+
+async def estadisticas_tiempo_real(request):
+    """Vista async para obtener estadísticas en tiempo real (con ETag y 304)"""
+    version = await estadisticas.aversion()
+    etag = estadisticas.etag(version)
+    
+    # El escáner ya tiene esta versión: respuesta vacía
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(await estadisticas.ainstantanea(version))
     
-    llegadas_data = []
-    mexico_tz = pytz.timezone('America/Mexico_City')
-    for invitado in ultimas_llegadas:
-        try:
-            if invitado.fecha_hora_entrada:
-                if invitado.fecha_hora_entrada.tzinfo is None:
-                    utc_time = pytz.UTC.localize(invitado.fecha_hora_entrada)
-                    hora_local = utc_time.astimezone(mexico_tz)
-                else:
-                    hora_local = invitado.fecha_hora_entrada.astimezone(mexico_tz)
-                hora_formateada = hora_local.strftime('%d/%m/%Y %H:%M:%S')
-            else:
-                hora_formateada = "No registrada"
-        except Exception as e:
-            print(f"Error al formatear hora para {invitado.nombre_completo}: {e}")
-            hora_formateada = invitado.hora_entrada_formateada
-        
-        # CORREGIDO: Siempre agregar el invitado a la lista
-        llegadas_data.append({
-            'nombre': invitado.nombre_completo,
-            'puesto': invitado.puesto_cargo,
-            'hora': hora_formateada,
-            'foto': invitado.fotografia.url if invitado.fotografia else None
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@login_required
+async def serie_llegadas(request):
+    """Entradas por intervalo de 1, 5 o 15 minutos y por puerta (para la gráfica del panel)"""
+    try:
+        intervalo = int(request.GET.get('intervalo', 5))
+    except ValueError:
+        intervalo = None
+    if intervalo not in series.INTERVALOS:
+        return JsonResponse({'success': False, 'error': 'INTERVALO_NO_VALIDO',
+                             'message': 'El intervalo debe ser 1, 5 o 15 minutos'}, status=400)
+    
+    return JsonResponse(await series.aleer(intervalo))
+
+# Resultados de la bitácora que cambian la lista de llegadas
+RESULTADOS_LLEGADAS = ('aceptado', 'manual', 'desmarcado')
+LIMITE_LLEGADAS = 50
+MAX_LIMITE_LLEGADAS = 200
+
+@login_required
+async def llegadas_desde(request):
+    """
+    Llegadas posteriores a un cursor (id de EventoEscaneo), en orden.
+    
+    Sin ``desde`` devuelve las más recientes. El cliente guarda ``cursor`` y
+    en la siguiente consulta pide ``?desde=<cursor>``; con ``hay_mas`` debe
+    volver a pedir de inmediato. Los registros son sentencias cortas, así que
+    un id menor no queda sin confirmar detrás de uno mayor más que un instante.
+    """
+    try:
+        desde = request.GET.get('desde')
+        desde = int(desde) if desde not in (None, '') else None
+        limite = min(max(int(request.GET.get('limite', LIMITE_LLEGADAS)), 1), MAX_LIMITE_LLEGADAS)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'PARAMETROS_NO_VALIDOS',
+                             'message': 'desde y limite deben ser enteros'}, status=400)
+    
+    eventos = lecturas.eventos(RESULTADOS_LLEGADAS)
+    
+    if desde is None:
+        # Primera carga: las últimas, en orden cronológico
+        pagina = [evento async for evento in eventos.order_by('-id')[:limite]][::-1]
+        hay_mas = False
+    else:
+        pagina = [evento async for evento in eventos.filter(id__gt=desde).order_by('id')[:limite + 1]]
+        hay_mas = len(pagina) > limite
+        pagina = pagina[:limite]
+    
+    llegadas = []
+    for evento in pagina:
+        invitado = evento.invitado
+        llegadas.append({
+            'cursor': evento.id,
+            'resultado': evento.resultado,
+            'dispositivo': evento.dispositivo,
+            'invitado': {
+                'id': str(invitado.id),
+                'nombre': invitado.nombre_completo,
+                'puesto': invitado.puesto_cargo,
+                'hora_entrada': formatear_hora(evento.fecha),
+                'foto': invitado.fotografia.url if invitado.fotografia else None,
+            },
         })
     
     return JsonResponse({
-        'total_invitados': total_invitados,
-        'total_asistentes': total_asistentes,
-        'porcentaje_asistencia': round(porcentaje_asistencia, 1),
-        'ultimas_llegadas': llegadas_data
+        'success': True,
+        'cursor': llegadas[-1]['cursor'] if llegadas else (desde or 0),
+        'hay_mas': hay_mas,
+        'llegadas': llegadas,
     })
 @registro_or_admin_required
 def mostrar_qr(request, token):
@@ -310,15 +549,63 @@ def mostrar_qr(request, token):
 
 @role_required('admin', 'registro', 'escaneo')
 def lista_invitados(request):
-    """Vista para listar todos los invitados"""
-    invitados = Invitado.objects.all().order_by('nombre_completo')
+    """Vista para listar invitados: primera página renderizada, el resto por la API al hacer scroll"""
+    invitados, siguiente = listado.pagina()
+    total_invitados, total_asistentes = contadores.leer()
     
     context = {
         'invitados': invitados,
+        'siguiente': siguiente,
+        'total_invitados': total_invitados,
+        'total_asistentes': total_asistentes,
         'titulo': 'Lista de Invitados'
     }
     
     return render(request, 'invitados/lista_invitados.html', context)
+
+@role_required('admin', 'registro', 'escaneo')
+def lista_invitados_api(request):
+    """Página de invitados en JSON: ?filtro=todos|asistieron|no-asistieron&q=...&despues=<cursor>"""
+    filtro = request.GET.get('filtro', 'todos')
+    if filtro not in listado.FILTROS:
+        return JsonResponse({'success': False, 'error': 'FILTRO_NO_VALIDO',
+                             'message': f'Filtros válidos: {", ".join(listado.FILTROS)}'}, status=400)
+    
+    try:
+        invitados, siguiente = listado.pagina(
+            filtro=filtro,
+            texto=request.GET.get('q', ''),
+            despues=request.GET.get('despues') or None,
+            limite=request.GET.get('limite', listado.TAM_PAGINA),
+        )
+    except ValueError:
+        # Incluye listado.CursorNoValido
+        return JsonResponse({'success': False, 'error': 'PARAMETROS_NO_VALIDOS',
+                             'message': 'Cursor o límite no válido'}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'invitados': [listado.serializar(invitado) for invitado in invitados],
+        'siguiente': siguiente,
+    })
+
+@role_required('admin', 'registro', 'escaneo')
+def buscar_invitados(request):
+    """Búsqueda rápida para la puerta: ?q=lopez gutierrez (sin acentos, por relevancia)"""
+    texto = request.GET.get('q', '').strip()
+    try:
+        limite = min(max(int(request.GET.get('limite', 20)), 1), 50)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'PARAMETROS_NO_VALIDOS',
+                             'message': 'Límite no válido'}, status=400)
+    
+    if len(texto) < 2:
+        return JsonResponse({'success': True, 'invitados': []})
+    
+    return JsonResponse({
+        'success': True,
+        'invitados': [listado.serializar(invitado) for invitado in listado.buscar(texto, limite)],
+    })
 # Agregar estas importaciones al inicio del archivo
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Count
@@ -326,32 +613,37 @@ from django.http import HttpResponse
 import csv
 from datetime import datetime
 
+# Pendientes que se listan en el panel (el resto sólo se cuenta)
+LIMITE_PENDIENTES_PANEL = 15
+
 # Agregar esta vista
 @escaneo_or_admin_required
 def panel_control(request):
     """Panel de control administrativo"""
     # Estadísticas generales
-    total_invitados = Invitado.objects.count()
-    total_asistentes = Invitado.objects.filter(asistio=True).count()
+    total_invitados, total_asistentes = contadores.leer()
     total_no_asistentes = total_invitados - total_asistentes
     porcentaje_asistencia = (total_asistentes / total_invitados * 100) if total_invitados > 0 else 0
     
     # Invitados recientes (últimos 10)
-    asistentes_recientes = Invitado.objects.filter(
-        asistio=True
-    ).order_by('-fecha_hora_entrada')[:10]
+    asistentes_recientes = lecturas.ultimas_llegadas(10)
+    
+    # Primeros invitados que no han llegado; el resto sólo se cuenta
+    no_asistentes = lecturas.pendientes(LIMITE_PENDIENTES_PANEL)
     
-    # Invitados que no han llegado
-    no_asistentes = Invitado.objects.filter(asistio=False).order_by('nombre_completo')
+    # Punto de partida del feed de llegadas (ver llegadas_desde)
+    cursor_llegadas = EventoEscaneo.objects.order_by('-id').values_list('id', flat=True).first() or 0
     
     context = {
         'titulo': 'Panel de Control - Evento',
+        'cursor_llegadas': cursor_llegadas,
         'total_invitados': total_invitados,
         'total_asistentes': total_asistentes,
         'total_no_asistentes': total_no_asistentes,
         'porcentaje_asistencia': round(porcentaje_asistencia, 1),
         'asistentes_recientes': asistentes_recientes,
         'no_asistentes': no_asistentes,
+        'no_asistentes_restantes': max(total_no_asistentes - LIMITE_PENDIENTES_PANEL, 0),
     }
     
     return render(request, 'invitados/panel_control.html', context)
@@ -376,9 +668,7 @@ def exportar_asistencia_csv(request):
     ])
     
     # Datos de todos los invitados
-    invitados = Invitado.objects.all().order_by('nombre_completo')
-    
-    for invitado in invitados:
+    for invitado in lecturas.para_exportar():
         writer.writerow([
             invitado.nombre_completo,
             invitado.puesto_cargo,
@@ -390,11 +680,26 @@ def exportar_asistencia_csv(request):
     
     return response
 
+@admin_required
+def metricas_latencia(request):
+    """Percentiles de latencia por etapa del worker que atiende la petición (POST los reinicia)"""
+    if request.method == 'POST':
+        metricas.reiniciar()
+    return JsonResponse(metricas.resumen())
+
 def offline_page(request):
     """Página para mostrar cuando no hay conexión"""
     return render(request, 'pwa/offline.html')
 
 
+def service_worker(request):
+    """Sirve el Service Worker desde la raíz para que controle todo el sitio"""
+    sw_path = os.path.join(settings.BASE_DIR, 'static', 'pwa', 'sw.js')
+    response = FileResponse(open(sw_path, 'rb'), content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 @registro_or_admin_required
 def crear_invitado(request):
     """Vista para crear nuevo invitado via formulario web"""
@@ -416,8 +721,8 @@ def crear_invitado(request):
         form = InvitadoForm()
     
     # Estadísticas para mostrar en la página
-    total_invitados = Invitado.objects.count()
-    invitados_recientes = Invitado.objects.order_by('-fecha_creacion')[:3]  # ← Solo 3 registros
+    total_invitados, _ = contadores.leer()
+    invitados_recientes = lecturas.registrados_recientes(3)  # ← Solo 3 registros
     
     context = {
         'form': form,
@@ -438,6 +743,32 @@ def ver_invitado_qr(request, invitado_id):
     }
     
     return render(request, 'invitados/mostrar_qr.html', context)
+
+def qr_imagen(request, token, formato):
+    """
+    Imagen del pase (PNG o SVG) dibujada a partir del token.
+
+    Sin sesión: quien conoce el token ya puede dibujar su QR. Sólo se atienden
+    tokens con firma válida que pertenecen a un invitado (índice en memoria,
+    sin consultar la base de datos). Sólo la URL con la versión vigente del
+    estilo (``imagen_qr.url``) es inmutable; sin ella se revalida con el ETag.
+    """
+    if tokens.verificar(token) == tokens.FALSIFICADO or indice_tokens.buscar(token) is None:
+        raise Http404('QR no encontrado')
+
+    etag = imagen_qr.etag(token, formato)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(imagen_qr.imagen(token, formato), content_type=imagen_qr.TIPOS[formato])
+
+    response['ETag'] = etag
+    if request.GET.get('v') == imagen_qr.version():
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # El logo puede cambiar sin que cambie esta URL
+        response['Cache-Control'] = 'public, no-cache'
+    return response
 @csrf_exempt
 @require_POST
 @login_required
@@ -509,9 +840,9 @@ def marcar_asistencia_manual(request):
                         })
                     
                     # Marcar asistencia manualmente usando el método del modelo (que ya es thread-safe)
-                    dispositivo = f"Registro Manual - {request.user.username} - {timezone.now().strftime('%d/%m/%Y %H:%M:%S')}"
+                    dispositivo = f"Registro Manual - {request.user.username}"
                     
-                    if invitado.marcar_asistencia(dispositivo):
+                    if invitado.marcar_asistencia(dispositivo, usuario=request.user):
                         return JsonResponse({
                             'success': True,
                             'message': f'✅ Asistencia marcada para {invitado.nombre_completo}',
@@ -540,11 +871,10 @@ def marcar_asistencia_manual(request):
                             'message': f'{invitado.nombre_completo} no tiene asistencia marcada'
                         })
                     
-                    # Desmarcar asistencia de forma atómica
-                    invitado.asistio = False
-                    invitado.fecha_hora_entrada = None
-                    invitado.escaneado_por = f"Desmarcado por {request.user.username} - {timezone.now().strftime('%d/%m/%Y %H:%M:%S')}"
-                    invitado.save()
+                    # Desmarcar asistencia de forma atómica (queda en la bitácora de eventos)
+                    invitado.desmarcar_asistencia(
+                        f"Desmarcado por {request.user.username}", usuario=request.user
+                    )
                     
                     return JsonResponse({
                         'success': True,
@@ -2,6 +2,7 @@
 Django settings for evento_qr project - Docker version.
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'corsheaders', 
     'invitados',
 ]
@@ -40,6 +42,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'invitados.roles.RolMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,12 +69,14 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'invitados.context_processors.user_role_context',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'evento_qr.wsgi.application'
+ASGI_APPLICATION = 'evento_qr.asgi.application'
 
 # Database configuration for Docker
 DATABASES = {
@@ -124,6 +129,41 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caché compartida entre workers (índice de tokens QR, etc.)
+# Con REDIS_URL se usa Redis; si no, una caché en disco que comparten
+# todos los workers del mismo contenedor.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(tempfile.gettempdir(), 'evento_qr_cache'),
+        }
+    }
+
+# Capa de canales para los avisos en vivo (ver invitados/en_vivo.py)
+# Con REDIS_URL llegan a todos los workers; en memoria sólo dentro del mismo
+# proceso (desarrollo, pruebas o un nodo con WEB_WORKERS=1).
+if os.getenv('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('REDIS_URL')]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
 # URLs de autenticación
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
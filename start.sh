@@ -0,0 +1,15 @@
+#!/usr/bin/env sh
+set -o errexit
+
+python manage.py migrate
+python manage.py collectstatic --noinput
+
+# SERVIDOR=asgi (por defecto): uvicorn con vistas async para escaneo y estadísticas
+# SERVIDOR=wsgi: gunicorn síncrono como antes
+if [ "${SERVIDOR:-asgi}" = "wsgi" ]; then
+    echo "🚀 Iniciando gunicorn (WSGI)"
+    exec gunicorn --bind 0.0.0.0:8000 --workers "${WEB_WORKERS:-3}" --timeout 120 evento_qr.wsgi:application
+else
+    echo "🚀 Iniciando uvicorn (ASGI)"
+    exec uvicorn evento_qr.asgi:application --host 0.0.0.0 --port 8000 --workers "${WEB_WORKERS:-3}" --timeout-keep-alive 30 --lifespan off
+fi
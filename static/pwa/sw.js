@@ -1,21 +1,41 @@
-const CACHE_NAME = 'asistencia-qr-v1.0.0';
-const STATIC_CACHE_NAME = 'asistencia-qr-static-v1.0.0';
-const DYNAMIC_CACHE_NAME = 'asistencia-qr-dynamic-v1.0.0';
+const CACHE_NAME = 'asistencia-qr-v1.2.0';
+const STATIC_CACHE_NAME = 'asistencia-qr-static-v1.2.0';
+const DYNAMIC_CACHE_NAME = 'asistencia-qr-dynamic-v1.2.0';
+// Imágenes de los pases (/qr/<token>.png|svg?v=<estilo>): con la versión del estilo
+// en la URL son inmutables y sobreviven a los cambios de versión de la app
+const QR_CACHE_NAME = 'asistencia-qr-pases';
+const QR_IMAGEN_RE = /^\/qr\/[^/]+\.(png|svg)$/;
+const MAX_QR_CACHE = 500;
+// URLs versionadas (html5-qrcode@2.3.8) o con hash en el nombre: su contenido nunca cambia
+const INMUTABLE_RE = /@\d+\.\d+\.\d+\/|\.[0-9a-f]{12}\.\w+$/;
+const OFFLINE_URL = '/offline/';
+
+// Cola de escaneos sin conexión (IndexedDB + Background Sync)
+const SCAN_DB_NAME = 'asistencia-qr';
+const SCAN_STORE = 'escaneos-pendientes';
+const SYNC_TAG = 'sync-escaneos';
+const PROCESAR_QR_URL = '/procesar-qr/';
+const LOTE_URL = '/procesar-qr/lote/';
+const MAX_LOTE = 500;            // Igual que MAX_ESCANEOS_LOTE en el servidor
+const TIMEOUT_ESCANEO_MS = 4000; // Con Wi-Fi inestable no esperar más que esto
 
 // Archivos esenciales para cachear
 const STATIC_FILES = [
     '/',
     '/escaner/',
     '/panel/',
+    OFFLINE_URL,
     '/static/pwa/manifest.json',
     '/static/pwa/icon-192x192.png',
     '/static/pwa/icon-512x512.png',
     'https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js'
 ];
 
-// Archivos dinámicos que NO se deben cachear
+// Páginas que NO se guardan ni como respaldo sin conexión
 const EXCLUDE_FROM_CACHE = [
     '/admin/',
+    '/login/',
+    '/logout/',
     '/procesar-qr/',
     '/estadisticas/',
     '/exportar-csv/'
@@ -50,7 +70,8 @@ self.addEventListener('activate', event => {
             return Promise.all(
                 cacheNames.map(cacheName => {
                     if (cacheName !== STATIC_CACHE_NAME && 
-                        cacheName !== DYNAMIC_CACHE_NAME) {
+                        cacheName !== DYNAMIC_CACHE_NAME &&
+                        cacheName !== QR_CACHE_NAME) {
                         console.log('🗑️ Eliminando caché antigua:', cacheName);
                         return caches.delete(cacheName);
                     }
@@ -68,55 +89,74 @@ self.addEventListener('fetch', event => {
     const request = event.request;
     const url = new URL(request.url);
     
+    // Escaneos: red primero, cola local si no hay conexión
+    if (request.method === 'POST' && url.pathname === PROCESAR_QR_URL) {
+        event.respondWith(procesarEscaneo(request));
+        return;
+    }
+    
     // Solo manejar requests GET
     if (request.method !== 'GET') {
         return;
     }
     
-    // No cachear URLs excluidas
-    if (EXCLUDE_FROM_CACHE.some(exclude => url.pathname.startsWith(exclude))) {
+    // QR de los pases: la URL versionada nunca cambia de contenido, caché primero.
+    // Sin "v" se deja al navegador, que revalida con el ETag
+    if (QR_IMAGEN_RE.test(url.pathname) && url.searchParams.has('v')) {
+        event.respondWith(imagenQr(request));
         return;
     }
     
-    event.respondWith(
-        caches.match(request)
-            .then(response => {
-                // Si está en caché, devolverlo
-                if (response) {
-                    console.log('📦 Desde caché:', request.url);
-                    return response;
-                }
-                
-                // Si no está en caché, hacer fetch
-                return fetch(request)
-                    .then(response => {
-                        // Solo cachear respuestas exitosas
-                        if (!response || response.status !== 200 || response.type !== 'basic') {
-                            return response;
-                        }
-                        
-                        // Clonar respuesta para el caché
-                        const responseToCache = response.clone();
-                        
-                        // Cachear dinámicamente
-                        caches.open(DYNAMIC_CACHE_NAME)
-                            .then(cache => {
-                                cache.put(request, responseToCache);
-                                console.log('📦 Cacheado dinámicamente:', request.url);
-                            });
-                        
-                        return response;
-                    })
-                    .catch(() => {
-                        // Si falla la red, mostrar página offline para navegación
-                        if (request.destination === 'document') {
-                            return caches.match('/offline.html');
-                        }
-                    });
-            })
-    );
+    if (INMUTABLE_RE.test(url.pathname)) {
+        event.respondWith(cachePrimero(request));
+        return;
+    }
+    
+    // Páginas y archivos estáticos: red primero; la copia guardada sólo se usa
+    // sin conexión. JSON y demás respuestas dinámicas no pasan por el caché
+    // (una respuesta vieja de /llegadas/ o de la API congelaría el panel).
+    const esPagina = request.mode === 'navigate';
+    const esEstatico = url.origin === self.location.origin && url.pathname.startsWith('/static/');
+    if ((esPagina || esEstatico) && !EXCLUDE_FROM_CACHE.some(exclude => url.pathname.startsWith(exclude))) {
+        event.respondWith(redPrimero(request, esPagina));
+    }
 });
 
+async function cachePrimero(request) {
+    const enCache = await caches.match(request);
+    if (enCache) {
+        return enCache;
+    }
+    const response = await fetch(request);
+    if (response.ok) {
+        const cache = await caches.open(STATIC_CACHE_NAME);
+        await cache.put(request, response.clone());
+    }
+    return response;
+}
+
+async function redPrimero(request, esPagina) {
+    try {
+        const response = await fetch(request);
+        // Las redirecciones (p. ej. al login) no sirven como copia sin conexión
+        if (response.ok && response.type === 'basic' && !response.redirected) {
+            const cache = await caches.open(DYNAMIC_CACHE_NAME);
+            await cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const enCache = await caches.match(request);
+        if (enCache) {
+            console.log('📦 Sin conexión, desde caché:', request.url);
+            return enCache;
+        }
+        if (esPagina) {
+            return caches.match(OFFLINE_URL);
+        }
+        throw error;
+    }
+}
+
 // Manejo de mensajes
 self.addEventListener('message', event => {
     if (event.data && event.data.type === 'SKIP_WAITING') {
@@ -126,16 +166,180 @@ self.addEventListener('message', event => {
     if (event.data && event.data.type === 'GET_VERSION') {
         event.ports[0].postMessage({version: CACHE_NAME});
     }
+    
+    if (event.data && event.data.type === 'SINCRONIZAR_ESCANEOS') {
+        event.waitUntil(sincronizarEscaneos().catch(() => {}));
+    }
 });
 
 // Background sync para cuando se recupere la conexión
 self.addEventListener('sync', event => {
-    if (event.tag === 'background-sync') {
-        console.log('🔄 Background sync ejecutado');
-        // Aquí puedes sincronizar datos pendientes
+    if (event.tag === SYNC_TAG) {
+        console.log('🔄 Background sync: enviando escaneos pendientes');
+        event.waitUntil(sincronizarEscaneos());
     }
 });
 
+async function imagenQr(request) {
+    const cache = await caches.open(QR_CACHE_NAME);
+    const enCache = await cache.match(request);
+    if (enCache) {
+        return enCache;
+    }
+    
+    const response = await fetch(request);
+    if (response.ok) {
+        await cache.put(request, response.clone());
+        // Acotar la caché: keys() devuelve en orden de inserción
+        const llaves = await cache.keys();
+        await Promise.all(llaves.slice(0, Math.max(0, llaves.length - MAX_QR_CACHE)).map(llave => cache.delete(llave)));
+    }
+    return response;
+}
+
+// ===========================================
+// COLA DE ESCANEOS SIN CONEXIÓN
+// ===========================================
+
+function abrirDB() {
+    return new Promise((resolve, reject) => {
+        const req = indexedDB.open(SCAN_DB_NAME, 1);
+        req.onupgradeneeded = () => {
+            req.result.createObjectStore(SCAN_STORE, { keyPath: 'scan_id' });
+        };
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+    });
+}
+
+async function usarStore(modo, operacion) {
+    const db = await abrirDB();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(SCAN_STORE, modo);
+        const resultado = operacion(tx.objectStore(SCAN_STORE));
+        tx.oncomplete = () => resolve(resultado && resultado.result);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+function guardarEscaneo(escaneo) {
+    return usarStore('readwrite', store => store.put(escaneo));
+}
+
+function leerEscaneos() {
+    return usarStore('readonly', store => store.getAll());
+}
+
+function contarEscaneos() {
+    return usarStore('readonly', store => store.count());
+}
+
+function borrarEscaneos(scanIds) {
+    return usarStore('readwrite', store => {
+        scanIds.forEach(scanId => store.delete(scanId));
+    });
+}
+
+function respuestaJSON(data) {
+    return new Response(JSON.stringify(data), {
+        headers: { 'Content-Type': 'application/json' }
+    });
+}
+
+async function avisarClientes(mensaje) {
+    const clientes = await self.clients.matchAll({ includeUncontrolled: true });
+    clientes.forEach(cliente => cliente.postMessage(mensaje));
+}
+
+async function procesarEscaneo(request) {
+    const datos = await request.clone().json().catch(() => ({}));
+    const escaneo = {
+        scan_id: self.crypto.randomUUID(),
+        token_qr: datos.token_qr || '',
+        dispositivo: datos.dispositivo || 'Dispositivo desconocido',
+        scanned_at: Date.now()
+    };
+    
+    try {
+        const controller = new AbortController();
+        const timeout = setTimeout(() => controller.abort(), TIMEOUT_ESCANEO_MS);
+        // Mismo scan_id que en la cola: si el servidor alcanzó a registrarlo,
+        // el reenvío desde la cola recibe el mismo resultado en vez de "ya escaneado"
+        const response = await fetch(request.url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ...datos, scan_id: escaneo.scan_id }),
+            signal: controller.signal
+        });
+        clearTimeout(timeout);
+        
+        // Hay red: aprovechar para vaciar la cola si quedó algo pendiente
+        sincronizarEscaneos().catch(() => {});
+        return response;
+    } catch (error) {
+        // Sin conexión o red demasiado lenta: guardar y seguir escaneando
+        await guardarEscaneo(escaneo);
+        if (self.registration.sync) {
+            await self.registration.sync.register(SYNC_TAG).catch(() => {});
+        }
+        const pendientes = await contarEscaneos();
+        console.log('📥 Escaneo guardado sin conexión:', escaneo.scan_id);
+        
+        return respuestaJSON({
+            success: true,
+            offline: true,
+            pendientes: pendientes,
+            message: 'Sin conexión: escaneo guardado, se enviará al recuperar la red'
+        });
+    }
+}
+
+let sincronizacionEnCurso = null;
+
+function sincronizarEscaneos() {
+    // Una sola sincronización a la vez; las llamadas simultáneas comparten la misma
+    if (!sincronizacionEnCurso) {
+        sincronizacionEnCurso = enviarPendientes().finally(() => {
+            sincronizacionEnCurso = null;
+        });
+    }
+    return sincronizacionEnCurso;
+}
+
+async function enviarPendientes() {
+    const pendientes = await leerEscaneos();
+    let aceptados = 0;
+    
+    for (let i = 0; i < pendientes.length; i += MAX_LOTE) {
+        const lote = pendientes.slice(i, i + MAX_LOTE);
+        const response = await fetch(LOTE_URL, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ escaneos: lote })
+        });
+        
+        if (!response.ok) {
+            // Background Sync volverá a intentarlo; el scan_id evita duplicados
+            throw new Error(`Error al sincronizar escaneos: ${response.status}`);
+        }
+        
+        const data = await response.json();
+        aceptados += data.aceptados || 0;
+        await borrarEscaneos(lote.map(escaneo => escaneo.scan_id));
+    }
+    
+    if (pendientes.length > 0) {
+        console.log(`✅ ${pendientes.length} escaneos sincronizados (${aceptados} entradas nuevas)`);
+        await avisarClientes({
+            type: 'ESCANEOS_SINCRONIZADOS',
+            enviados: pendientes.length,
+            aceptados: aceptados
+        });
+    }
+}
+
 // Push notifications (para futuras mejoras)
 self.addEventListener('push', event => {
     if (event.data) {